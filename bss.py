@@ -1,13 +1,22 @@
 #!/usr/bin/env python2.7
 
 import argparse
+import os
+import sys
 import bss.builders
+import bss.dagcache
 import bss.dagsets
 import bss.gnuplot
+import bss.journal
+import bss.manifests
+import bss.nodelayouts
+import bss.plan
 import bss.report
+import bss.results
 import bss.run
 import bss.setups
 import bss.util
+import bss.workspaces
 
 def prepare_parser(parser, builders, dag_sets, setups):
     parser.add_argument(
@@ -27,13 +36,175 @@ def prepare_parser(parser, builders, dag_sets, setups):
         type=int,
     )
     parser.add_argument(
-        '--output-html',
-        default='bss.html',
-        dest='output_html_path',
-        help='Path to the output HTML file',
-        metavar='FILE',
+        '--target-relative-ci',
+        default=None,
+        dest='target_relative_ci',
+        help=(
+            'Instead of a fixed number of iterations, run '
+            'each test until the confidence interval of the '
+            'median time, relative to the median, is at '
+            'most FRACTION; warmup is detected '
+            'automatically'
+        ),
+        metavar='FRACTION',
+        type=float,
+    )
+    parser.add_argument(
+        '--confidence',
+        default=0.95,
+        dest='confidence',
+        help='Confidence level for --target-relative-ci',
+        metavar='FRACTION',
+        type=float,
+    )
+    parser.add_argument(
+        '--min-iterations',
+        default=5,
+        dest='min_iterations',
+        help=(
+            'Minimum number of measured runs of each test '
+            'with --target-relative-ci'
+        ),
+        metavar='COUNT',
+        type=int,
+    )
+    parser.add_argument(
+        '--max-iterations',
+        default=50,
+        dest='max_iterations',
+        help=(
+            'Maximum number of runs of each test with '
+            '--target-relative-ci or --time-budget'
+        ),
+        metavar='COUNT',
+        type=int,
+    )
+    parser.add_argument(
+        '--max-configuration-time',
+        default=float('inf'),
+        dest='max_configuration_time',
+        help=(
+            'Stop running a test after SECONDS with '
+            '--target-relative-ci'
+        ),
+        metavar='SECONDS',
+        type=float,
+    )
+    parser.add_argument(
+        '--time-budget',
+        default=None,
+        dest='time_budget',
+        help=(
+            'Probe every test, then choose iteration counts '
+            'to fit the sweep in SECONDS'
+        ),
+        metavar='SECONDS',
+        type=float,
+    )
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        dest='plan',
+        help=(
+            'Print the tests which would be run, with their '
+            'sizes and expected times, without running them'
+        ),
+    )
+    parser.add_argument(
+        '--jobs',
+        default=[1],
+        dest='jobs',
+        help=(
+            'Numbers of parallel jobs for builders to run '
+            "('nproc' for the processors available to each "
+            'worker)'
+        ),
+        metavar='JOBS',
+        nargs='+',
+        type=bss.run.parse_job_count,
+    )
+    parser.add_argument(
+        '--manifest-layouts',
+        default=[bss.manifests.single_file_layout],
+        dest='manifest_layouts',
+        help=(
+            'Numbers of files to split build manifests '
+            "across (joined with Make's and tup's include "
+            "or Ninja's subninja), and how to assign rules "
+            'to files: '
+            + ', '.join(bss.manifests.shardings)
+            + " (for example '1 8:level 64:hash'; tup "
+            'only supports level, and is skipped with '
+            'others)'
+        ),
+        metavar='COUNT[:SHARDING]',
+        nargs='+',
+        type=bss.manifests.parse_manifest_layout,
+    )
+    parser.add_argument(
+        '--node-layouts',
+        default=[bss.nodelayouts.flat_node_layout],
+        dest='node_layouts',
+        help=(
+            "Directories to place nodes in: 'flat' for all "
+            'in the workspace, or SCHEME:DEPTHxWIDTH for '
+            'DEPTH levels of WIDTH nested directories, '
+            "assigned to nodes by 'hash' or by a "
+            "depth-first walk of the DAG ('dag'); for "
+            "example 'flat hash:2x16 dag:3x8'.  tup only "
+            'supports flat, and is skipped with others'
+        ),
+        metavar='LAYOUT',
+        nargs='+',
+        type=bss.nodelayouts.parse_node_layout,
+    )
+    parser.add_argument(
+        '--workers',
+        default=1,
+        dest='workers',
+        help='Number of configurations to test in parallel',
+        metavar='COUNT',
+        type=int,
+    )
+    parser.add_argument(
+        '--reserved-processors',
+        default=0,
+        dest='reserved_processors',
+        help=(
+            'Number of processors to leave for the '
+            'coordinating process when using --workers'
+        ),
+        metavar='COUNT',
+        type=int,
+    )
+    parser.add_argument(
+        '--dag-cache-dir',
+        default=bss.dagcache.default_cache_dir(),
+        dest='dag_cache_dir',
+        help='Directory to keep compiled graph files in',
+        metavar='DIR',
+        type=str,
+    )
+    parser.add_argument(
+        '--workspace-template-dir',
+        default=bss.workspaces.default_template_dir(),
+        dest='workspace_template_dir',
+        help='Directory to keep generated workspaces in',
+        metavar='DIR',
         type=str,
     )
+    parser.add_argument(
+        '--workspace-template-size',
+        default=1024,
+        dest='workspace_template_size',
+        help=(
+            'Maximum size of --workspace-template-dir '
+            '(0 to disable workspace templates)'
+        ),
+        metavar='MEBIBYTES',
+        type=int,
+    )
+    prepare_output_parser(parser)
     for builder in builders:
         builder.prepare_parser(parser)
     for dag_set in dag_sets:
@@ -41,6 +212,58 @@ def prepare_parser(parser, builders, dag_sets, setups):
     for setup in setups:
         setup.prepare_parser(parser)
 
+def prepare_output_parser(parser):
+    parser.add_argument(
+        '--output-html',
+        default='bss.html',
+        dest='output_html_path',
+        help='Path to the output HTML file',
+        metavar='FILE',
+        type=str,
+    )
+    parser.add_argument(
+        '--journal',
+        default=None,
+        dest='journal_path',
+        help=(
+            'Append every measurement to FILE as soon as '
+            'its test finishes, and write the report from '
+            'all tests in FILE'
+        ),
+        metavar='FILE',
+        type=str,
+    )
+    parser.add_argument(
+        '--results-db',
+        default=None,
+        dest='results_db_path',
+        help=(
+            'Add every measurement to the SQLite database '
+            'FILE, for comparison with python -m '
+            'bss.compare'
+        ),
+        metavar='FILE',
+        type=str,
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        dest='resume',
+        help=(
+            'Skip tests already finished on this machine '
+            'according to --journal'
+        ),
+    )
+    parser.add_argument(
+        '--report-only',
+        action='store_true',
+        dest='report_only',
+        help=(
+            'Write the report from --journal without '
+            'running any tests'
+        ),
+    )
+
 def prepare_enabled_parser(
     parser,
     builders,
@@ -105,7 +328,10 @@ def prepare_enabled_parser(
         metavar='SCENARIO',
     )
 
-def main():
+def parse_arguments(argv):
+    '''
+    Returns (parser, args).
+    '''
     builders = bss.builders.all_builders
     dag_sets = bss.dagsets.all_dag_sets
     setups = bss.setups.all_setups
@@ -119,7 +345,7 @@ def main():
         dag_sets=dag_sets,
         setups=setups,
     )
-    (args, _) = parser.parse_known_args()
+    (args, _) = parser.parse_known_args(argv)
     builders = args.builders
     dag_sets = args.dag_sets
     setups = args.setups
@@ -139,18 +365,167 @@ def main():
         dag_sets=dag_sets,
         setups=setups,
     )
-    args = parser.parse_args()
+    return (parser, parser.parse_args(argv))
+
+def load_journal(path):
+    return bss.journal.load_journal(
+        path,
+        parse_arguments=lambda argv: parse_arguments(argv)[1],
+    )
+
+def write_report_from_journal(journal_path, output_html_path):
+    contents = load_journal(journal_path)
+    contents.args.output_html_path = output_html_path
+    bss.report.write_report(
+        args=contents.args,
+        information=contents.information,
+        runs=contents.runs,
+    )
+
+def main():
+    # --report-only needs none of the other options, so
+    # handle it first.
+    parser = argparse.ArgumentParser(add_help=False)
+    prepare_output_parser(parser)
+    (args, _) = parser.parse_known_args()
+    if args.report_only:
+        if args.journal_path is None:
+            parser.error('--report-only requires --journal')
+        write_report_from_journal(
+            journal_path=args.journal_path,
+            output_html_path=args.output_html_path,
+        )
+        return
+
+    (parser, args) = parse_arguments(sys.argv[1:])
     builders = args.builders
     dag_sets = args.dag_sets
     setups = args.setups
+    if args.resume and args.journal_path is None:
+        parser.error('--resume requires --journal')
+    if args.time_budget is not None \
+            and args.target_relative_ci is not None:
+        parser.error(
+            '--time-budget and --target-relative-ci are '
+            'mutually exclusive',
+        )
 
-    runs = list(bss.run.run_configurations(
-        args=args,
-        builders=builders,
-        dag_sets=dag_sets,
-        setups=setups,
-    ))
-    bss.report.write_report(args=args, runs=runs)
+    completed_keys = frozenset()
+    if args.resume and os.path.exists(args.journal_path):
+        completed_keys = frozenset(
+            bss.journal.completed_configuration_keys(
+                args.journal_path,
+                machine_fingerprint=bss.util
+                    .machine_fingerprint(
+                        bss.util.machine_information(),
+                    ),
+            ),
+        )
+
+    estimates = {}
+    if args.journal_path is not None \
+            and os.path.exists(args.journal_path) \
+            and (args.time_budget is not None or args.plan):
+        estimates = bss.plan.estimates_from_runs(
+            load_journal(args.journal_path).runs,
+        )
+    budget = args.time_budget
+    # Every phase (probing, planning, and measuring) shares
+    # each DAG, which is forgotten after the last phase
+    # releases it.
+    registry = bss.run.DAGRegistry()
+    if budget is not None and not args.plan:
+        # Budgets are allocated over every configuration, so
+        # DAGs are kept from probing until measuring.
+        configurations = list(bss.run.configurations(
+            args=args,
+            builders=builders,
+            dag_sets=dag_sets,
+            registry=registry,
+            setups=setups,
+            skipped_keys=completed_keys,
+            uses=3,
+        ))
+        start = bss.util.get_time()
+        estimates.update(bss.plan.probe_configurations(
+            args=args,
+            configurations=configurations,
+            registry=registry,
+            skipped_keys=frozenset(estimates),
+        ))
+        budget -= bss.util.get_time() - start
+    else:
+        configurations = bss.run.configurations(
+            args=args,
+            builders=builders,
+            dag_sets=dag_sets,
+            registry=registry,
+            setups=setups,
+            skipped_keys=completed_keys,
+        )
+    plans = None
+    if budget is not None or args.plan:
+        plans = bss.plan.plan_configurations(
+            args=args,
+            budget=budget,
+            configurations=configurations,
+            estimates=estimates,
+            registry=registry,
+        )
+        configurations = [plan.configuration for plan in plans]
+    if args.plan:
+        bss.plan.write_plan(
+            args=args,
+            output_file=sys.stdout,
+            plans=plans,
+        )
+        return
+
+    information = bss.report.system_information(builders)
+    journal = None
+    if args.journal_path is not None:
+        journal = bss.journal.JournalWriter(
+            args.journal_path,
+            information=information,
+        )
+    results = None
+    if args.results_db_path is not None:
+        results = bss.results.ResultsStore(
+            args.results_db_path,
+            information=information,
+        )
+    try:
+        runs = []
+        for run in bss.run.run_configurations(
+            args=args,
+            configurations=configurations,
+            iterations={
+                plan.configuration: plan.iterations
+                for plan in plans
+            } if plans is not None else None,
+            journal=journal,
+            registry=registry,
+        ):
+            runs.append(run)
+            if results is not None:
+                results.add_runs([run])
+    finally:
+        if journal is not None:
+            journal.close()
+        if results is not None:
+            results.close()
+    if journal is not None:
+        # Include tests measured by earlier invocations.
+        write_report_from_journal(
+            journal_path=args.journal_path,
+            output_html_path=args.output_html_path,
+        )
+    else:
+        bss.report.write_report(
+            args=args,
+            information=information,
+            runs=runs,
+        )
 
 if __name__ == '__main__':
     main()
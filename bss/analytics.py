@@ -0,0 +1,213 @@
+#!/usr/bin/env python2.7
+
+'''
+Structural analysis of DAGs.
+
+These statistics explain how much parallelism a DAG offers
+a builder: a full build can never run faster than its
+critical path allows, and wide levels are needed to keep
+many jobs busy.
+
+Analysis works on a DAG's compact form (see
+bss.dags.DAG.compact), so it runs over flat integer arrays
+rather than per-node Python objects.
+'''
+
+import array
+import bss.dags
+import collections
+import unittest
+
+# critical_path_length is the number of actions (non-leaf
+# nodes) on the longest dependency chain.  level_widths[i]
+# is the number of nodes whose longest path to a leaf has
+# length i; level 0 holds the leaves, which need no action.
+# The degree histograms map a degree to the number of nodes
+# with that degree.  redundant_edge_count is the number of
+# edges implied by other paths (and so removed by a
+# transitive reduction), or None if the DAG was too large
+# to check.  speedup_bound is work / critical_path_length,
+# the most a full build can gain from any number of jobs.
+DAGAnalytics = collections.namedtuple('DAGAnalytics', [
+    'critical_path_length',
+    'edge_count',
+    'in_degree_histogram',
+    'leaf_count',
+    'level_widths',
+    'node_count',
+    'out_degree_histogram',
+    'redundant_edge_count',
+    'root_count',
+    'speedup_bound',
+    'work',
+])
+
+# Reachability needs node_count bits per node at worst, so
+# give up on redundancy beyond this many nodes.
+default_max_reduction_nodes = 20000
+
+def level_widths(node_levels):
+    widths = []
+    for level in node_levels:
+        while len(widths) <= level:
+            widths.append(0)
+        widths[level] += 1
+    return widths
+
+def degree_histogram(degrees):
+    return dict(collections.Counter(degrees))
+
+def reachability(dag):
+    '''
+    Yields (node, children, reachable) for every node of the
+    CompactDAG dag, each node after its dependencies.
+    children is the set of node's dependencies, and
+    reachable the set of nodes reachable from them
+    (excluding the dependencies themselves, unless they are
+    reachable through another), both as integer bitsets.
+
+    A node's bitset is dropped once every node depending on
+    it has been visited.
+    '''
+    (offsets, targets) = dag.edge_arrays()
+    remaining_in_degrees = dag.in_degrees()
+    # node => bitset of nodes reachable from node,
+    # excluding node itself.
+    descendants = {}
+    for level in dag.levels():
+        for node in level:
+            children = 0
+            reachable = 0
+            for i in xrange(offsets[node - 1], offsets[node]):
+                child = targets[i]
+                children |= 1 << child
+                reachable |= descendants[child]
+                remaining_in_degrees[child - 1] -= 1
+                if not remaining_in_degrees[child - 1]:
+                    del descendants[child]
+            if remaining_in_degrees[node - 1]:
+                descendants[node] = children | reachable
+            yield (node, children, reachable)
+
+def redundant_edge_count(dag):
+    '''
+    Returns the number of edges (u, v) of the CompactDAG
+    dag where v is also reachable from u through another
+    of u's dependencies.
+    '''
+    return sum(
+        bin(children & reachable).count('1')
+        for (_, children, reachable) in reachability(dag)
+    )
+
+def analyze(
+    dag,
+    max_reduction_nodes=default_max_reduction_nodes,
+):
+    '''
+    Returns the DAGAnalytics of dag.
+    '''
+    compact = dag.compact()
+    node_levels = compact.node_levels()
+    widths = level_widths(node_levels)
+    # See bss.dags.DAG.work_and_span.
+    work = sum(widths[1:])
+    span = max(len(widths) - 1, 0)
+    node_count = len(node_levels)
+    if node_count <= max_reduction_nodes:
+        redundant = redundant_edge_count(compact)
+    else:
+        redundant = None
+    return DAGAnalytics(
+        critical_path_length=span,
+        edge_count=compact.edge_count(),
+        in_degree_histogram=degree_histogram(
+            compact.in_degrees(),
+        ),
+        leaf_count=len(compact.leaf_nodes()),
+        level_widths=widths,
+        node_count=node_count,
+        out_degree_histogram=degree_histogram(
+            compact.out_degrees(),
+        ),
+        redundant_edge_count=redundant,
+        root_count=len(compact.root_nodes()),
+        speedup_bound=float(work) / span if span else 1.0,
+        work=work,
+    )
+
+def _compact_dag_from_edges(node_count, edges):
+    edges = sorted(edges)
+    edge_offsets = array.array('I', [0]) * (node_count + 1)
+    for (from_node, _) in edges:
+        edge_offsets[from_node] += 1
+    for node in xrange(1, node_count + 1):
+        edge_offsets[node] += edge_offsets[node - 1]
+    return bss.dags.CompactDAG(
+        edge_offsets=edge_offsets,
+        edge_targets=array.array(
+            'I',
+            (to_node for (_, to_node) in edges),
+        ),
+    )
+
+class TestAnalyze(unittest.TestCase):
+    def test_linear(self):
+        analytics = analyze(bss.dags.LinearDAG(4))
+        self.assertEqual(analytics.critical_path_length, 3)
+        self.assertEqual(analytics.work, 3)
+        self.assertEqual(analytics.level_widths, [1, 1, 1, 1])
+        self.assertEqual(analytics.speedup_bound, 1)
+        self.assertEqual(analytics.redundant_edge_count, 0)
+        self.assertEqual(
+            analytics.in_degree_histogram,
+            {0: 1, 1: 3},
+        )
+
+    def test_uniform_fan_out(self):
+        analytics = analyze(
+            bss.dags.UniformFanOutDAG(depth=3, fan_out=2),
+        )
+        self.assertEqual(analytics.critical_path_length, 2)
+        self.assertEqual(analytics.work, 3)
+        self.assertEqual(analytics.level_widths, [4, 2, 1])
+        self.assertEqual(analytics.speedup_bound, 1.5)
+        self.assertEqual(
+            analytics.out_degree_histogram,
+            {0: 4, 2: 3},
+        )
+        self.assertEqual(analytics.root_count, 1)
+        self.assertEqual(analytics.leaf_count, 4)
+
+    def test_redundant_edges(self):
+        # 1 -> 2 -> 3 -> 4, plus shortcuts 1 -> 3, 1 -> 4,
+        # and 2 -> 4, all implied by the chain.
+        dag = _compact_dag_from_edges(4, [
+            (1, 2),
+            (2, 3),
+            (3, 4),
+            (1, 3),
+            (1, 4),
+            (2, 4),
+        ])
+        analytics = analyze(dag)
+        self.assertEqual(analytics.redundant_edge_count, 3)
+        self.assertEqual(analytics.critical_path_length, 3)
+        self.assertIsNone(
+            analyze(dag, max_reduction_nodes=3)
+                .redundant_edge_count,
+        )
+
+    def test_shared_dependency_is_not_redundant(self):
+        # Diamond: 1 -> 2 -> 4, 1 -> 3 -> 4.
+        dag = _compact_dag_from_edges(
+            4,
+            [(1, 2), (1, 3), (2, 4), (3, 4)],
+        )
+        analytics = analyze(dag)
+        self.assertEqual(analytics.redundant_edge_count, 0)
+        self.assertEqual(analytics.level_widths, [1, 2, 1])
+        self.assertEqual(analytics.speedup_bound, 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
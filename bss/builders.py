@@ -1,12 +1,38 @@
+import bss.manifests
 import bss.util
 import os
 import subprocess
 
 class Builder(object):
+    '''
+    A build system under test.
+
+    set_up writes the builder's manifests for a DAG into a
+    workspace, split across files according to a
+    bss.manifests.ManifestLayout.  Nodes are named by names
+    (see bss.nodelayouts.node_names).
+
+    build runs the build system on nodes with up to jobs
+    actions running in parallel, and returns the
+    bss.util.ResourceUsage of it and its actions.
+
+    supports_manifest_layout and supports_node_layout
+    return whether set_up accepts a ManifestLayout and a
+    bss.nodelayouts.NodeLayout.
+    '''
+
     @staticmethod
     def prepare_parser(arg_parser):
         pass
 
+    @staticmethod
+    def supports_manifest_layout(manifest_layout):
+        return True
+
+    @staticmethod
+    def supports_node_layout(node_layout):
+        return True
+
     @staticmethod
     def wait_for_stamp_update():
         pass
@@ -26,29 +52,29 @@ class GNUMakeBuilder(Builder):
         return os.path.join(temp_dir, 'GNUMakefile')
 
     @staticmethod
-    def set_up(temp_dir, dag, args):
-        makefile_path \
-            = GNUMakeBuilder.__makefile_path(temp_dir)
-        with open(makefile_path, 'w') as makefile:
-            for from_node in dag.all_nodes():
-                to_nodes = list(dag.nodes_from(from_node))
-                if not to_nodes:
-                    continue
-                makefile.write(
-                   '{}: {}\n\t@head -n1 $^ >$@\n'.format(
-                        from_node,
-                        ' '.join(map(str, to_nodes)),
-                    ),
-                )
-
-    @staticmethod
-    def build(temp_dir, nodes, args):
-        subprocess.check_call([
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        args,
+        manifest_layout=bss.manifests.single_file_layout,
+    ):
+        bss.manifests.write_manifest(
+            temp_dir,
+            dag=dag,
+            layout=manifest_layout,
+            manifest_format=bss.manifests.makefile_format,
+            names=names,
+        )
+
+    @staticmethod
+    def build(temp_dir, nodes, names, args, jobs=1):
+        return bss.util.check_call_with_resource_usage([
             'make',
-            '-j1',
+            '-j{}'.format(jobs),
             '-f',
             GNUMakeBuilder.__makefile_path(temp_dir),
-        ] + map(str, nodes), cwd=temp_dir)
+        ] + [names[node] for node in nodes], cwd=temp_dir)
 
     @staticmethod
     def wait_for_stamp_update():
@@ -69,30 +95,29 @@ class NinjaBuilder(Builder):
         return os.path.join(temp_dir, 'build.ninja')
 
     @staticmethod
-    def set_up(temp_dir, dag, args):
-        build_ninja_path \
-            = NinjaBuilder.__build_ninja_path(temp_dir)
-        with open(build_ninja_path, 'w') as ninja:
-            ninja.write('ninja_required_version = 1.0\n')
-            ninja.write(
-                'rule cp\n command = head -n1 $in >$out\n',
-            )
-            for from_node in dag.all_nodes():
-                to_nodes = list(dag.nodes_from(from_node))
-                if to_nodes:
-                    to_node_list \
-                        = ' '.join(map(str, to_nodes))
-                    ninja.write('build {}: cp {}\n'
-                        .format(from_node, to_node_list))
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        args,
+        manifest_layout=bss.manifests.single_file_layout,
+    ):
+        bss.manifests.write_manifest(
+            temp_dir,
+            dag=dag,
+            layout=manifest_layout,
+            manifest_format=bss.manifests.build_ninja_format,
+            names=names,
+        )
 
     @staticmethod
-    def build(temp_dir, nodes, args):
-        subprocess.check_call([
+    def build(temp_dir, nodes, names, args, jobs=1):
+        return bss.util.check_call_with_resource_usage([
             'ninja',
-            '-j1',
+            '-j{}'.format(jobs),
             '-f',
             NinjaBuilder.__build_ninja_path(temp_dir),
-        ] + map(str, nodes), cwd=temp_dir)
+        ] + [names[node] for node in nodes], cwd=temp_dir)
 
     @staticmethod
     def wait_for_stamp_update():
@@ -109,39 +134,50 @@ class TupBuilder(Builder):
         ).strip()
 
     @staticmethod
-    def set_up(temp_dir, dag, args):
+    def supports_manifest_layout(manifest_layout):
+        return bss.manifests.supports_layout(
+            bss.manifests.tupfile_format,
+            manifest_layout,
+        )
+
+    @staticmethod
+    def supports_node_layout(node_layout):
+        # tup rules can only create files in their
+        # Tupfile's directory.
+        return node_layout.scheme == 'flat'
+
+    @staticmethod
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        args,
+        manifest_layout=bss.manifests.single_file_layout,
+    ):
+        if any('/' in name for name in names):
+            raise Exception(
+                'tup rules can only create files in their '
+                "Tupfile's directory, so tup needs a flat "
+                'node layout',
+            )
         tupfile_ini_path \
             = os.path.join(temp_dir, 'Tupfile.ini')
         with open(tupfile_ini_path, 'w'):
             pass
 
-        tupfile_path = os.path.join(temp_dir, 'Tupfile')
-        with open(tupfile_path, 'w') as tupfile:
-            # Tup seems to require rules to be specified in
-            # topologically-sorted order.  That is, non-leaf
-            # nodes need the rule creating the node to
-            # preceed rules depending upon the node.
-            node_levels \
-                = dag.all_nodes_sorted_topologically()
-            for nodes in node_levels:
-                for from_node in nodes:
-                    to_nodes = dag.nodes_from(from_node)
-                    if not to_nodes:
-                        continue
-                    to_nodes_string \
-                        = ' '.join(map(str, to_nodes))
-                    tupfile.write(
-                        ': {} |> head -n1 %f >%o |> {}\n'
-                            .format(
-                                to_nodes_string,
-                                from_node,
-                            ),
-                    )
-
-    @staticmethod
-    def build(temp_dir, nodes, args):
-        subprocess.check_call(
-            ['tup', '-j1'] + map(str, nodes),
+        bss.manifests.write_manifest(
+            temp_dir,
+            dag=dag,
+            layout=manifest_layout,
+            manifest_format=bss.manifests.tupfile_format,
+            names=names,
+        )
+
+    @staticmethod
+    def build(temp_dir, nodes, names, args, jobs=1):
+        return bss.util.check_call_with_resource_usage(
+            ['tup', '-j{}'.format(jobs)]
+                + [names[node] for node in nodes],
             cwd=temp_dir,
         )
 
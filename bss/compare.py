@@ -0,0 +1,358 @@
+#!/usr/bin/env python2.7
+
+'''
+Compares two sets of runs from a bss.results store, flagging
+statistically significant slowdowns.
+
+For example, to check a Ninja upgrade:
+
+    python -m bss.compare results.db \
+        --baseline 'builder_version=1.7.*' \
+        --candidate 'builder_version=1.8.*'
+
+Runs are grouped by every key column not used in
+--baseline or --candidate (builder, DAG, setup, machine,
+...), and each group of baseline runs is compared with the
+matching group of candidate runs using a two-sided
+Mann-Whitney U test.  A group is flagged as a regression if
+the difference is significant and the candidate is
+slower by at least --min-effect (Cliff's delta).
+
+Exits with status 1 if any regression was found.
+'''
+
+import argparse
+import bss.results
+import bss.stats
+import collections
+import StringIO
+import sys
+import unittest
+
+Comparison = collections.namedtuple('Comparison', [
+    'baseline_median',
+    'candidate_median',
+    'cliffs_delta',
+    'group',
+    'p_value',
+    'regression',
+    'sample_counts',
+])
+
+def parse_filter(string):
+    (column, equals, pattern) = string.partition('=')
+    if not equals:
+        raise argparse.ArgumentTypeError(
+            'Expected COLUMN=PATTERN, got {}'.format(string),
+        )
+    if column not in bss.results.key_columns + ['session']:
+        raise argparse.ArgumentTypeError(
+            'Unknown column: {}'.format(column),
+        )
+    return (column, pattern)
+
+def group_values(rows, group_columns, metric):
+    '''
+    Returns a dict from group (a tuple of the values of
+    group_columns) to the metric values of its rows.
+    '''
+    groups = collections.defaultdict(list)
+    for row in rows:
+        group = tuple(
+            row[column]
+            for column in group_columns
+        )
+        groups[group].append(row[metric])
+    return groups
+
+def compare(
+    baseline_rows,
+    candidate_rows,
+    group_columns,
+    metric='measurement',
+    alpha=0.05,
+    min_effect=0.33,
+):
+    '''
+    Returns a Comparison for every group present in both
+    baseline_rows and candidate_rows.
+    '''
+    baseline_groups = group_values(
+        baseline_rows,
+        group_columns=group_columns,
+        metric=metric,
+    )
+    candidate_groups = group_values(
+        candidate_rows,
+        group_columns=group_columns,
+        metric=metric,
+    )
+    comparisons = []
+    for group in sorted(
+        set(baseline_groups) & set(candidate_groups),
+    ):
+        baseline = baseline_groups[group]
+        candidate = candidate_groups[group]
+        (_, p_value) = bss.stats.mann_whitney_u(
+            candidate,
+            baseline,
+        )
+        cliffs_delta = bss.stats.cliffs_delta(
+            candidate,
+            baseline,
+        )
+        comparisons.append(Comparison(
+            baseline_median=bss.stats.median(baseline),
+            candidate_median=bss.stats.median(candidate),
+            cliffs_delta=cliffs_delta,
+            group=group,
+            p_value=p_value,
+            regression=p_value < alpha
+                and cliffs_delta >= min_effect,
+            sample_counts=(len(baseline), len(candidate)),
+        ))
+    return comparisons
+
+def _abbreviate(column, value):
+    if column.endswith('_fingerprint'):
+        return value[:10]
+    # Builder versions can span several lines.
+    return value.split('\n')[0]
+
+def write_comparisons(
+    comparisons,
+    group_columns,
+    output_file,
+):
+    columns = list(group_columns) + [
+        'n',
+        'baseline',
+        'candidate',
+        'ratio',
+        'delta',
+        'p',
+        '',
+    ]
+    rows = []
+    for comparison in comparisons:
+        if comparison.baseline_median:
+            ratio = '{:.3f}'.format(
+                comparison.candidate_median
+                    / comparison.baseline_median,
+            )
+        else:
+            ratio = '-'
+        rows.append([
+            _abbreviate(column, value)
+            for (column, value)
+            in zip(group_columns, comparison.group)
+        ] + [
+            '{}/{}'.format(*comparison.sample_counts),
+            '{:.6g}'.format(comparison.baseline_median),
+            '{:.6g}'.format(comparison.candidate_median),
+            ratio,
+            '{:+.2f}'.format(comparison.cliffs_delta),
+            '{:.3g}'.format(comparison.p_value),
+            'REGRESSION' if comparison.regression else '',
+        ])
+    widths = [
+        max(len(row[i]) for row in [columns] + rows)
+        for i in xrange(len(columns))
+    ]
+    for row in [columns] + rows:
+        output_file.write('  '.join(
+            cell.ljust(width)
+            for (cell, width) in zip(row, widths)
+        ).rstrip() + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Flag slowdowns between two sets of '
+            'runs in a bss results database',
+    )
+    parser.add_argument(
+        'database_path',
+        help='Database written by bss.py --results-db',
+        metavar='DATABASE',
+    )
+    parser.add_argument(
+        '--baseline',
+        action='append',
+        default=[],
+        dest='baseline_filters',
+        help='Select baseline runs whose COLUMN matches '
+            'the glob PATTERN (repeatable)',
+        metavar='COLUMN=PATTERN',
+        type=parse_filter,
+    )
+    parser.add_argument(
+        '--candidate',
+        action='append',
+        default=[],
+        dest='candidate_filters',
+        help='Select candidate runs whose COLUMN matches '
+            'the glob PATTERN (repeatable)',
+        metavar='COLUMN=PATTERN',
+        type=parse_filter,
+    )
+    parser.add_argument(
+        '--metric',
+        choices=bss.results.metric_columns,
+        default='measurement',
+        dest='metric',
+        help='Run field to compare',
+    )
+    parser.add_argument(
+        '--alpha',
+        default=0.05,
+        dest='alpha',
+        help='Significance level of each comparison',
+        metavar='FRACTION',
+        type=float,
+    )
+    parser.add_argument(
+        '--min-effect',
+        default=0.33,
+        dest='min_effect',
+        help=(
+            "Minimum Cliff's delta of a regression "
+            '(0.147 is small, 0.33 medium, 0.474 large)'
+        ),
+        metavar='DELTA',
+        type=float,
+    )
+    args = parser.parse_args()
+    baseline_filters = dict(args.baseline_filters)
+    candidate_filters = dict(args.candidate_filters)
+    if baseline_filters == candidate_filters:
+        parser.error(
+            '--baseline and --candidate must select '
+            'different runs',
+        )
+    group_columns = [
+        column
+        for column in bss.results.key_columns
+        if column not in baseline_filters
+            and column not in candidate_filters
+    ]
+
+    store = bss.results.ResultsStore(args.database_path)
+    try:
+        comparisons = compare(
+            alpha=args.alpha,
+            baseline_rows=store.rows(baseline_filters),
+            candidate_rows=store.rows(candidate_filters),
+            group_columns=group_columns,
+            metric=args.metric,
+            min_effect=args.min_effect,
+        )
+    finally:
+        store.close()
+    if not comparisons:
+        sys.stderr.write(
+            'No groups of runs are in both the baseline '
+            'and the candidate\n',
+        )
+        sys.exit(2)
+    write_comparisons(
+        comparisons,
+        group_columns=group_columns,
+        output_file=sys.stdout,
+    )
+    if any(
+        comparison.regression
+        for comparison in comparisons
+    ):
+        sys.exit(1)
+
+class TestCompare(unittest.TestCase):
+    # Runs are grouped by setup, as if builder_version were
+    # used in --baseline and --candidate.
+    group_columns = ['builder', 'setup']
+
+    def rows(self, builder_version, setup, measurements):
+        return [
+            {
+                'builder': 'ninja',
+                'builder_version': builder_version,
+                'measurement': measurement,
+                'setup': setup,
+            }
+            for measurement in measurements
+        ]
+
+    def test_group_values(self):
+        rows = self.rows('1.7', 'clean', [1, 2]) \
+            + self.rows('1.8', 'clean', [3]) \
+            + self.rows('1.8', 'incremental', [4])
+        self.assertEqual(
+            group_values(
+                rows,
+                group_columns=self.group_columns,
+                metric='measurement',
+            ),
+            {
+                ('ninja', 'clean'): [1, 2, 3],
+                ('ninja', 'incremental'): [4],
+            },
+        )
+
+    def test_compare(self):
+        baseline_rows = self.rows('1.7', 'clean', range(10)) \
+            + self.rows('1.7', 'incremental', range(10)) \
+            + self.rows('1.7', 'no-op', range(10))
+        candidate_rows = \
+            self.rows('1.8', 'clean', range(20, 30)) \
+            + self.rows('1.8', 'incremental', range(10))
+        comparisons = compare(
+            baseline_rows=baseline_rows,
+            candidate_rows=candidate_rows,
+            group_columns=self.group_columns,
+        )
+        (clean, incremental) = comparisons
+        self.assertEqual(clean.group, ('ninja', 'clean'))
+        self.assertTrue(clean.regression)
+        self.assertEqual(clean.cliffs_delta, 1)
+        self.assertEqual(clean.baseline_median, 4.5)
+        self.assertEqual(clean.candidate_median, 24.5)
+        self.assertEqual(clean.sample_counts, (10, 10))
+        self.assertEqual(
+            incremental.group,
+            ('ninja', 'incremental'),
+        )
+        self.assertFalse(incremental.regression)
+        self.assertEqual(incremental.cliffs_delta, 0)
+
+        output = StringIO.StringIO()
+        write_comparisons(
+            comparisons,
+            group_columns=self.group_columns,
+            output_file=output,
+        )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            lines[0].split(),
+            self.group_columns + [
+                'n',
+                'baseline',
+                'candidate',
+                'ratio',
+                'delta',
+                'p',
+            ],
+        )
+        self.assertEqual(lines[1].split()[:7], [
+            'ninja',
+            'clean',
+            '10/10',
+            '4.5',
+            '24.5',
+            '5.444',
+            '+1.00',
+        ])
+        self.assertTrue(lines[1].endswith('REGRESSION'))
+        self.assertFalse(lines[2].endswith('REGRESSION'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+'''
+On-disk compiled form of parsed graph files.
+
+A compiled graph holds a node table and CSR (compressed
+sparse row) edge arrays.  Compiled graphs are keyed by the
+content hash of the file they were parsed from, and are
+read through mmap, so loading one does no parsing and
+processes loading the same graph share its pages.
+
+Nodes are numbered from 1 to node_count.
+'''
+
+import array
+import errno
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+_magic = 'BSSDAG\0\0'
+_version = 4
+_header = struct.Struct('<8sIIIIII40s')
+_integer = struct.Struct('<I')
+
+class MappedIntegers(object):
+    '''
+    Read-only sequence of unsigned 32-bit integers stored
+    in a buffer (such as an mmap) without copying them.
+    '''
+
+    def __init__(self, buffer, offset, length):
+        self.__buffer = buffer
+        self.__offset = offset
+        self.__length = length
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            (start, stop, step) \
+                = index.indices(self.__length)
+            if step != 1:
+                raise NotImplementedError()
+            count = max(0, stop - start)
+            return struct.unpack_from(
+                '<{}I'.format(count),
+                self.__buffer,
+                self.__offset + start * _integer.size,
+            )
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError(index)
+        return _integer.unpack_from(
+            self.__buffer,
+            self.__offset + index * _integer.size,
+        )[0]
+
+    def __iter__(self):
+        # Unpack in chunks to bound temporary tuples.
+        chunk_size = 64 * 1024
+        for start in xrange(0, self.__length, chunk_size):
+            for value in self[start:start + chunk_size]:
+                yield value
+
+class CompiledGraph(object):
+    '''
+    A compiled graph opened from disk.
+
+    edge_offsets has node_count + 1 entries; the nodes
+    node depends upon are
+    edge_targets[edge_offsets[node - 1]
+        :edge_offsets[node]].  reverse_edge_offsets and
+    reverse_edge_targets likewise list the nodes depending
+    upon each node.  fingerprint is the graph's
+    bss.dags.DAG.fingerprint, which would be slow to
+    recompute from the mapped arrays.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as compiled_file:
+            self.__mmap = mmap.mmap(
+                compiled_file.fileno(),
+                0,
+                access=mmap.ACCESS_READ,
+            )
+        self.path = path
+        (
+            magic,
+            version,
+            self.node_count,
+            self.edge_count,
+            root_count,
+            leaf_count,
+            label_size,
+            self.fingerprint,
+        ) = _header.unpack_from(self.__mmap, 0)
+        if magic != _magic or version != _version:
+            raise ValueError(
+                'Not a compiled graph: {}'.format(path),
+            )
+        offset = _header.size
+        def integers(length):
+            sequence = MappedIntegers(
+                self.__mmap,
+                offset,
+                length,
+            )
+            return (sequence, offset + length * _integer.size)
+        (self.edge_offsets, offset) \
+            = integers(self.node_count + 1)
+        (self.edge_targets, offset) \
+            = integers(self.edge_count)
+        (self.reverse_edge_offsets, offset) \
+            = integers(self.node_count + 1)
+        (self.reverse_edge_targets, offset) \
+            = integers(self.edge_count)
+        (self.root_nodes, offset) = integers(root_count)
+        (self.leaf_nodes, offset) = integers(leaf_count)
+        (self.__label_offsets, offset) \
+            = integers(self.node_count + 1)
+        self.__labels_offset = offset
+        if offset + label_size != len(self.__mmap):
+            raise ValueError(
+                'Truncated compiled graph: {}'.format(path),
+            )
+
+    def label(self, node):
+        start = self.__labels_offset \
+            + self.__label_offsets[node - 1]
+        end = self.__labels_offset \
+            + self.__label_offsets[node]
+        return self.__mmap[start:end]
+
+def _write_integers(output_file, integers):
+    values = array.array('I', integers)
+    assert values.itemsize == _integer.size
+    if sys.byteorder != 'little':
+        values.byteswap()
+    values.tofile(output_file)
+
+def write_compiled_graph(
+    path,
+    edge_offsets,
+    edge_targets,
+    fingerprint,
+    labels,
+    leaf_nodes,
+    reverse_edge_offsets,
+    reverse_edge_targets,
+    root_nodes,
+):
+    '''
+    Atomically writes a compiled graph to path.
+
+    labels is a sequence of strings, one per node, and
+    fingerprint the graph's bss.dags.DAG.fingerprint.
+    '''
+    node_count = len(edge_offsets) - 1
+    assert len(labels) == node_count
+    label_offsets = array.array('I', [0])
+    for label in labels:
+        label_offsets.append(label_offsets[-1] + len(label))
+    directory = os.path.dirname(path)
+    _make_directories(directory)
+    (fd, temp_path) = tempfile.mkstemp(
+        dir=directory,
+        prefix='.tmp',
+    )
+    try:
+        with os.fdopen(fd, 'wb') as output_file:
+            output_file.write(_header.pack(
+                _magic,
+                _version,
+                node_count,
+                len(edge_targets),
+                len(root_nodes),
+                len(leaf_nodes),
+                label_offsets[-1],
+                fingerprint,
+            ))
+            _write_integers(output_file, edge_offsets)
+            _write_integers(output_file, edge_targets)
+            _write_integers(
+                output_file,
+                reverse_edge_offsets,
+            )
+            _write_integers(
+                output_file,
+                reverse_edge_targets,
+            )
+            _write_integers(output_file, root_nodes)
+            _write_integers(output_file, leaf_nodes)
+            _write_integers(output_file, label_offsets)
+            for label in labels:
+                output_file.write(label)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+def load_compiled_graph(path):
+    '''
+    Opens the compiled graph at path, or returns None if
+    there is no valid compiled graph there.
+    '''
+    try:
+        return CompiledGraph(path)
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+def _make_directories(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def content_hash(path, cache_dir):
+    '''
+    Returns the SHA-1 of the file at path.
+
+    Hashes are remembered in cache_dir by path, size, and
+    modification time, so an unchanged file is only read
+    once.
+    '''
+    status = os.stat(path)
+    stat_key = hashlib.sha1('\0'.join([
+        os.path.realpath(path),
+        str(status.st_size),
+        repr(status.st_mtime),
+    ])).hexdigest()
+    stat_key_path = os.path.join(
+        cache_dir,
+        'sources',
+        stat_key,
+    )
+    try:
+        with open(stat_key_path, 'r') as stat_key_file:
+            return stat_key_file.read().strip()
+    except IOError:
+        pass
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source_file:
+        while True:
+            chunk = source_file.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    hash = digest.hexdigest()
+
+    _make_directories(os.path.dirname(stat_key_path))
+    (fd, temp_path) = tempfile.mkstemp(
+        dir=os.path.dirname(stat_key_path),
+        prefix='.tmp',
+    )
+    with os.fdopen(fd, 'w') as stat_key_file:
+        stat_key_file.write(hash + '\n')
+    os.rename(temp_path, stat_key_path)
+    return hash
+
+def compiled_graph_path(source_path, cache_dir):
+    return os.path.join(
+        cache_dir,
+        '{}-v{}.dag'.format(
+            content_hash(source_path, cache_dir=cache_dir),
+            _version,
+        ),
+    )
+
+def default_cache_dir():
+    return os.path.join(
+        os.environ.get(
+            'XDG_CACHE_HOME',
+            os.path.join(os.path.expanduser('~'), '.cache'),
+        ),
+        'bss',
+        'dags',
+    )
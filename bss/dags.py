@@ -1,8 +1,16 @@
 #!/usr/bin/env python2.7
 
+import array
+import bisect
+import bss.dagcache
+import bss.importers
 import collections
-import itertools
-import re
+import fractions
+import hashlib
+import math
+import os
+import pickle
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -65,9 +73,80 @@ class DAG(object):
         return True
 
     def nodes_to(self, node):
-        for test_node in frozenset(self.all_nodes()):
-            if node in self.nodes_from(test_node):
-                yield test_node
+        # Build an index of predecessors the first time
+        # we're asked, so each query is O(in-degree).
+        nodes_to = getattr(self, '_DAG__nodes_to', None)
+        if nodes_to is None:
+            nodes_to = collections.defaultdict(list)
+            for (from_node, to_node) in self.edges():
+                nodes_to[to_node].append(from_node)
+            nodes_to.default_factory = None
+            self.__nodes_to = nodes_to
+        return nodes_to.get(node, ())
+
+    def all_nodes_to(self, nodes):
+        '''
+        Returns the set of nodes which depend, directly or
+        indirectly, upon any of nodes.
+        '''
+        reached_nodes = set()
+        queue = list(nodes)
+        while queue:
+            node = queue.pop()
+            for from_node in self.nodes_to(node):
+                if from_node not in reached_nodes:
+                    reached_nodes.add(from_node)
+                    queue.append(from_node)
+        return reached_nodes
+
+    def edges(self):
+        '''
+        Yields every (from_node, to_node) pair.
+        '''
+        for from_node in self.all_nodes():
+            for to_node in self.nodes_from(from_node):
+                yield (from_node, to_node)
+
+    def edge_count(self):
+        return sum(1 for _ in self.edges())
+
+    def work_and_span(self):
+        '''
+        Returns (work, span), where work is the number of
+        build actions (non-leaf nodes) and span is the
+        number of actions on the longest dependency chain.
+
+        A full build with j jobs can be at most
+        min(j, work / span) times faster than with one job.
+        '''
+        levels = self.levels()
+        work = sum(len(nodes) for nodes in levels[1:])
+        span = max(len(levels) - 1, 0)
+        return (work, span)
+
+    def compact(self):
+        '''
+        Returns a CompactDAG equal to this DAG, giving access
+        to bulk accessors such as in_degrees and levels.
+        '''
+        return CompactDAG.from_dag(self)
+
+    def fingerprint(self):
+        '''
+        Returns a string identifying this DAG's structure.
+        Equal fingerprints imply equal DAGs.
+        '''
+        fingerprint = getattr(self, '_DAG__fingerprint', None)
+        if fingerprint is None:
+            digest = hashlib.sha1('edges')
+            for (from_node, to_node) in self.edges():
+                digest.update('{} {}\n'.format(
+                    from_node,
+                    to_node,
+                ))
+            fingerprint = digest.hexdigest()
+            self.__fingerprint = fingerprint
+        return fingerprint
 
     def dump(self, file=sys.stdout):
         file.write('Dump of {}:\n'.format(self))
@@ -97,139 +176,398 @@ class DAG(object):
                 if to_node not in visited_nodes:
                     queue.add(to_node)
 
-    def all_nodes_sorted_topologically(self):
-        # Algorithm borrowed from @ovgolovin:
-        # http://stackoverflow.com/a/15039202
-        # Licensed under CC BY-SA 3.0:
-        # http://creativecommons.org/licenses/by-sa/3.0/
-
-        levels_by_name = {}
-        names_by_level = collections.defaultdict(set)
-
-        def add_level_to_name(name, level):
-            levels_by_name[name] = level
-            names_by_level[level].add(name)
-
-        def walk_depth_first(name):
-            stack = [name]
-            while stack:
-                name = stack.pop()
-                if name in levels_by_name:
-                    continue
-
-                children = frozenset(self.nodes_from(name))
-                if not children:
-                    level = 0
-                    add_level_to_name(name, level)
-                    continue
-
-                children_not_calculated = [
-                    child for child in children
-                    if child not in levels_by_name
-                ]
-                if children_not_calculated:
-                    stack.append(name)
-                    stack.extend(children_not_calculated)
-                    continue
-
-                level = 1 + max(
-                    levels_by_name[lname]
-                    for lname in children
-                )
-                add_level_to_name(name, level)
+    def levels(self):
+        '''
+        Returns a list of arrays; the ith array holds, in
+        increasing order, the nodes whose longest path to a
+        leaf node has length i.
 
-        for name in self.all_nodes():
-            walk_depth_first(name)
+        Levels are computed once, over the DAG's compact
+        form (see CompactDAG.levels), and cached.
+        '''
+        levels = getattr(self, '_DAG__levels', None)
+        if levels is None:
+            levels = self.compact().levels()
+            self.__levels = levels
+        return levels
 
-        return list(itertools.takewhile(
-            lambda x: x is not None,
-            (
-                names_by_level.get(i, None)
-                for i in itertools.count()
-            )
-        ))
+    def all_nodes_sorted_topologically(self):
+        '''
+        Returns levels() as a list of sets: every node
+        appears after all nodes it depends upon.
+        '''
+        return [set(level) for level in self.levels()]
 
-class DotDAG(DAG):
+class CompactDAG(DAG):
     '''
-    DAG generated from a Graphviz DOT file.
+    DAG stored as CSR (compressed sparse row) integer
+    arrays.
+
+    Nodes are numbered from 1 to the node count.  The nodes
+    node depends upon are:
+
+    edge_targets[edge_offsets[node - 1]:edge_offsets[node]]
+
+    edge_offsets and edge_targets may be any integer
+    sequences supporting len, indexing, and slicing, such as
+    array.array or bss.dagcache.MappedIntegers.
     '''
-    __ignore_re = re.compile(
-        r'^(?:'
-         'digraph ninja \{'
-         '|\}'
-         '|rankdir=.*'
-         '|(?:node|edge) .*'
-         '|node .*'
-         ')$'
-    )
-    __node_re = re.compile(r'^\s*(\S+)(?:\s+\[.*\])?\s*$')
-    __edge_re = re.compile(
-        r'^\s*(\S+)\s+->\s+(\S+)(?:\s+\[.*\])?\s*$',
-    )
-
-    def __init__(self, dot_path):
-        current_node = [0]
-        def new_node():
-            current_node[0] += 1
-            return current_node[0]
-
-        node_string_nodes \
-            = collections.defaultdict(new_node)
-        edges_from = collections.defaultdict(set)
-        not_leaf_nodes = set()
-        not_root_nodes = set()
-
-        # This parser is hacky.  It only works well on
-        # Ninja-generated DOT files.
-        with file(dot_path, 'r') as dot_file:
-            for line in dot_file:
-                if DotDAG.__ignore_re.match(line):
-                    # Skip ignored lines.
-                    continue
-                match = DotDAG.__node_re.match(line)
-                if match:
-                    node = node_string_nodes[match.group(1)]
-                    edges_from[node]  # Tickle defaultdict.
-                    continue
-                match = DotDAG.__edge_re.match(line)
-                if match:
-                    to_node \
-                        = node_string_nodes[match.group(1)]
-                    from_node \
-                        = node_string_nodes[match.group(2)]
-                    edges_from[from_node].add(to_node)
-                    not_leaf_nodes.add(from_node)
-                    not_root_nodes.add(to_node)
-                    continue
-                raise Exception(
-                    'Parse error: {}'.format(line),
-                )
 
-        self.__all_nodes \
-            = frozenset(node_string_nodes.values())
-        self.__root_nodes \
-            = frozenset(self.__all_nodes - not_root_nodes)
-        self.__leaf_nodes \
-            = frozenset(self.__all_nodes - not_leaf_nodes)
-        self.__edges_from = {
-            from_node: frozenset(to_nodes)
-            for (from_node, to_nodes)
-            in edges_from.iteritems()
-        }
+    def __init__(
+        self,
+        edge_offsets,
+        edge_targets,
+        root_nodes=None,
+        leaf_nodes=None,
+        reverse_edge_offsets=None,
+        reverse_edge_targets=None,
+    ):
+        '''
+        root_nodes, leaf_nodes, and the reverse_edge_*
+        arrays (in the same form as the edge_* arrays, but
+        listing the nodes depending upon each node) are
+        computed when needed if not given.
+        '''
+        self.__edge_offsets = edge_offsets
+        self.__edge_targets = edge_targets
+        self.__root_nodes = root_nodes
+        self.__leaf_nodes = leaf_nodes
+        self.__reverse_edge_offsets = reverse_edge_offsets
+        self.__reverse_edge_targets = reverse_edge_targets
+        self.__levels = None
 
-        validate_dag(self)
+    @staticmethod
+    def from_dag(dag):
+        '''
+        Copies a DAG whose nodes are the integers from 1 to
+        its node count into a CompactDAG.
+        '''
+        node_count = len(dag.all_nodes())
+        edge_offsets = array.array('I', [0])
+        edge_targets = array.array('I')
+        for node in xrange(1, node_count + 1):
+            edge_targets.extend(dag.nodes_from(node))
+            edge_offsets.append(len(edge_targets))
+        return CompactDAG(
+            edge_offsets=edge_offsets,
+            edge_targets=edge_targets,
+        )
+
+    def __node_count(self):
+        return len(self.__edge_offsets) - 1
 
     def root_nodes(self):
+        if self.__root_nodes is None:
+            in_degrees = self.in_degrees()
+            self.__root_nodes = array.array('I', (
+                node for node in self.all_nodes()
+                if not in_degrees[node - 1]
+            ))
         return self.__root_nodes
 
     def leaf_nodes(self):
+        if self.__leaf_nodes is None:
+            out_degrees = self.out_degrees()
+            self.__leaf_nodes = array.array('I', (
+                node for node in self.all_nodes()
+                if not out_degrees[node - 1]
+            ))
         return self.__leaf_nodes
 
     def all_nodes(self):
-        return self.__all_nodes
+        return xrange(1, self.__node_count() + 1)
 
     def nodes_from(self, node):
-        return self.__edges_from[node]
+        return self.__edge_targets[
+            self.__edge_offsets[node - 1]
+                :self.__edge_offsets[node]
+        ]
+
+    def nodes_to(self, node):
+        (reverse_offsets, reverse_targets) \
+            = self.reverse_edge_arrays()
+        return reverse_targets[
+            reverse_offsets[node - 1]
+                :reverse_offsets[node]
+        ]
+
+    def all_nodes_to(self, nodes):
+        (reverse_offsets, reverse_targets) \
+            = self.reverse_edge_arrays()
+        reached = bytearray(self.__node_count() + 1)
+        reached_nodes = set()
+        queue = array.array('I', nodes)
+        for node in queue:
+            for i in xrange(
+                reverse_offsets[node - 1],
+                reverse_offsets[node],
+            ):
+                from_node = reverse_targets[i]
+                if not reached[from_node]:
+                    reached[from_node] = 1
+                    reached_nodes.add(from_node)
+                    queue.append(from_node)
+        return reached_nodes
+
+    def edge_count(self):
+        return len(self.__edge_targets)
+
+    def edge_arrays(self):
+        return (self.__edge_offsets, self.__edge_targets)
+
+    def compact(self):
+        return self
+
+    def edges(self):
+        '''
+        Yields every (from_node, to_node) pair, ordered by
+        from_node.
+        '''
+        edge_offsets = self.__edge_offsets
+        edge_targets = iter(self.__edge_targets)
+        for node in self.all_nodes():
+            for _ in xrange(
+                edge_offsets[node] - edge_offsets[node - 1],
+            ):
+                yield (node, next(edge_targets))
+
+    def out_degrees(self):
+        '''
+        Returns an array whose (node - 1)th item is the
+        number of nodes node depends upon.
+        '''
+        edge_offsets = self.__edge_offsets
+        return array.array('I', (
+            edge_offsets[i + 1] - edge_offsets[i]
+            for i in xrange(self.__node_count())
+        ))
+
+    def in_degrees(self):
+        '''
+        Returns an array whose (node - 1)th item is the
+        number of nodes depending upon node.
+        '''
+        in_degrees = array.array(
+            'I',
+            [0] * self.__node_count(),
+        )
+        for to_node in self.__edge_targets:
+            in_degrees[to_node - 1] += 1
+        return in_degrees
+
+    def reverse_edge_arrays(self):
+        '''
+        Returns CSR arrays (offsets, targets) of the nodes
+        depending upon each node.
+        '''
+        if self.__reverse_edge_offsets is None:
+            node_count = self.__node_count()
+            offsets = array.array('I', [0])
+            for in_degree in self.in_degrees():
+                offsets.append(offsets[-1] + in_degree)
+            targets = array.array('I', [0]) \
+                * len(self.__edge_targets)
+            cursors = offsets[:-1]
+            edge_offsets = self.__edge_offsets
+            edge_targets = self.__edge_targets
+            for from_node in xrange(1, node_count + 1):
+                for to_node in edge_targets[
+                    edge_offsets[from_node - 1]
+                        :edge_offsets[from_node]
+                ]:
+                    targets[cursors[to_node - 1]] = from_node
+                    cursors[to_node - 1] += 1
+            self.__reverse_edge_offsets = offsets
+            self.__reverse_edge_targets = targets
+        return (
+            self.__reverse_edge_offsets,
+            self.__reverse_edge_targets,
+        )
+
+    def levels(self):
+        '''
+        Returns a list of arrays; the ith array holds, in
+        increasing order, the nodes whose longest path to a
+        leaf node has length i.
+
+        Levels are found by Kahn's algorithm, peeling the
+        DAG from its leaves, and cached.
+        '''
+        if self.__levels is None:
+            self.__levels = self.__compute_levels()
+        return self.__levels
+
+    def __compute_levels(self):
+        (reverse_offsets, reverse_targets) \
+            = self.reverse_edge_arrays()
+        remaining_out_degrees = self.out_degrees()
+        levels = []
+        # A node joins the level after the last of the
+        # nodes it depends upon, so its level is its
+        # longest path to a leaf.
+        level = array.array('I', self.leaf_nodes())
+        while level:
+            levels.append(level)
+            next_level = array.array('I')
+            for node in level:
+                for from_node in reverse_targets[
+                    reverse_offsets[node - 1]
+                        :reverse_offsets[node]
+                ]:
+                    remaining_out_degrees[from_node - 1] -= 1
+                    if not remaining_out_degrees[from_node - 1]:
+                        next_level.append(from_node)
+            level = array.array('I', sorted(next_level))
+        return levels
+
+    def node_levels(self):
+        '''
+        Returns an array whose (node - 1)th item is the length
+        of the longest path from node to a leaf node.
+        '''
+        node_levels = array.array('I', [0]) \
+            * self.__node_count()
+        for (level, nodes) in enumerate(self.levels()):
+            for node in nodes:
+                node_levels[node - 1] = level
+        return node_levels
+
+class DotDAG(CompactDAG):
+    '''
+    DAG generated from a Graphviz DOT file, which may be
+    compressed (see bss.importers.open_graph_file).
+    '''
+
+    def __init__(self, dot_path, cache_dir=None):
+        '''
+        If cache_dir is given, the parsed graph is compiled
+        into cache_dir, and later DotDAGs for the same file
+        contents are loaded from there without parsing.
+        '''
+        self.__compiled_path = None
+        if cache_dir is None:
+            self.__parse(dot_path)
+            validate_dag(self)
+            return
+
+        compiled_path = bss.dagcache.compiled_graph_path(
+            dot_path,
+            cache_dir=cache_dir,
+        )
+        graph = bss.dagcache.load_compiled_graph(
+            compiled_path,
+        )
+        if graph is None:
+            self.__parse(dot_path)
+            validate_dag(self)
+            (edge_offsets, edge_targets) \
+                = self.edge_arrays()
+            (reverse_edge_offsets, reverse_edge_targets) \
+                = self.reverse_edge_arrays()
+            bss.dagcache.write_compiled_graph(
+                compiled_path,
+                edge_offsets=edge_offsets,
+                edge_targets=edge_targets,
+                fingerprint=CompactDAG.fingerprint(self),
+                labels=self.__labels,
+                leaf_nodes=self.leaf_nodes(),
+                reverse_edge_offsets=reverse_edge_offsets,
+                reverse_edge_targets=reverse_edge_targets,
+                root_nodes=self.root_nodes(),
+            )
+            graph = bss.dagcache.CompiledGraph(compiled_path)
+        self.__use_compiled_graph(graph)
+
+    def __use_compiled_graph(self, graph):
+        CompactDAG.__init__(
+            self,
+            edge_offsets=graph.edge_offsets,
+            edge_targets=graph.edge_targets,
+            leaf_nodes=graph.leaf_nodes,
+            reverse_edge_offsets=graph.reverse_edge_offsets,
+            reverse_edge_targets=graph.reverse_edge_targets,
+            root_nodes=graph.root_nodes,
+        )
+        self.__compiled_path = graph.path
+        self.__labels = None
+        self.__graph = graph
+
+    def __parse(self, dot_path):
+        graph = bss.importers.GraphBuilder()
+        with bss.importers.open_graph_file(dot_path) \
+                as dot_file:
+            bss.importers.read_dot(dot_file, graph)
+        (edge_offsets, edge_targets, labels) \
+            = graph.compact_graph()
+        CompactDAG.__init__(
+            self,
+            edge_offsets=edge_offsets,
+            edge_targets=edge_targets,
+        )
+        # Index predecessors now; nodes_to is used heavily
+        # by incremental setups.
+        self.reverse_edge_arrays()
+        self.__labels = labels
+        self.__graph = None
+
+    def __getstate__(self):
+        if self.__compiled_path is not None:
+            # Let the unpickling process map the compiled
+            # graph instead of copying it.
+            return {'compiled_path': self.__compiled_path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        compiled_path = state.get('compiled_path')
+        if compiled_path is None:
+            self.__dict__.update(state)
+        else:
+            self.__use_compiled_graph(
+                bss.dagcache.CompiledGraph(compiled_path),
+            )
+
+    def fingerprint(self):
+        if self.__graph is not None:
+            # Equal to the parsed graph's, so a DAG's
+            # fingerprint doesn't depend on caching.
+            return self.__graph.fingerprint
+        return CompactDAG.fingerprint(self)
+
+    def node_label(self, node):
+        '''
+        Returns the node's label attribute, or else its
+        (unquoted) ID, in the DOT file.
+        '''
+        if self.__graph is not None:
+            return self.__graph.label(node)
+        return self.__labels[node - 1]
+
+class NinjaDAG(CompactDAG):
+    '''
+    DAG of the build graph of a Ninja manifest (see
+    bss.importers.read_ninja).
+
+    Manifests may include others, so their graphs aren't
+    compiled into a cache.
+    '''
+
+    def __init__(self, ninja_path):
+        graph = bss.importers.GraphBuilder()
+        bss.importers.read_ninja(ninja_path, graph)
+        (edge_offsets, edge_targets, self.__labels) \
+            = graph.compact_graph()
+        CompactDAG.__init__(
+            self,
+            edge_offsets=edge_offsets,
+            edge_targets=edge_targets,
+        )
+        validate_dag(self)
+
+    def node_label(self, node):
+        '''
+        Returns the node's path.
+        '''
+        return self.__labels[node - 1]
 
 class LinearDAG(DAG):
     def __init__(self, depth):
@@ -244,13 +582,62 @@ class LinearDAG(DAG):
     def all_nodes(self):
         return xrange(1, self.__depth + 1)
 
+    def is_root(self, node):
+        return node == 1
+
+    def is_leaf(self, node):
+        return node == self.__depth
+
+    def node_depth(self, node):
+        '''
+        Returns the 1-based depth of node (1 for the root).
+        '''
+        return node
+
+    def parent(self, node):
+        '''
+        Returns the node depending upon node, or None if node
+        is the root.
+        '''
+        if node == 1:
+            return None
+        else:
+            return node - 1
+
     def nodes_from(self, node):
-        assert node in self.all_nodes()
+        assert 1 <= node <= self.__depth
         if node == self.__depth:
             return []
         else:
             return [node + 1]
 
+    def nodes_to(self, node):
+        if node == 1:
+            return []
+        else:
+            return [node - 1]
+
+    def edges(self):
+        for node in xrange(1, self.__depth):
+            yield (node, node + 1)
+
+    def edge_count(self):
+        return self.__depth - 1
+
+    def work_and_span(self):
+        return (self.__depth - 1, self.__depth - 1)
+
+    def levels(self):
+        return [
+            array.array('I', [node])
+            for node in xrange(self.__depth, 0, -1)
+        ]
+
+    def fingerprint(self):
+        return hashlib.sha1('LinearDAG({})'.format(
+            self.__depth,
+        )).hexdigest()
+
 class UniformFanOutDAG(DAG):
     '''
     UniformFanOutDAG(depth=4, fan_out=2) creates the
@@ -278,11 +665,17 @@ class UniformFanOutDAG(DAG):
     6 -> 13
     7 -> 14
     7 -> 15
+
+    All queries about a single node are answered
+    arithmetically in constant time.
     '''
 
     def __init__(self, depth, fan_out):
         self.__depth = depth
         self.__fan_out = fan_out
+        self.__node_count = self.__nodes_at_depth(depth)
+        self.__first_leaf \
+            = self.__nodes_at_depth(depth - 1) + 1
 
     def root_nodes(self):
         return [1]
@@ -302,22 +695,55 @@ class UniformFanOutDAG(DAG):
 
     def leaf_nodes(self):
         return xrange(
-            self.__nodes_at_depth(self.__depth - 1) + 1,
-            self.__nodes_at_depth(self.__depth) + 1,
+            self.__first_leaf,
+            self.__node_count + 1,
         )
 
     def all_nodes(self):
-        return xrange(
-            1,
-            self.__nodes_at_depth(self.__depth) + 1,
-        )
+        return xrange(1, self.__node_count + 1)
+
+    def is_root(self, node):
+        return node == 1
+
+    def is_leaf(self, node):
+        return node >= self.__first_leaf
+
+    def node_depth(self, node):
+        '''
+        Returns the 1-based depth of node (1 for the root).
+        '''
+        fan_out = self.__fan_out
+        if fan_out == 1:
+            return node
+        # node is at depth d iff
+        # node_count(d - 1) < node <= node_count(d).
+        depth = int(math.ceil(
+            math.log(node * (fan_out - 1) + 1)
+                / math.log(fan_out)
+        ))
+        # Correct floating point error.
+        while self.__nodes_at_depth(depth) < node:
+            depth += 1
+        while self.__nodes_at_depth(depth - 1) >= node:
+            depth -= 1
+        return depth
+
+    def parent(self, node):
+        '''
+        Returns the node depending upon node, or None if node
+        is the root.
+        '''
+        if node == 1:
+            return None
+        else:
+            return (node - 2) // self.__fan_out + 1
 
     def __first_child(self, node):
         return node * self.__fan_out - self.__fan_out + 2
 
     def nodes_from(self, node):
-        assert node in self.all_nodes()
-        if node in self.leaf_nodes():
+        assert 1 <= node <= self.__node_count
+        if self.is_leaf(node):
             return []
         else:
             return xrange(
@@ -325,6 +751,577 @@ class UniformFanOutDAG(DAG):
                 self.__first_child(node + 1),
             )
 
+    def nodes_to(self, node):
+        if node == 1:
+            return []
+        else:
+            return [self.parent(node)]
+
+    def edges(self):
+        '''
+        Yields every (from_node, to_node) pair without
+        materializing the graph.
+        '''
+        # Every non-root node has exactly one parent, and
+        # children are numbered in order of their parents.
+        fan_out = self.__fan_out
+        for to_node in xrange(2, self.__node_count + 1):
+            yield ((to_node - 2) // fan_out + 1, to_node)
+
+    def edge_count(self):
+        return self.__node_count - 1
+
+    def work_and_span(self):
+        return (self.__first_leaf - 1, self.__depth - 1)
+
+    def levels(self):
+        # Every leaf is at the greatest depth, so levels are
+        # depths in reverse.
+        return [
+            array.array('I', xrange(
+                self.__nodes_at_depth(depth - 1) + 1,
+                self.__nodes_at_depth(depth) + 1,
+            ))
+            for depth in xrange(self.__depth, 0, -1)
+        ]
+
+    def fingerprint(self):
+        return hashlib.sha1('UniformFanOutDAG({}, {})'.format(
+            self.__depth,
+            self.__fan_out,
+        )).hexdigest()
+
+_mask64 = (1 << 64) - 1
+_golden64 = 0x9e3779b97f4a7c15
+
+def _node_uniforms(seed, node):
+    '''
+    Yields an endless stream of floats in [0, 1) determined
+    by seed and node.
+
+    Each node has its own stream (a SplitMix64 sequence), so
+    a node's random choices don't depend on the order in
+    which nodes are visited.
+    '''
+    state = (seed * _golden64 + node) * _golden64 & _mask64
+    while True:
+        state = (state + _golden64) & _mask64
+        x = state
+        x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9 & _mask64
+        x = (x ^ (x >> 27)) * 0x94d049bb133111eb & _mask64
+        x ^= x >> 31
+        yield (x >> 11) * (1.0 / (1 << 53))
+
+class PowerLawDAG(DAG):
+    '''
+    Seeded random DAG shaped like a real build graph: most
+    nodes have few dependencies, but a few (such as
+    libraries) depend upon many nodes, and a few (such as
+    common headers) are depended upon by many nodes.
+
+    Nodes are split into layer_count layers whose widths
+    grow by layer_growth.  Layer 0 holds every root and the
+    last layer holds every leaf.  Each node depends upon a
+    contiguous run of the next layer (its spine), so every
+    node is reachable from a root, plus a random number of
+    nodes in deeper layers.  The number of extra
+    dependencies follows a power law with exponent
+    fan_out_exponent, and the chance of a node being chosen
+    follows a power law in its distance from the last node,
+    giving in-degrees with exponent fan_in_exponent.
+
+    edge_count is the expected number of edges; random
+    dependencies which coincide are merged, so a DAG may
+    have slightly fewer.
+
+    Nothing is materialized: a node's dependencies are
+    generated from its own random stream when asked for, in
+    time proportional to their number.
+    '''
+
+    def __init__(
+        self,
+        node_count,
+        edge_count,
+        fan_in_exponent=2.5,
+        fan_out_exponent=2.5,
+        layer_count=8,
+        layer_growth=2.0,
+        seed=0,
+    ):
+        if node_count < 1:
+            raise Exception('PowerLawDAG needs a node')
+        if fan_in_exponent <= 1:
+            raise Exception('fan_in_exponent must exceed 1')
+        if fan_out_exponent <= 2:
+            # The mean out-degree would be infinite.
+            raise Exception('fan_out_exponent must exceed 2')
+        layer_count = max(1, min(layer_count, node_count))
+        self.__node_count = node_count
+        self.__edge_count = edge_count
+        self.__fan_in_exponent = float(fan_in_exponent)
+        self.__fan_out_exponent = float(fan_out_exponent)
+        self.__layer_count = layer_count
+        self.__layer_growth = float(layer_growth)
+        self.__seed = seed
+
+        # layer_starts[k] is the number of nodes before
+        # layer k.  Every layer has at least one node.
+        spare_nodes = node_count - layer_count
+        def start(k):
+            if layer_growth == 1:
+                fraction = float(k) / layer_count
+            else:
+                fraction = (layer_growth ** k - 1) \
+                    / (layer_growth ** layer_count - 1)
+            return k + int(round(spare_nodes * fraction))
+        self.__layer_starts = [
+            start(k)
+            for k in xrange(layer_count + 1)
+        ]
+
+        widths = [
+            end - start
+            for (start, end) in zip(
+                self.__layer_starts,
+                self.__layer_starts[1:],
+            )
+        ]
+        # Spine edges between layers of widths a and b
+        # number a + b - gcd(a, b); see __spine.
+        spine_edge_count = sum(
+            a + b - fractions.gcd(a, b)
+            for (a, b) in zip(widths, widths[1:])
+        )
+        non_leaf_count = node_count - widths[-1]
+        if non_leaf_count:
+            self.__mean_extra_degree = max(
+                edge_count - spine_edge_count,
+                0,
+            ) / float(non_leaf_count)
+        else:
+            self.__mean_extra_degree = 0.0
+
+    def __layer(self, node):
+        return bisect.bisect_right(
+            self.__layer_starts,
+            node - 1,
+        ) - 1
+
+    def __spine(self, node, layer):
+        # Node i (0-based) of a layer of width a depends
+        # upon nodes floor(i * b / a) through
+        # ceil((i + 1) * b / a) - 1 of the next layer, of
+        # width b.  Every node of the next layer is thereby
+        # depended upon, and every node has a dependency.
+        starts = self.__layer_starts
+        a = starts[layer + 1] - starts[layer]
+        b = starts[layer + 2] - starts[layer + 1]
+        i = node - 1 - starts[layer]
+        return xrange(
+            starts[layer + 1] + 1 + i * b // a,
+            starts[layer + 1] + 1 + -(-(i + 1) * b // a),
+        )
+
+    def root_nodes(self):
+        return xrange(1, self.__layer_starts[1] + 1)
+
+    def leaf_nodes(self):
+        return xrange(
+            self.__layer_starts[-2] + 1,
+            self.__node_count + 1,
+        )
+
+    def all_nodes(self):
+        return xrange(1, self.__node_count + 1)
+
+    def nodes_from(self, node):
+        assert 1 <= node <= self.__node_count
+        layer = self.__layer(node)
+        if layer == self.__layer_count - 1:
+            return []
+        spine = self.__spine(node, layer)
+
+        uniforms = _node_uniforms(self.__seed, node)
+        # Pareto-distributed extra out-degree, scaled to the
+        # wanted mean and rounded stochastically to keep it.
+        alpha = self.__fan_out_exponent - 1
+        scale = self.__mean_extra_degree * (alpha - 1) / alpha
+        extra_degree = int(
+            scale * (1 - next(uniforms)) ** (-1 / alpha)
+                + next(uniforms),
+        )
+        # Spine edges link each layer to the next, which
+        # keeps every leaf in the last layer.  Choose extra
+        # dependencies among every node in the layers after
+        # node's, favouring nodes close to the last by a
+        # power law in rank (by inverse transform sampling).
+        candidate_count = self.__node_count \
+            - self.__layer_starts[layer + 1]
+        extra_degree = min(extra_degree, candidate_count)
+        if not extra_degree:
+            return spine
+        s = 1 / (self.__fan_in_exponent - 1)
+        to_nodes = set(spine)
+        for _ in xrange(extra_degree):
+            u = next(uniforms)
+            if s == 1:
+                rank = (candidate_count + 1) ** u
+            else:
+                rank = (1 + u * (
+                    (candidate_count + 1) ** (1 - s) - 1
+                )) ** (1 / (1 - s))
+            rank = min(int(rank), candidate_count)
+            to_nodes.add(self.__node_count + 1 - rank)
+        return sorted(to_nodes)
+
+    def edge_count(self):
+        edge_count = getattr(
+            self,
+            '_PowerLawDAG__actual_edge_count',
+            None,
+        )
+        if edge_count is None:
+            edge_count = sum(
+                len(self.nodes_from(node))
+                for node in self.all_nodes()
+            )
+            self.__actual_edge_count = edge_count
+        return edge_count
+
+    def fingerprint(self):
+        return hashlib.sha1(
+            'PowerLawDAG({}, {}, {}, {}, {}, {}, {})'.format(
+                self.__node_count,
+                self.__edge_count,
+                self.__fan_in_exponent,
+                self.__fan_out_exponent,
+                self.__layer_count,
+                self.__layer_growth,
+                self.__seed,
+            ),
+        ).hexdigest()
+
+class FanInDAG(DAG):
+    '''
+    FanInDAG(width=3) creates the following DAG, in which
+    width nodes share one dependency:
+
+    1 -> 2
+    1 -> 3
+    1 -> 4
+    2 -> 5
+    3 -> 5
+    4 -> 5
+    '''
+
+    def __init__(self, width):
+        assert width >= 1
+        self.__width = width
+
+    def __shared_node(self):
+        return self.__width + 2
+
+    def root_nodes(self):
+        return [1]
+
+    def leaf_nodes(self):
+        return [self.__shared_node()]
+
+    def all_nodes(self):
+        return xrange(1, self.__shared_node() + 1)
+
+    def nodes_from(self, node):
+        assert 1 <= node <= self.__shared_node()
+        if node == 1:
+            return xrange(2, self.__shared_node())
+        elif node == self.__shared_node():
+            return []
+        else:
+            return [self.__shared_node()]
+
+    def nodes_to(self, node):
+        if node == 1:
+            return []
+        elif node == self.__shared_node():
+            return xrange(2, self.__shared_node())
+        else:
+            return [1]
+
+    def edge_count(self):
+        return self.__width * 2
+
+    def work_and_span(self):
+        return (self.__width + 1, 2)
+
+    def fingerprint(self):
+        return hashlib.sha1('FanInDAG({})'.format(
+            self.__width,
+        )).hexdigest()
+
+class DiamondDAG(DAG):
+    '''
+    DiamondDAG(count=2, width=2) creates the following DAG,
+    a chain of count diamonds each with width nodes across:
+
+    1 -> 2
+    1 -> 3
+    2 -> 4
+    3 -> 4
+    4 -> 5
+    4 -> 6
+    5 -> 7
+    6 -> 7
+    '''
+
+    def __init__(self, count, width=2):
+        assert width >= 1
+        self.__count = count
+        self.__width = width
+
+    def __node_count(self):
+        return self.__count * (self.__width + 1) + 1
+
+    def __is_joint(self, node):
+        # Joints are the nodes at the tips of diamonds.
+        return (node - 1) % (self.__width + 1) == 0
+
+    def root_nodes(self):
+        return [1]
+
+    def leaf_nodes(self):
+        return [self.__node_count()]
+
+    def all_nodes(self):
+        return xrange(1, self.__node_count() + 1)
+
+    def nodes_from(self, node):
+        assert 1 <= node <= self.__node_count()
+        if node == self.__node_count():
+            return []
+        elif self.__is_joint(node):
+            return xrange(node + 1, node + self.__width + 1)
+        else:
+            # The next joint.
+            width = self.__width + 1
+            return [(node - 1) // width * width + width + 1]
+
+    def nodes_to(self, node):
+        if node == 1:
+            return []
+        elif self.__is_joint(node):
+            return xrange(node - self.__width, node)
+        else:
+            # The previous joint.
+            width = self.__width + 1
+            return [(node - 1) // width * width + 1]
+
+    def edge_count(self):
+        return self.__count * self.__width * 2
+
+    def work_and_span(self):
+        return (self.__node_count() - 1, self.__count * 2)
+
+    def fingerprint(self):
+        return hashlib.sha1('DiamondDAG({}, {})'.format(
+            self.__count,
+            self.__width,
+        )).hexdigest()
+
+class GridDAG(DAG):
+    '''
+    GridDAG(rows=2, columns=3) creates the following DAG, a
+    lattice where each node depends upon its neighbours to
+    the right and below:
+
+    1 -> 2 -> 3
+    |    |    |
+    v    v    v
+    4 -> 5 -> 6
+
+    Every node has many paths to the single leaf.
+    '''
+
+    def __init__(self, rows, columns):
+        assert rows >= 1 and columns >= 1
+        self.__rows = rows
+        self.__columns = columns
+
+    def __node_count(self):
+        return self.__rows * self.__columns
+
+    def root_nodes(self):
+        return [1]
+
+    def leaf_nodes(self):
+        return [self.__node_count()]
+
+    def all_nodes(self):
+        return xrange(1, self.__node_count() + 1)
+
+    def nodes_from(self, node):
+        assert 1 <= node <= self.__node_count()
+        nodes = []
+        if node % self.__columns:
+            nodes.append(node + 1)
+        if node + self.__columns <= self.__node_count():
+            nodes.append(node + self.__columns)
+        return nodes
+
+    def nodes_to(self, node):
+        nodes = []
+        if node > self.__columns:
+            nodes.append(node - self.__columns)
+        if (node - 1) % self.__columns:
+            nodes.append(node - 1)
+        return nodes
+
+    def edge_count(self):
+        return self.__rows * (self.__columns - 1) \
+            + self.__columns * (self.__rows - 1)
+
+    def work_and_span(self):
+        return (
+            self.__node_count() - 1,
+            self.__rows + self.__columns - 2,
+        )
+
+    def fingerprint(self):
+        return hashlib.sha1('GridDAG({}, {})'.format(
+            self.__rows,
+            self.__columns,
+        )).hexdigest()
+
+class HeaderPyramidDAG(DAG):
+    '''
+    DAG shaped like a C or C++ program: a binary (node 1)
+    depends upon source_count objects, each of which
+    depends upon its own source file and upon headers.
+
+    Headers form a pyramid of layers, each half as wide as
+    the one above, ending in one header included by
+    everything.  Each object or header depends upon two
+    neighbouring headers of the next layer, so neighbours
+    share dependencies and paths reconverge.
+
+    HeaderPyramidDAG(source_count=4) creates:
+
+    1 -> 2, 3, 4, 5     # binary -> objects
+    2 -> 6, 10, 11      # object -> source, headers
+    3 -> 7, 10, 11
+    4 -> 8, 11
+    5 -> 9, 11
+    10 -> 12            # header -> header
+    11 -> 12
+    '''
+
+    def __init__(self, source_count):
+        assert source_count >= 1
+        self.__source_count = source_count
+        # layer_starts[l] is the first node of layer l.
+        # Layer 0 holds the objects, followed by their
+        # sources; later layers hold headers.
+        widths = [source_count]
+        while len(widths) == 1 or widths[-1] > 1:
+            widths.append((widths[-1] + 1) // 2)
+        self.__layer_starts = [2, 2 + source_count * 2]
+        for width in widths[1:]:
+            self.__layer_starts.append(
+                self.__layer_starts[-1] + width,
+            )
+        self.__widths = widths
+        # Each layer of width a depends upon a layer of
+        # width b with a + 2 * b - 2 edges; see nodes_from.
+        self.__edge_count = source_count * 2 + sum(
+            a + 2 * b - 2
+            for (a, b) in zip(widths, widths[1:])
+        )
+
+    def __node_count(self):
+        return self.__layer_starts[-1] - 1
+
+    def __layer(self, node):
+        # Sources are counted in layer 0.
+        return bisect.bisect_right(
+            self.__layer_starts,
+            node,
+        ) - 1
+
+    def __layer_node(self, layer, index):
+        return self.__layer_starts[layer] + index
+
+    def __layer_index(self, layer, node):
+        return node - self.__layer_starts[layer]
+
+    def __is_source(self, node):
+        return self.__source_count + 2 <= node \
+            < self.__layer_starts[1]
+
+    def root_nodes(self):
+        return [1]
+
+    def leaf_nodes(self):
+        return range(
+            self.__source_count + 2,
+            self.__layer_starts[1],
+        ) + [self.__node_count()]
+
+    def all_nodes(self):
+        return xrange(1, self.__node_count() + 1)
+
+    def nodes_from(self, node):
+        assert 1 <= node <= self.__node_count()
+        if node == 1:
+            return xrange(2, self.__source_count + 2)
+        if self.__is_source(node):
+            return []
+        layer = self.__layer(node)
+        if layer == len(self.__widths) - 1:
+            return []
+        # Index i depends upon indices i // 2 and
+        # i // 2 + 1 of the next layer, if the latter
+        # exists.
+        i = self.__layer_index(layer, node)
+        headers = xrange(
+            self.__layer_node(layer + 1, i // 2),
+            self.__layer_node(
+                layer + 1,
+                min(i // 2 + 2, self.__widths[layer + 1]),
+            ),
+        )
+        if layer == 0:
+            return [node + self.__source_count] \
+                + list(headers)
+        return headers
+
+    def nodes_to(self, node):
+        if node == 1:
+            return []
+        if self.__is_source(node):
+            return [node - self.__source_count]
+        layer = self.__layer(node)
+        if layer == 0:
+            return [1]
+        # Index k is depended upon by indices 2k - 2
+        # through 2k + 1 of the previous layer, if they
+        # exist (see nodes_from).
+        k = self.__layer_index(layer, node)
+        return xrange(
+            self.__layer_node(layer - 1, max(2 * k - 2, 0)),
+            self.__layer_node(
+                layer - 1,
+                min(2 * k + 2, self.__widths[layer - 1]),
+            ),
+        )
+
+    def edge_count(self):
+        return self.__edge_count
+
+    def fingerprint(self):
+        return hashlib.sha1('HeaderPyramidDAG({})'.format(
+            self.__source_count,
+        )).hexdigest()
+
 class TestUniformFanOutDAG(unittest.TestCase):
     def test_fan_out1_equals_linear(self):
         for depth in xrange(1, 10):
@@ -429,6 +1426,442 @@ class TestUniformFanOutDAG(unittest.TestCase):
         self.assertItemsEqual(dag.nodes_from(13), [])
         validate_dag(dag)
 
+class TestPowerLawDAG(unittest.TestCase):
+    def test_structure(self):
+        for (node_count, layer_count) in [
+            (1, 8),
+            (5, 8),
+            (300, 4),
+            (2000, 8),
+        ]:
+            dag = PowerLawDAG(
+                edge_count=node_count * 3,
+                layer_count=layer_count,
+                node_count=node_count,
+                seed=1,
+            )
+            validate_dag(dag)
+            compact = dag.compact()
+            self.assertEqual(
+                list(compact.root_nodes()),
+                list(dag.root_nodes()),
+            )
+            self.assertEqual(
+                list(compact.leaf_nodes()),
+                list(dag.leaf_nodes()),
+            )
+            self.assertEqual(
+                dag.edge_count(),
+                compact.edge_count(),
+            )
+
+    def test_seeded(self):
+        def dag(seed):
+            return PowerLawDAG(
+                edge_count=4000,
+                node_count=1000,
+                seed=seed,
+            )
+        self.assertEqual(dag(1), dag(1))
+        self.assertNotEqual(dag(1), dag(2))
+        self.assertNotEqual(
+            dag(1).fingerprint(),
+            dag(2).fingerprint(),
+        )
+        # Nodes don't depend on the order they're visited.
+        d = dag(1)
+        self.assertEqual(
+            list(d.nodes_from(500)),
+            list(dag(1).nodes_from(500)),
+        )
+
+    def test_degrees_are_skewed(self):
+        dag = PowerLawDAG(
+            edge_count=40000,
+            node_count=10000,
+            seed=3,
+        )
+        edge_count = dag.edge_count()
+        self.assertGreater(edge_count, 36000)
+        self.assertLessEqual(edge_count, 44000)
+        compact = dag.compact()
+        mean_degree = float(edge_count) / 10000
+        self.assertGreater(
+            max(compact.in_degrees()),
+            20 * mean_degree,
+        )
+        self.assertGreater(
+            max(compact.out_degrees()),
+            20 * mean_degree,
+        )
+
+class TestStructuredDAGs(unittest.TestCase):
+    def assert_arithmetic_matches_structure(self, dag):
+        validate_dag(dag)
+        for node in dag.all_nodes():
+            self.assertItemsEqual(
+                dag.nodes_to(node),
+                DAG.nodes_to(dag, node),
+            )
+        self.assertEqual(
+            dag.edge_count(),
+            DAG.edge_count(dag),
+        )
+        self.assertEqual(
+            dag.work_and_span(),
+            DAG.work_and_span(dag),
+        )
+        compact = dag.compact()
+        self.assertItemsEqual(
+            compact.root_nodes(),
+            dag.root_nodes(),
+        )
+        self.assertItemsEqual(
+            compact.leaf_nodes(),
+            dag.leaf_nodes(),
+        )
+
+    def test_fan_in(self):
+        for width in xrange(1, 6):
+            self.assert_arithmetic_matches_structure(
+                FanInDAG(width),
+            )
+        dag = FanInDAG(3)
+        self.assertItemsEqual(dag.nodes_to(5), [2, 3, 4])
+
+    def test_diamond(self):
+        for count in xrange(0, 4):
+            for width in xrange(1, 4):
+                self.assert_arithmetic_matches_structure(
+                    DiamondDAG(count=count, width=width),
+                )
+        dag = DiamondDAG(count=2)
+        self.assertItemsEqual(
+            dag.edges(),
+            [
+                (1, 2), (1, 3), (2, 4), (3, 4),
+                (4, 5), (4, 6), (5, 7), (6, 7),
+            ],
+        )
+
+    def test_grid(self):
+        for rows in xrange(1, 5):
+            for columns in xrange(1, 5):
+                self.assert_arithmetic_matches_structure(
+                    GridDAG(rows=rows, columns=columns),
+                )
+        dag = GridDAG(rows=2, columns=3)
+        self.assertItemsEqual(
+            dag.edges(),
+            [
+                (1, 2), (2, 3), (4, 5), (5, 6),
+                (1, 4), (2, 5), (3, 6),
+            ],
+        )
+
+    def test_header_pyramid(self):
+        for source_count in xrange(1, 20):
+            self.assert_arithmetic_matches_structure(
+                HeaderPyramidDAG(source_count),
+            )
+        dag = HeaderPyramidDAG(4)
+        self.assertItemsEqual(
+            dag.edges(),
+            [
+                (1, 2), (1, 3), (1, 4), (1, 5),
+                (2, 6), (2, 10), (2, 11),
+                (3, 7), (3, 10), (3, 11),
+                (4, 8), (4, 11),
+                (5, 9), (5, 11),
+                (10, 12), (11, 12),
+            ],
+        )
+
+class TestDotDAG(unittest.TestCase):
+    dot = '''digraph ninja {
+rankdir="LR"
+node [fontsize=10, shape=box, height=0.25]
+edge [fontsize=10]
+"0x1" [label="all"]
+"0x2" [label="phony", shape=ellipse]
+"0x2" -> "0x1"
+"0x3" -> "0x2" [arrowhead=none]
+"0x4" -> "0x2" [arrowhead=none]
+"0x4" -> "0x3"
+"0x4" [label="leaf"]
+}
+'''
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dot_path = os.path.join(self.temp_dir, 'g.dot')
+        with open(self.dot_path, 'w') as dot_file:
+            dot_file.write(TestDotDAG.dot)
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_expected_dag(self, dag):
+        self.assertItemsEqual(dag.all_nodes(), [1, 2, 3, 4])
+        self.assertItemsEqual(dag.root_nodes(), [1])
+        self.assertItemsEqual(dag.leaf_nodes(), [4])
+        self.assertItemsEqual(dag.nodes_from(1), [2])
+        self.assertItemsEqual(dag.nodes_from(2), [3, 4])
+        self.assertItemsEqual(dag.nodes_from(3), [4])
+        self.assertItemsEqual(dag.nodes_from(4), [])
+        self.assertEqual(dag.node_label(1), 'all')
+        self.assertEqual(dag.node_label(3), '0x3')
+
+    def test_parse(self):
+        self.assert_expected_dag(DotDAG(self.dot_path))
+
+    def test_compiled_graph_is_reused(self):
+        stamp = 1000000000
+        os.utime(self.dot_path, (stamp, stamp))
+        dag = DotDAG(self.dot_path, cache_dir=self.cache_dir)
+        self.assert_expected_dag(dag)
+        cache_files = os.listdir(self.cache_dir)
+
+        # Corrupt the source without changing its stamp;
+        # the compiled graph must be used as-is.
+        with open(self.dot_path, 'w') as dot_file:
+            dot_file.write(TestDotDAG.dot.replace('->', '=>'))
+        os.utime(self.dot_path, (stamp, stamp))
+        dag = DotDAG(self.dot_path, cache_dir=self.cache_dir)
+        self.assert_expected_dag(dag)
+        self.assertItemsEqual(
+            os.listdir(self.cache_dir),
+            cache_files,
+        )
+
+    def test_fingerprint_ignores_cache(self):
+        fingerprint = DotDAG(self.dot_path).fingerprint()
+        for _ in xrange(2):
+            self.assertEqual(
+                DotDAG(
+                    self.dot_path,
+                    cache_dir=self.cache_dir,
+                ).fingerprint(),
+                fingerprint,
+            )
+
+    def test_pickle_round_trip(self):
+        for cache_dir in [None, self.cache_dir]:
+            dag = DotDAG(self.dot_path, cache_dir=cache_dir)
+            self.assert_expected_dag(
+                pickle.loads(pickle.dumps(dag, 2)),
+            )
+
+class TestCompactDAG(unittest.TestCase):
+    def test_from_dag_equals_dag(self):
+        for dag in [
+            LinearDAG(depth=5),
+            UniformFanOutDAG(depth=3, fan_out=3),
+        ]:
+            compact_dag = dag.compact()
+            self.assertEqual(compact_dag, dag)
+            self.assertItemsEqual(
+                compact_dag.root_nodes(),
+                dag.root_nodes(),
+            )
+            self.assertItemsEqual(
+                compact_dag.leaf_nodes(),
+                dag.leaf_nodes(),
+            )
+            self.assertItemsEqual(
+                compact_dag.edges(),
+                dag.edges(),
+            )
+            validate_dag(compact_dag)
+
+    def test_degrees(self):
+        dag = UniformFanOutDAG(depth=3, fan_out=2).compact()
+        self.assertEqual(
+            list(dag.out_degrees()),
+            [2, 2, 2, 0, 0, 0, 0],
+        )
+        self.assertEqual(
+            list(dag.in_degrees()),
+            [0, 1, 1, 1, 1, 1, 1],
+        )
+        self.assertEqual(dag.edge_count(), 6)
+
+    def test_levels_of_shared_dependencies(self):
+        # 1 -> 2 -> 3 -> 4
+        # 1 -> 4
+        dag = CompactDAG(
+            edge_offsets=array.array('I', [0, 2, 3, 4, 4]),
+            edge_targets=array.array('I', [2, 4, 3, 4]),
+        )
+        self.assertEqual(
+            list(dag.node_levels()),
+            [3, 2, 1, 0],
+        )
+        self.assertEqual(
+            map(list, dag.levels()),
+            [[4], [3], [2], [1]],
+        )
+        self.assertItemsEqual(dag.root_nodes(), [1])
+        self.assertItemsEqual(dag.leaf_nodes(), [4])
+
+    def test_levels_of_fan_out(self):
+        dag = UniformFanOutDAG(depth=4, fan_out=3)
+        expected_levels = [
+            range(14, 41),
+            range(5, 14),
+            range(2, 5),
+            [1],
+        ]
+        self.assertEqual(
+            map(list, dag.levels()),
+            expected_levels,
+        )
+        dag = dag.compact()
+        self.assertEqual(
+            map(list, dag.levels()),
+            expected_levels,
+        )
+        # Levels are cached.
+        self.assertIs(dag.levels(), dag.levels())
+        self.assertEqual(
+            map(set, dag.levels()),
+            dag.all_nodes_sorted_topologically(),
+        )
+
+class TestNodesTo(unittest.TestCase):
+    def assert_nodes_to_matches_edges(self, dag):
+        expected = collections.defaultdict(set)
+        for (from_node, to_node) in dag.edges():
+            expected[to_node].add(from_node)
+        for node in dag.all_nodes():
+            self.assertItemsEqual(
+                dag.nodes_to(node),
+                expected[node],
+            )
+
+    def test_implicit_dags(self):
+        for depth in xrange(1, 5):
+            for fan_out in xrange(1, 5):
+                dag = UniformFanOutDAG(
+                    depth=depth,
+                    fan_out=fan_out,
+                )
+                self.assert_nodes_to_matches_edges(dag)
+                self.assert_nodes_to_matches_edges(
+                    dag.compact(),
+                )
+            self.assert_nodes_to_matches_edges(
+                LinearDAG(depth),
+            )
+        self.assert_nodes_to_matches_edges(
+            PowerLawDAG(edge_count=400, node_count=100),
+        )
+
+    def test_generic_index(self):
+        dag = UniformFanOutDAG(depth=3, fan_out=2)
+        self.assertItemsEqual(
+            DAG.nodes_to(dag, 5),
+            [2],
+        )
+        self.assertItemsEqual(DAG.nodes_to(dag, 1), [])
+
+    def test_all_nodes_to(self):
+        dag = UniformFanOutDAG(depth=4, fan_out=2)
+        for d in [dag, dag.compact()]:
+            self.assertEqual(d.all_nodes_to([9]), {1, 2, 4})
+            self.assertEqual(
+                d.all_nodes_to([9, 14]),
+                {1, 2, 3, 4, 7},
+            )
+            self.assertEqual(d.all_nodes_to([1]), set())
+
+class TestArithmeticQueries(unittest.TestCase):
+    def assert_queries_match_structure(self, dag):
+        leaves = frozenset(dag.leaf_nodes())
+        depths = {}
+        for node in dag.all_nodes():
+            self.assertEqual(dag.is_leaf(node), node in leaves)
+            self.assertEqual(
+                dag.is_root(node),
+                node in dag.root_nodes(),
+            )
+            parents = list(dag.nodes_to(node))
+            self.assertEqual(
+                dag.parent(node),
+                parents[0] if parents else None,
+            )
+            depths[node] = (
+                depths[parents[0]] + 1 if parents else 1
+            )
+            self.assertEqual(dag.node_depth(node), depths[node])
+        self.assertEqual(
+            list(dag.edges()),
+            list(DAG.edges(dag)),
+        )
+        self.assertEqual(
+            dag.edge_count(),
+            len(list(DAG.edges(dag))),
+        )
+
+    def test_uniform_fan_out(self):
+        for depth in xrange(1, 6):
+            for fan_out in xrange(1, 6):
+                self.assert_queries_match_structure(
+                    UniformFanOutDAG(
+                        depth=depth,
+                        fan_out=fan_out,
+                    ),
+                )
+
+    def test_work_and_span(self):
+        for dag in [
+            LinearDAG(1),
+            LinearDAG(7),
+            UniformFanOutDAG(depth=1, fan_out=3),
+            UniformFanOutDAG(depth=4, fan_out=3),
+        ]:
+            self.assertEqual(
+                dag.work_and_span(),
+                DAG.work_and_span(dag),
+            )
+
+    def test_linear(self):
+        for depth in xrange(1, 10):
+            self.assert_queries_match_structure(
+                LinearDAG(depth),
+            )
+
+    def test_fingerprints(self):
+        self.assertEqual(
+            LinearDAG(5).fingerprint(),
+            LinearDAG(5).fingerprint(),
+        )
+        self.assertNotEqual(
+            LinearDAG(5).fingerprint(),
+            LinearDAG(6).fingerprint(),
+        )
+        self.assertNotEqual(
+            UniformFanOutDAG(3, 2).fingerprint(),
+            UniformFanOutDAG(2, 3).fingerprint(),
+        )
+        self.assertEqual(
+            LinearDAG(5).compact().fingerprint(),
+            UniformFanOutDAG(5, 1).compact().fingerprint(),
+        )
+
+    def test_huge_uniform_fan_out(self):
+        # Would take ages with linear membership tests.
+        dag = UniformFanOutDAG(depth=8, fan_out=10)
+        last_node = UniformFanOutDAG.node_count(8, 10)
+        self.assertTrue(dag.is_leaf(last_node))
+        self.assertEqual(dag.node_depth(last_node), 8)
+        self.assertEqual(list(dag.nodes_from(last_node)), [])
+        self.assertEqual(
+            list(dag.nodes_from(last_node // 10)),
+            range(last_node - 9, last_node + 1),
+        )
+
 class TestLinearDAG(unittest.TestCase):
     def test_topological_sort_10(self):
         dag = LinearDAG(10)
@@ -1,4 +1,6 @@
 import bss.dags
+import bss.importers
+import bss.transforms
 import itertools
 import logging
 import os
@@ -18,16 +20,140 @@ class DAGSet(object):
     def prepare_parser(arg_parser):
         pass
 
-class ChromiumDAGSet(DAGSet):
+# Graph files are DOT files, possibly compressed.
+_graph_file_extensions = ['.dot'] + [
+    '.dot' + extension
+    for extension in bss.importers.compressed_extensions
+]
+
+def _graph_file_stem(file_name):
+    '''
+    Returns file_name without its graph file extension, or
+    None if it isn't a graph file.
+    '''
+    for extension in _graph_file_extensions:
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return None
+
+def graph_file_path(data_dir, stem):
+    '''
+    Returns the path of the graph file named stem (with any
+    graph file extension) in data_dir.
+    '''
+    for extension in _graph_file_extensions:
+        path = os.path.join(data_dir, stem + extension)
+        if os.path.exists(path):
+            return path
+    raise Exception(
+        'No graph file named {} in {}'.format(stem, data_dir),
+    )
+
+class GraphFileDAGSet(DAGSet):
+    '''
+    The DAG of the graph file named stem in data_dir (see
+    graph_file_path).
+    '''
+    data_dir = _data_dir
+    variable_label = 'N/A'
+
+    @classmethod
+    def dags(cls, args):
+        yield (0, bss.dags.DotDAG(
+            graph_file_path(cls.data_dir, cls.stem),
+            cache_dir=args.dag_cache_dir,
+        ))
+
+def discover_graph_file_dag_sets(data_dir, known_shortnames):
+    '''
+    Returns a GraphFileDAGSet, named after its file, for
+    every graph file in data_dir not named by one of
+    known_shortnames.
+    '''
+    if not os.path.isdir(data_dir):
+        return []
+    stems = {
+        _graph_file_stem(file_name)
+        for file_name in os.listdir(data_dir)
+    }
+    stems.discard(None)
+    return [
+        type(
+            '{}DAGSet'.format(stem),
+            (GraphFileDAGSet,),
+            {
+                'data_dir': data_dir,
+                'name': stem,
+                'shortname': stem,
+                'stem': stem,
+            },
+        )
+        for stem in sorted(stems - set(known_shortnames))
+    ]
+
+class ChromiumDAGSet(GraphFileDAGSet):
     name = 'Chromium (from GYP+Ninja)'
     shortname = 'chromium'
-    variable_label = 'N/A'
+    stem = 'chromium'
+
+class DiamondDAGSet(DAGSet):
+    name = 'Diamonds'
+    shortname = 'diamond'
+    variable_label = 'Stacked Diamonds'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--diamond-counts',
+            dest='diamond_counts',
+            help='Number of diamonds in the dependency chain',
+            metavar='COUNT',
+            nargs='+',
+            required=True,
+            type=int,
+        )
+        arg_parser.add_argument(
+            '--diamond-width',
+            default=2,
+            dest='diamond_width',
+            help='Number of nodes across each diamond',
+            metavar='NODES',
+            type=int,
+        )
 
     @staticmethod
     def dags(args):
-        yield (0, bss.dags.DotDAG(
-            os.path.join(_data_dir, 'chromium.dot'),
-        ))
+        if args.diamond_counts is None:
+            return
+        for count in args.diamond_counts:
+            yield (count, bss.dags.DiamondDAG(
+                count=count,
+                width=args.diamond_width,
+            ))
+
+class FanInDAGSet(DAGSet):
+    name = 'Fan-In'
+    shortname = 'fan-in'
+    variable_label = 'Fan-In (Edges)'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--fan-in-edges',
+            dest='fan_in_edges',
+            help='Number of nodes sharing one dependency',
+            metavar='EDGES',
+            nargs='+',
+            required=True,
+            type=int,
+        )
+
+    @staticmethod
+    def dags(args):
+        if args.fan_in_edges is None:
+            return
+        for width in args.fan_in_edges:
+            yield (width, bss.dags.FanInDAG(width))
 
 class FanOutDAGSet(DAGSet):
     name = 'Fan-Out'
@@ -57,16 +183,64 @@ class FanOutDAGSet(DAGSet):
                 fan_out=fan_out,
             ))
 
-class LLVMDAGSet(DAGSet):
-    name = 'LLVM (from CMake+Ninja)'
-    shortname = 'llvm'
-    variable_label = 'N/A'
+class GridDAGSet(DAGSet):
+    name = 'Grid'
+    shortname = 'grid'
+    variable_label = 'Grid Side (Nodes)'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--grid-sides',
+            dest='grid_sides',
+            help='Number of rows and columns of the lattice',
+            metavar='NODES',
+            nargs='+',
+            required=True,
+            type=int,
+        )
 
     @staticmethod
     def dags(args):
-        yield (0, bss.dags.DotDAG(
-            os.path.join(_data_dir, 'llvm.dot'),
-        ))
+        if args.grid_sides is None:
+            return
+        for side in args.grid_sides:
+            yield (side, bss.dags.GridDAG(
+                columns=side,
+                rows=side,
+            ))
+
+class HeaderPyramidDAGSet(DAGSet):
+    name = 'Header Pyramid'
+    shortname = 'header-pyramid'
+    variable_label = 'Source Files'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--header-pyramid-sources',
+            dest='header_pyramid_source_counts',
+            help='Number of source files sharing headers',
+            metavar='SOURCES',
+            nargs='+',
+            required=True,
+            type=int,
+        )
+
+    @staticmethod
+    def dags(args):
+        if args.header_pyramid_source_counts is None:
+            return
+        for source_count in args.header_pyramid_source_counts:
+            yield (
+                source_count,
+                bss.dags.HeaderPyramidDAG(source_count),
+            )
+
+class LLVMDAGSet(GraphFileDAGSet):
+    name = 'LLVM (from CMake+Ninja)'
+    shortname = 'llvm'
+    stem = 'llvm'
 
 class LinearDAGSet(DAGSet):
     name = 'Linear'
@@ -92,6 +266,159 @@ class LinearDAGSet(DAGSet):
         for depth in args.linear_depths:
             yield (depth, bss.dags.LinearDAG(depth))
 
+class NinjaManifestDAGSet(DAGSet):
+    name = 'Ninja Manifest'
+    shortname = 'ninja-manifest'
+    variable_label = 'N/A'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--ninja-manifest',
+            dest='ninja_manifest_path',
+            help='build.ninja file whose build graph to use',
+            metavar='PATH',
+            required=True,
+        )
+
+    @staticmethod
+    def dags(args):
+        if args.ninja_manifest_path is None:
+            return
+        yield (0, bss.dags.NinjaDAG(args.ninja_manifest_path))
+
+class PowerLawDAGSet(DAGSet):
+    name = 'Power-Law Random'
+    shortname = 'power-law'
+    variable_label = 'Total Nodes'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--power-law-nodes',
+            dest='power_law_node_counts',
+            help='Number of nodes in the random graph',
+            metavar='NODES',
+            nargs='+',
+            required=True,
+            type=int,
+        )
+        arg_parser.add_argument(
+            '--power-law-edges-per-node',
+            default=4.0,
+            dest='power_law_edges_per_node',
+            help='Mean number of dependencies of each node',
+            metavar='EDGES',
+            type=float,
+        )
+        arg_parser.add_argument(
+            '--power-law-fan-in-exponent',
+            default=2.5,
+            dest='power_law_in_exponent',
+            help='Power-law exponent of in-degrees',
+            metavar='EXPONENT',
+            type=float,
+        )
+        arg_parser.add_argument(
+            '--power-law-fan-out-exponent',
+            default=2.5,
+            dest='power_law_out_exponent',
+            help='Power-law exponent of out-degrees',
+            metavar='EXPONENT',
+            type=float,
+        )
+        arg_parser.add_argument(
+            '--power-law-layers',
+            default=8,
+            dest='power_law_layer_count',
+            help='Number of layers of the random graph',
+            metavar='LAYERS',
+            type=int,
+        )
+        arg_parser.add_argument(
+            '--power-law-seed',
+            default=0,
+            dest='power_law_seed',
+            help='Seed of the random graph',
+            metavar='SEED',
+            type=int,
+        )
+
+    @staticmethod
+    def dags(args):
+        if args.power_law_node_counts is None:
+            return
+        for node_count in args.power_law_node_counts:
+            yield (node_count, bss.dags.PowerLawDAG(
+                edge_count=int(round(
+                    node_count * args.power_law_edges_per_node,
+                )),
+                fan_in_exponent=args.power_law_in_exponent,
+                fan_out_exponent=args.power_law_out_exponent,
+                layer_count=args.power_law_layer_count,
+                node_count=node_count,
+                seed=args.power_law_seed,
+            ))
+
+class ScaledLLVMDAGSet(DAGSet):
+    name = 'LLVM (scaled)'
+    shortname = 'llvm-scaled'
+    variable_label = 'Scale Factor'
+
+    @staticmethod
+    def prepare_parser(arg_parser):
+        arg_parser.add_argument(
+            '--llvm-scales',
+            dest='llvm_scales',
+            help='Size of the graph relative to LLVM\'s',
+            metavar='FACTOR',
+            nargs='+',
+            required=True,
+            type=float,
+        )
+        arg_parser.add_argument(
+            '--llvm-scale-cross-links',
+            default=0.05,
+            dest='llvm_cross_links',
+            help=(
+                'Fraction of edges of each copy of LLVM '
+                'also linked to the previous copy'
+            ),
+            metavar='FRACTION',
+            type=float,
+        )
+        arg_parser.add_argument(
+            '--llvm-scale-seed',
+            default=0,
+            dest='llvm_scale_seed',
+            help='Seed for cross-links and sampling',
+            metavar='SEED',
+            type=int,
+        )
+        arg_parser.add_argument(
+            '--llvm-scale-reduce',
+            action='store_true',
+            default=False,
+            dest='llvm_scale_reduce',
+            help='Remove edges implied by other edges',
+        )
+
+    @staticmethod
+    def dags(args):
+        if args.llvm_scales is None:
+            return
+        (_, llvm_dag) = next(LLVMDAGSet.dags(args))
+        for factor in args.llvm_scales:
+            dag = bss.transforms.scale(
+                llvm_dag,
+                cross_link_fraction=args.llvm_cross_links,
+                factor=factor,
+                seed=args.llvm_scale_seed,
+            )
+            if args.llvm_scale_reduce:
+                dag = bss.transforms.transitive_reduction(dag)
+            yield (factor, dag)
+
 class UniformFanOutDAGSet(DAGSet):
     name = 'Uniform Fan-Out'
     shortname = 'uniform-fan-out'
@@ -139,10 +466,26 @@ class UniformFanOutDAGSet(DAGSet):
         for (node_count, dag) in args.fan_out_dags:
             yield (node_count, dag)
 
-all_dag_sets = [
+_builtin_dag_sets = [
     ChromiumDAGSet,
+    DiamondDAGSet,
+    FanInDAGSet,
     FanOutDAGSet,
+    GridDAGSet,
+    HeaderPyramidDAGSet,
     LLVMDAGSet,
     LinearDAGSet,
+    NinjaManifestDAGSet,
+    PowerLawDAGSet,
+    ScaledLLVMDAGSet,
     UniformFanOutDAGSet,
 ]
+
+# Graph files dropped into data/ become DAG sets of their
+# own.
+all_dag_sets = _builtin_dag_sets + discover_graph_file_dag_sets(
+    _data_dir,
+    known_shortnames=[
+        dag_set.shortname for dag_set in _builtin_dag_sets
+    ],
+)
@@ -0,0 +1,978 @@
+#!/usr/bin/env python2.7
+
+'''
+Streaming importers of graph files.
+
+Graph files are read in a single pass, in chunks, and
+nodes and edges are accumulated in flat integer arrays by a
+GraphBuilder, which freezes them into the CSR (compressed
+sparse row) form used by bss.dags.CompactDAG.
+
+Supported formats are Graphviz DOT (see read_dot) and Ninja
+manifests (see read_ninja).  Graph files may be compressed
+(see open_graph_file).
+'''
+
+import array
+import bz2
+import contextlib
+import gzip
+import os
+import re
+import shutil
+import StringIO
+import subprocess
+import tempfile
+import unittest
+
+class GraphBuilder(object):
+    '''
+    Accumulates a graph's nodes and edges.
+
+    Nodes are named by strings and numbered from 1 in order
+    of first appearance.  Each node has a label, which is
+    its name unless set_label is called.
+    '''
+
+    def __init__(self):
+        # name => node
+        self.__nodes = {}
+        self.__labels = []
+        self.__from_nodes = array.array('I')
+        self.__to_nodes = array.array('I')
+
+    def node(self, name):
+        '''
+        Returns the node named name, adding it if needed.
+        '''
+        node = self.__nodes.get(name)
+        if node is None:
+            self.__labels.append(name)
+            node = len(self.__labels)
+            self.__nodes[name] = node
+        return node
+
+    def set_label(self, node, label):
+        self.__labels[node - 1] = label
+
+    def add_edge(self, from_node, to_node):
+        '''
+        Records that from_node depends upon to_node.
+        '''
+        self.__from_nodes.append(from_node)
+        self.__to_nodes.append(to_node)
+
+    def node_count(self):
+        return len(self.__labels)
+
+    def compact_graph(self):
+        '''
+        Returns (edge_offsets, edge_targets, labels), where
+        the nodes node depends upon are, in increasing order
+        and without duplicates,
+
+        edge_targets[edge_offsets[node - 1]:edge_offsets[node]]
+
+        and labels[node - 1] is node's label.
+        '''
+        node_count = self.node_count()
+        from_nodes = self.__from_nodes
+        to_nodes = self.__to_nodes
+        # Counting sort edges by from_node.
+        offsets = array.array('I', [0]) * (node_count + 1)
+        for from_node in from_nodes:
+            offsets[from_node] += 1
+        for node in xrange(1, node_count + 1):
+            offsets[node] += offsets[node - 1]
+        cursors = offsets[:-1]
+        targets = array.array('I', [0]) * len(to_nodes)
+        for i in xrange(len(from_nodes)):
+            from_node = from_nodes[i]
+            targets[cursors[from_node - 1]] = to_nodes[i]
+            cursors[from_node - 1] += 1
+
+        # Sort and deduplicate each node's targets,
+        # compacting in place.
+        edge_offsets = array.array('I', [0])
+        end = 0
+        for node in xrange(1, node_count + 1):
+            node_targets = targets[
+                offsets[node - 1]:offsets[node]
+            ]
+            if len(node_targets) > 1:
+                node_targets = sorted(set(node_targets))
+            targets[end:end + len(node_targets)] \
+                = array.array('I', node_targets)
+            end += len(node_targets)
+            edge_offsets.append(end)
+        del targets[end:]
+        return (edge_offsets, targets, self.__labels)
+
+# Commands decompressing files to standard output, by
+# extension, for formats Python has no module for.
+_decompress_commands = {
+    '.xz': ['xz', '--decompress', '--stdout'],
+    '.zst': ['zstd', '--decompress', '--stdout', '--quiet'],
+}
+
+# Extensions of compressed files open_graph_file can read.
+compressed_extensions = ['.bz2', '.gz'] \
+    + sorted(_decompress_commands)
+
+@contextlib.contextmanager
+def open_graph_file(path):
+    '''
+    Yields a file object reading path, decompressing it as
+    it is read if path ends in one of compressed_extensions.
+    xz and Zstandard files are decompressed by the xz and
+    zstd commands.
+    '''
+    extension = os.path.splitext(path)[1]
+    if extension == '.bz2':
+        graph_file = bz2.BZ2File(path, 'rb')
+    elif extension == '.gz':
+        graph_file = gzip.GzipFile(path, 'rb')
+    elif extension in _decompress_commands:
+        with _decompressed_pipe(path, extension) as pipe:
+            yield pipe
+        return
+    else:
+        graph_file = open(path, 'rb')
+    with contextlib.closing(graph_file):
+        yield graph_file
+
+@contextlib.contextmanager
+def _decompressed_pipe(path, extension):
+    command = _decompress_commands[extension] + [path]
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        yield process.stdout
+        # Drain the pipe so a corrupt tail is noticed.
+        while process.stdout.read(64 * 1024):
+            pass
+    except Exception:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        # If decompression failed, that is the real error.
+        if process.wait() <= 0:
+            raise
+    else:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode,
+            command,
+        )
+
+_dot_id = r'''
+    (?:"[^"\\]*(?:\\.[^"\\]*)*"
+    |<[^<>]*>
+    |[A-Za-z_\x80-\xff][\w\x80-\xff]*(?![\w\x80-\xff])
+    |-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?![\w.]))
+'''
+_dot_attributes = r'''
+    (?:\[([^\]"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^\]"]*)*)\])
+'''
+# Keywords are case-insensitive.
+_dot_keywords = frozenset([
+    'digraph',
+    'edge',
+    'graph',
+    'node',
+    'strict',
+    'subgraph',
+])
+_dot_not_keyword = r'(?!(?:{})(?![\w\x80-\xff]))'.format(
+    '|'.join(
+        ''.join(
+            '[{}{}]'.format(c, c.upper())
+            for c in keyword
+        )
+        for keyword in sorted(_dot_keywords)
+    ),
+)
+# A statement continues if followed by any of these.
+_dot_continuation = r'''
+    (?!\s*(?:->|--|[:+\[=]))
+'''
+
+# DOT tokens, by group:
+# 1: whitespace and comments,
+# 2: IDs,
+# 3: punctuation,
+# 4: the start of a token which may continue past the end
+#    of the buffer,
+# 5: anything else (an error).
+_dot_token_re = re.compile(
+    r'''
+    (\s+|//[^\n]*|\#[^\n]*|/\*(?:[^*]|\*(?!/))*\*/)
+    |({id})
+    |(->|--|[{{}}\[\]=;,:+])
+    |("|/\*|<|/|-)
+    |(.)
+    '''.format(id=_dot_id),
+    re.DOTALL | re.VERBOSE,
+)
+# Most statements of most DOT files are a node or a single
+# edge (with attributes) on one line, such as:
+#   "0x1" -> "0x2" [arrowhead=none]
+#   "0x1" [label="all"]
+# These are matched in one go; anything else is tokenized.
+_dot_simple_statement_re = re.compile(
+    r'''
+    \s*{not_keyword}({id})
+    (?:[ \t]*(->|--)[ \t]*{not_keyword}({id}))?
+    [ \t]*{attributes}?[ \t]*;?{continuation}
+    '''.format(
+        attributes=_dot_attributes,
+        continuation=_dot_continuation,
+        id=_dot_id,
+        not_keyword=_dot_not_keyword,
+    ),
+    re.VERBOSE,
+)
+_dot_attribute_re = re.compile(
+    r'''
+    \s*({id})\s*(?:=\s*({id}))?\s*[,;]?
+    '''.format(id=_dot_id),
+    re.VERBOSE,
+)
+_dot_quote_re = re.compile(r'\\"|\\\n')
+_dot_line_re = re.compile(r'\s*\S[^\n]*\n')
+_dot_next_tokens_re = re.compile(r'\s*\S\S')
+
+def _dot_id_value(string):
+    '''
+    Returns the value of the ID string, or None if string
+    is a keyword.
+    '''
+    if string[0] == '"':
+        string = string[1:-1]
+        if '\\' in string:
+            # Only quotes are escaped in DOT strings; other
+            # backslashes are kept for the renderer.  A
+            # backslash before a newline continues the
+            # string.
+            string = _dot_quote_re.sub(
+                lambda match: '"' if match.group() == '\\"'
+                    else '',
+                string,
+            )
+        return string
+    if string.lower() in _dot_keywords:
+        return None
+    return string
+
+def _dot_attribute_values(attributes):
+    '''
+    Returns a dict of the attributes in the text between
+    an attribute list's brackets.
+    '''
+    values = {}
+    for (key, value) in _dot_attribute_re.findall(attributes):
+        values[_dot_id_value(key)] = _dot_id_value(value) \
+            if value else 'true'
+    return values
+
+class _DotScanner(object):
+    '''
+    Reads a DOT file a chunk at a time, matching statements
+    or tokens at the current position.
+    '''
+
+    def __init__(self, dot_file, chunk_size):
+        self.__file = dot_file
+        self.__chunk_size = chunk_size
+        self.__buffer = ''
+        self.__position = 0
+        self.__at_end = False
+        # (kind, value, end) of the next token, if peeked.
+        self.__peeked = None
+
+    def __read_chunk(self):
+        chunk = self.__file.read(self.__chunk_size)
+        self.__at_end = not chunk
+        self.__buffer = self.__buffer[self.__position:] + chunk
+        self.__position = 0
+
+    def match(self, regex):
+        '''
+        Returns regex's match at the current position, and
+        moves past it, or returns None.
+
+        Statements are single lines, so near the end of the
+        buffer, matching is retried with more of the file
+        unless the buffer holds a whole line and enough
+        after a match to tell that the statement ends
+        there.
+        '''
+        self.__peeked = None
+        while True:
+            match = regex.match(self.__buffer, self.__position)
+            end = self.__position if match is None \
+                else match.end()
+            if not self.__at_end \
+                    and len(self.__buffer) - end < 4096:
+                if match is None:
+                    # Maybe only the start of a statement has
+                    # been read.
+                    truncated = not _dot_line_re.match(
+                        self.__buffer,
+                        self.__position,
+                    )
+                else:
+                    # Maybe the statement continues.
+                    truncated = not _dot_next_tokens_re.match(
+                        self.__buffer,
+                        end,
+                    )
+                if truncated:
+                    self.__read_chunk()
+                    continue
+            if match is not None:
+                self.__position = match.end()
+            return match
+
+    def matches(self, regex):
+        '''
+        Yields successive matches of regex from the current
+        position, moving past each, until it doesn't match.
+        '''
+        while True:
+            self.__peeked = None
+            buffer = self.__buffer
+            match_at = regex.match
+            position = self.__position
+            # Matches ending before safe_end need no checks.
+            safe_end = len(buffer) - 4096
+            while True:
+                match = match_at(buffer, position)
+                if match is None:
+                    break
+                position = match.end()
+                if position >= safe_end:
+                    break
+                self.__position = position
+                yield match
+            match = self.match(regex)
+            if match is None:
+                return
+            yield match
+
+    def peek(self):
+        '''
+        Returns the kind of the next token, without moving
+        past it.
+        '''
+        if self.__peeked is None:
+            self.__peeked = self.__scan_token()
+        return self.__peeked[0]
+
+    def token(self):
+        '''
+        Returns the next token as (kind, value), where kind is
+        'id' for IDs, whose value is unquoted; the lower-case
+        keyword for unquoted keywords; and otherwise the
+        punctuation token itself.  Returns (None, None) at
+        the end of the file.
+        '''
+        if self.__peeked is None:
+            self.__peeked = self.__scan_token()
+        (kind, value, end) = self.__peeked
+        self.__peeked = None
+        self.__position = end
+        return (kind, value)
+
+    def __scan_token(self):
+        position = self.__position
+        while True:
+            if position == len(self.__buffer):
+                if self.__at_end:
+                    return (None, None, position)
+                self.__read_chunk()
+                position = 0
+                continue
+            match = _dot_token_re.match(self.__buffer, position)
+            group = match.lastindex
+            if not self.__at_end and (
+                group == 4
+                    or match.end() == len(self.__buffer)
+            ):
+                # The token might continue in the next
+                # chunk.
+                position -= self.__position
+                self.__read_chunk()
+                continue
+            position = match.end()
+            value = match.group(group)
+            if group == 1:
+                # Skipped whitespace and comments are read
+                # again by statement matches, so drop them.
+                self.__position = position
+                continue
+            elif group == 2:
+                id_value = _dot_id_value(value)
+                if id_value is None:
+                    keyword = value.lower()
+                    return (keyword, keyword, position)
+                return ('id', id_value, position)
+            elif group == 3:
+                return (value, value, position)
+            raise Exception(
+                'DOT syntax error near: {!r}'.format(
+                    self.__buffer[match.start():][:40],
+                ),
+            )
+
+class _DotReader(object):
+    def __init__(
+        self,
+        scanner,
+        graph,
+        arrows_point_to_dependencies,
+    ):
+        self.__scanner = scanner
+        self.__graph = graph
+        self.__arrows_point_to_dependencies \
+            = arrows_point_to_dependencies
+        self.__edge_op = None
+
+    def __next(self):
+        return self.__scanner.token()
+
+    def __peek(self):
+        return self.__scanner.peek()
+
+    def __expect(self, kind):
+        (token_kind, value) = self.__next()
+        if token_kind != kind:
+            raise Exception(
+                'DOT syntax error: expected {!r}, got {!r}'
+                .format(kind, value),
+            )
+        return value
+
+    def __id(self):
+        value = self.__expect('id')
+        while self.__peek() == '+':
+            self.__next()
+            value += self.__expect('id')
+        return value
+
+    def __add_edge(self, tail_node, head_node):
+        if self.__arrows_point_to_dependencies:
+            self.__graph.add_edge(tail_node, head_node)
+        else:
+            self.__graph.add_edge(head_node, tail_node)
+
+    def read(self):
+        if self.__peek() == 'strict':
+            self.__next()
+        (kind, _) = self.__next()
+        if kind == 'digraph':
+            self.__edge_op = '->'
+        elif kind == 'graph':
+            self.__edge_op = '--'
+        else:
+            raise Exception('Expected a DOT graph')
+        if self.__peek() == 'id':
+            self.__id()
+        self.__expect('{')
+        self.__statements(nodes=None)
+        self.__expect('}')
+
+    def __simple_statements(self):
+        '''
+        Reads single-line node and edge statements until
+        something else is next.
+        '''
+        node = self.__graph.node
+        add_edge = self.__graph.add_edge
+        arrows_point_to_dependencies \
+            = self.__arrows_point_to_dependencies
+        expected_edge_op = self.__edge_op
+        # ID as written => node, saving unquoting.
+        id_nodes = {}
+        for match in self.__scanner.matches(
+            _dot_simple_statement_re,
+        ):
+            (tail, edge_op, head, attributes) = match.groups()
+            tail_node = id_nodes.get(tail)
+            if tail_node is None:
+                tail_node = node(_dot_id_value(tail))
+                id_nodes[tail] = tail_node
+            if edge_op is None:
+                if attributes:
+                    label = _dot_attribute_values(attributes) \
+                        .get('label')
+                    if label is not None:
+                        self.__graph.set_label(tail_node, label)
+                continue
+            if edge_op != expected_edge_op:
+                raise Exception(
+                    'DOT syntax error: {}'.format(
+                        match.group().strip(),
+                    ),
+                )
+            head_node = id_nodes.get(head)
+            if head_node is None:
+                head_node = node(_dot_id_value(head))
+                id_nodes[head] = head_node
+            if arrows_point_to_dependencies:
+                add_edge(tail_node, head_node)
+            else:
+                add_edge(head_node, tail_node)
+
+    def __statements(self, nodes):
+        '''
+        Reads statements up to a closing brace.  If nodes is
+        a list, every node mentioned is added to it.
+        '''
+        while True:
+            if nodes is None:
+                self.__simple_statements()
+            kind = self.__peek()
+            if kind == '}':
+                return
+            elif kind == ';':
+                self.__next()
+            elif kind in ('graph', 'node', 'edge'):
+                self.__next()
+                self.__attributes()
+            elif kind == 'id':
+                name = self.__id()
+                if self.__peek() == '=':
+                    # Graph attribute.
+                    self.__next()
+                    self.__id()
+                    continue
+                node = self.__graph.node(name)
+                self.__port()
+                self.__statement_from([node], nodes)
+            elif kind in ('subgraph', '{'):
+                subgraph_nodes = self.__subgraph()
+                self.__statement_from(subgraph_nodes, nodes)
+            else:
+                (_, value) = self.__next()
+                raise Exception(
+                    'DOT syntax error: unexpected {}'.format(
+                        'end of file' if value is None
+                            else repr(value),
+                    ),
+                )
+
+    def __statement_from(self, first_nodes, nodes):
+        if nodes is not None:
+            nodes.extend(first_nodes)
+        if self.__peek() != self.__edge_op:
+            # Node statement (or subgraph).
+            label = self.__attributes().get('label')
+            if label is not None:
+                for node in first_nodes:
+                    self.__graph.set_label(node, label)
+            return
+        tail_nodes = first_nodes
+        while self.__peek() == self.__edge_op:
+            self.__next()
+            if self.__peek() == 'id':
+                head_nodes = [self.__graph.node(self.__id())]
+                self.__port()
+            else:
+                head_nodes = self.__subgraph()
+            if nodes is not None:
+                nodes.extend(head_nodes)
+            for tail_node in tail_nodes:
+                for head_node in head_nodes:
+                    self.__add_edge(tail_node, head_node)
+            tail_nodes = head_nodes
+        self.__attributes()
+
+    def __port(self):
+        while self.__peek() == ':':
+            self.__next()
+            self.__id()
+
+    def __subgraph(self):
+        if self.__peek() == 'subgraph':
+            self.__next()
+            if self.__peek() == 'id':
+                self.__id()
+        self.__expect('{')
+        nodes = []
+        self.__statements(nodes=nodes)
+        self.__expect('}')
+        return nodes
+
+    def __attributes(self):
+        attributes = {}
+        while self.__peek() == '[':
+            self.__next()
+            while self.__peek() != ']':
+                key = self.__id()
+                value = 'true'
+                if self.__peek() == '=':
+                    self.__next()
+                    value = self.__id()
+                attributes[key] = value
+                if self.__peek() in (',', ';'):
+                    self.__next()
+            self.__next()
+        return attributes
+
+def read_dot(
+    dot_file,
+    graph,
+    arrows_point_to_dependencies=False,
+    chunk_size=1024 * 1024,
+):
+    '''
+    Adds the nodes and edges of the DOT file dot_file to
+    the GraphBuilder graph, reading chunk_size bytes at a
+    time.  Nodes are named by their IDs, and labelled by
+    their label attributes, if any.
+
+    By default, 'a -> b' means b depends upon a, as in the
+    output of 'ninja -t graph'.  If
+    arrows_point_to_dependencies, a depends upon b instead.
+    '''
+    _DotReader(
+        _DotScanner(dot_file, chunk_size=chunk_size),
+        graph,
+        arrows_point_to_dependencies,
+    ).read()
+
+# Ninja build line tokens, by group: 1: paths (with escapes
+# and variables), 2: separators, or else spaces.
+_ninja_token_re = re.compile(
+    r'((?:\$[\s\S]|[^$ :|\n])+)|(\|\||\|@|\||:)| +',
+)
+_ninja_variable_re = re.compile(
+    r'\$(?:\{([\w.-]+)\}|([\w-]+)|([\s\S]))',
+)
+_ninja_binding_re = re.compile(r'^([\w.-]+)\s*=\s*(.*)$')
+
+def _evaluate_ninja(string, scope):
+    def replace(match):
+        (braced, name, escaped) = match.groups()
+        if escaped is not None:
+            return escaped
+        return scope.get(braced or name, '')
+    return _ninja_variable_re.sub(replace, string)
+
+def _ninja_lines(path):
+    '''
+    Yields (indented, line) for every logical line of the
+    Ninja manifest at path, joining lines continued with '$'
+    and skipping comments and blank lines.
+    '''
+    with open(path, 'r') as ninja_file:
+        pending = ''
+        for line in ninja_file:
+            line = line.rstrip('\r\n')
+            if pending:
+                line = pending + line.lstrip(' ')
+                pending = ''
+            # A line ending in an odd number of '$'s
+            # continues on the next.
+            dollar_count = len(line) - len(line.rstrip('$'))
+            if dollar_count % 2:
+                pending = line[:-1]
+                continue
+            stripped = line.lstrip(' ')
+            if not stripped or stripped.startswith('#'):
+                continue
+            yield (line.startswith(' '), stripped)
+        if pending:
+            yield (False, pending)
+
+def _read_ninja(path, graph, scope, root_dir):
+    for (indented, line) in _ninja_lines(path):
+        if indented:
+            # Bindings of a rule, build, or pool.
+            continue
+        (keyword, _, rest) = line.partition(' ')
+        if keyword == 'build':
+            _read_ninja_build(rest, graph, scope)
+        elif keyword in ('include', 'subninja'):
+            included_path = os.path.join(
+                root_dir,
+                _evaluate_ninja(rest.strip(), scope),
+            )
+            _read_ninja(
+                included_path,
+                graph=graph,
+                root_dir=root_dir,
+                # subninja has its own scope.
+                scope=scope if keyword == 'include'
+                    else dict(scope),
+            )
+        elif keyword in ('rule', 'pool', 'default'):
+            continue
+        else:
+            match = _ninja_binding_re.match(line)
+            if not match:
+                raise Exception(
+                    'Ninja syntax error in {}: {}'.format(
+                        path,
+                        line,
+                    ),
+                )
+            scope[match.group(1)] = _evaluate_ninja(
+                match.group(2),
+                scope,
+            )
+
+def _read_ninja_build(line, graph, scope):
+    outputs = []
+    inputs = []
+    section = 'outputs'
+    for match in _ninja_token_re.finditer(line):
+        (path, separator) = match.groups()
+        if path is not None:
+            if section == 'outputs':
+                outputs.append(_evaluate_ninja(path, scope))
+            elif section == 'rule':
+                section = 'inputs'
+            elif section == 'inputs':
+                inputs.append(_evaluate_ninja(path, scope))
+        elif separator == ':':
+            section = 'rule'
+        elif separator == '|@':
+            # Validations aren't dependencies.
+            section = 'validations'
+        elif separator is not None and section == 'rule':
+            section = 'inputs'
+    if section == 'outputs':
+        raise Exception(
+            'Ninja syntax error: build {}'.format(line),
+        )
+    # '|' among outputs introduces implicit outputs, and
+    # among inputs introduces implicit and order-only
+    # inputs; all are treated alike.
+    output_nodes = [graph.node(path) for path in outputs]
+    input_nodes = [graph.node(path) for path in inputs]
+    for output_node in output_nodes:
+        for input_node in input_nodes:
+            graph.add_edge(output_node, input_node)
+
+def read_ninja(ninja_path, graph):
+    '''
+    Adds the build graph of the Ninja manifest at
+    ninja_path (usually build.ninja) to the GraphBuilder
+    graph: every output depends upon every explicit,
+    implicit, and order-only input of its build statement.
+
+    Nodes are named by their paths.  Top-level variables
+    are expanded; included files are read from the
+    manifest's directory.
+    '''
+    _read_ninja(
+        ninja_path,
+        graph=graph,
+        root_dir=os.path.dirname(ninja_path),
+        scope={},
+    )
+
+def _labelled_edges(graph):
+    (offsets, targets, labels) = graph.compact_graph()
+    return [
+        (labels[node - 1], labels[targets[i] - 1])
+        for node in xrange(1, len(offsets))
+        for i in xrange(offsets[node - 1], offsets[node])
+    ]
+
+class TestReadDot(unittest.TestCase):
+    dot = r'''/* Leading comment. */
+strict digraph "g" {
+  graph [rankdir=LR];
+  node [shape=box]
+  // Statements may span lines, and edges chain.
+  a -> b -> "c \"quoted\""
+    [color=red];
+  "multi" + "part" -> a
+  # Lines from the C preprocessor are comments.
+  d:port:n -> { e f } [weight=2]
+  subgraph cluster_x { g; h -> e }
+  "long \
+string" -> a
+  labelled [label="Label, with [brackets]"]
+  1.5 -> -2
+}
+'''
+
+    def read(self, text, **kwargs):
+        graph = GraphBuilder()
+        read_dot(StringIO.StringIO(text), graph, **kwargs)
+        return graph
+
+    def test_statements(self):
+        graph = self.read(TestReadDot.dot)
+        self.assertItemsEqual(_labelled_edges(graph), [
+            ('b', 'a'),
+            ('c "quoted"', 'b'),
+            ('a', 'multipart'),
+            ('e', 'd'),
+            ('f', 'd'),
+            ('e', 'h'),
+            ('a', 'long string'),
+            ('-2', '1.5'),
+        ])
+        self.assertIn(
+            'Label, with [brackets]',
+            graph.compact_graph()[2],
+        )
+        self.assertIn('g', graph.compact_graph()[2])
+
+    def test_chunk_boundaries(self):
+        expected = self.read(TestReadDot.dot).compact_graph()
+        for chunk_size in [1, 2, 3, 5, 8, 13]:
+            self.assertEqual(
+                self.read(
+                    TestReadDot.dot,
+                    chunk_size=chunk_size,
+                ).compact_graph(),
+                expected,
+            )
+
+    def test_arrow_direction(self):
+        dot = 'digraph { a -> b }'
+        self.assertEqual(
+            _labelled_edges(self.read(dot)),
+            [('b', 'a')],
+        )
+        self.assertEqual(
+            _labelled_edges(self.read(
+                dot,
+                arrows_point_to_dependencies=True,
+            )),
+            [('a', 'b')],
+        )
+        self.assertEqual(
+            _labelled_edges(self.read('graph { a -- b }')),
+            [('b', 'a')],
+        )
+
+    def test_syntax_errors(self):
+        for dot in [
+            'digraph { a -> b',
+            'digraph { a - }',
+            'digraph { a -- b }',
+            'digraph { a -> node }',
+            'digraph { "a }',
+        ]:
+            with self.assertRaises(Exception):
+                self.read(dot, chunk_size=4)
+
+class TestOpenGraphFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'g.dot')
+        with open(self.path, 'wb') as dot_file:
+            dot_file.write(TestReadDot.dot)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_compressed_files(self):
+        with gzip.GzipFile(self.path + '.gz', 'wb') as gz:
+            gz.write(TestReadDot.dot)
+        with bz2.BZ2File(self.path + '.bz2', 'wb') as bz:
+            bz.write(TestReadDot.dot)
+        extensions = ['', '.bz2', '.gz']
+        for (extension, command) \
+                in _decompress_commands.iteritems():
+            try:
+                subprocess.check_call([
+                    command[0],
+                    '--keep',
+                    '--quiet',
+                    self.path,
+                ])
+            except OSError:
+                # Not installed.
+                continue
+            extensions.append(extension)
+        for extension in extensions:
+            with open_graph_file(self.path + extension) \
+                    as graph_file:
+                self.assertEqual(
+                    graph_file.read(),
+                    TestReadDot.dot,
+                )
+            # Stopping early is fine.
+            with open_graph_file(self.path + extension) \
+                    as graph_file:
+                graph_file.read(10)
+
+    def test_corrupt_file(self):
+        for extension in compressed_extensions:
+            path = self.path + extension
+            with open(path, 'wb') as corrupt_file:
+                corrupt_file.write('Not compressed.\n')
+            with self.assertRaises(Exception):
+                with open_graph_file(path) as graph_file:
+                    graph_file.read()
+
+class TestReadNinja(unittest.TestCase):
+    files = {
+        'build.ninja': '''# Comment.
+cflags = -O2
+out = obj
+rule cc
+  command = cc $cflags -c $in -o $out
+include rules.ninja
+build $out/a.o: cc a.c | a.h || gen $
+    other.h
+build $out/b.o $out/b.d | b.stamp: cc b.c |@ lint
+build app: link $out/a.o ${out}/b.o
+build gen: phony
+subninja sub/build.ninja
+build late: phony $out/a.o
+default app
+''',
+        'rules.ninja': 'libdir = lib\n',
+        'sub/build.ninja': '''out = subobj
+build $libdir/x.a: ar $out/x.o
+''',
+    }
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for (path, text) in TestReadNinja.files.iteritems():
+            path = os.path.join(self.temp_dir, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as ninja_file:
+                ninja_file.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_build_graph(self):
+        graph = GraphBuilder()
+        read_ninja(
+            os.path.join(self.temp_dir, 'build.ninja'),
+            graph,
+        )
+        self.assertItemsEqual(_labelled_edges(graph), [
+            ('obj/a.o', 'a.c'),
+            ('obj/a.o', 'a.h'),
+            ('obj/a.o', 'gen'),
+            ('obj/a.o', 'other.h'),
+            ('obj/b.o', 'b.c'),
+            ('obj/b.d', 'b.c'),
+            ('b.stamp', 'b.c'),
+            ('app', 'obj/a.o'),
+            ('app', 'obj/b.o'),
+            ('lib/x.a', 'subobj/x.o'),
+            ('late', 'obj/a.o'),
+        ])
+        self.assertNotIn('lint', graph.compact_graph()[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,634 @@
+#!/usr/bin/env python2.7
+
+'''
+Crash-safe journal of measured Runs.
+
+A journal is a file of JSON records, one per line, which is
+only ever appended to.  Each invocation of bss appends a
+'session' record describing itself (see
+bss.report.system_information).  After each configuration
+is measured, a 'run' record per Run and then a 'complete'
+record are appended and synced to disk, so an interrupted
+sweep loses at most the configurations being measured.
+'complete' records hold the analytics of the measured DAG
+(see bss.analytics), so reports never recreate DAGs.
+
+Runs of configurations without a 'complete' record are
+ignored.  If a configuration was completed more than once,
+only the Runs of its last completion are used.
+'''
+
+import argparse
+import bss.analytics
+import bss.builders
+import bss.dags
+import bss.dagsets
+import bss.manifests
+import bss.nodelayouts
+import bss.run
+import bss.setups
+import bss.util
+import collections
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler(sys.stderr))
+
+JournalContents = collections.namedtuple(
+    'JournalContents',
+    [
+        'args',
+        'information',
+        'runs',
+    ],
+)
+
+def _configuration_record(
+    record_type,
+    session,
+    configuration,
+):
+    return {
+        'builder': configuration.builder.shortname,
+        'dag_fingerprint': configuration.dag_fingerprint,
+        'dag_set': configuration.dag_set.shortname,
+        'jobs': configuration.jobs,
+        'manifest_layout': bss.manifests.format_manifest_layout(
+            configuration.manifest_layout,
+        ),
+        'node_layout': bss.nodelayouts.format_node_layout(
+            configuration.node_layout,
+        ),
+        'session': session,
+        'setup': configuration.setup.shortname,
+        'setup_name': configuration.setup_name,
+        'type': record_type,
+        'variable': configuration.variable,
+    }
+
+def _record_jobs(record):
+    # Journals from before --jobs always used one job.
+    return record.get('jobs', 1)
+
+def _record_manifest_layout(record):
+    # Journals from before --manifest-layouts always wrote
+    # one manifest.
+    return bss.manifests.parse_manifest_layout(
+        record.get('manifest_layout', '1'),
+    )
+
+def _record_node_layout(record):
+    # Journals from before --node-layouts always put nodes
+    # directly in the workspace.
+    return bss.nodelayouts.parse_node_layout(
+        record.get('node_layout', 'flat'),
+    )
+
+# Fields of bss.analytics.DAGAnalytics which are dicts.
+_histogram_fields = [
+    'in_degree_histogram',
+    'out_degree_histogram',
+]
+
+def _analytics_record(analytics):
+    record = analytics._asdict()
+    # JSON object keys are strings.
+    for field in _histogram_fields:
+        record[field] = sorted(record[field].iteritems())
+    return record
+
+def _record_analytics(record):
+    '''
+    Returns the bss.analytics.DAGAnalytics of a 'complete'
+    record, or None if it predates recorded analytics.
+    '''
+    analytics_record = record.get('dag_analytics')
+    if analytics_record is None:
+        return None
+    analytics_record = dict(analytics_record)
+    for field in _histogram_fields:
+        analytics_record[field] = dict(analytics_record[field])
+    return bss.analytics.DAGAnalytics(**analytics_record)
+
+def _record_dag_fingerprint(record):
+    # Journals from before fingerprints were recorded can't
+    # tell which DAG they measured, so are never resumed.
+    return record.get('dag_fingerprint', '')
+
+def _record_setup_name(record):
+    # Nor can they tell which setup parameters they used.
+    return record.get('setup_name', '')
+
+def _record_key(record):
+    return (
+        record['builder'],
+        record['dag_set'],
+        record['setup'],
+        str(record['variable']),
+        str(_record_jobs(record)),
+        bss.manifests.format_manifest_layout(
+            _record_manifest_layout(record),
+        ),
+        bss.nodelayouts.format_node_layout(
+            _record_node_layout(record),
+        ),
+        _record_dag_fingerprint(record),
+        _record_setup_name(record),
+    )
+
+def _truncate_torn_record(path):
+    '''
+    Removes a partially-written last record, if any, left
+    by a crash while appending.
+    '''
+    try:
+        journal_file = open(path, 'r+b')
+    except IOError:
+        return
+    with journal_file:
+        journal_file.seek(0, os.SEEK_END)
+        end = journal_file.tell()
+        position = end
+        chunk_size = 4096
+        while position > 0:
+            start = max(0, position - chunk_size)
+            journal_file.seek(start)
+            chunk = journal_file.read(position - start)
+            newline = chunk.rfind('\n')
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            logger.warn(
+                'Discarding torn record at end of {}'
+                .format(path),
+            )
+            journal_file.truncate(position)
+
+class JournalWriter(object):
+    '''
+    Appends the Runs of one invocation of bss to the
+    journal at path.
+
+    information describes the invocation (see
+    bss.report.system_information).
+    '''
+
+    def __init__(self, path, information):
+        _truncate_torn_record(path)
+        self.__file = open(path, 'a')
+        self.__session = uuid.uuid4().hex
+        machine_fingerprint = bss.util.machine_fingerprint(
+            information['machine'],
+        )
+        self.__write_records([{
+            'information': information,
+            'machine_fingerprint': machine_fingerprint,
+            'session': self.__session,
+            'time': time.time(),
+            'type': 'session',
+        }])
+
+    def close(self):
+        self.__file.close()
+
+    def write_configuration(
+        self,
+        configuration,
+        dag_analytics,
+        runs,
+    ):
+        '''
+        Durably records that configuration, whose DAG has
+        the bss.analytics.DAGAnalytics dag_analytics, was
+        measured, giving runs.
+        '''
+        records = []
+        for run in runs:
+            record = _configuration_record(
+                configuration=configuration,
+                record_type='run',
+                session=self.__session,
+            )
+            record['measurement'] = run.measurement
+            for field in bss.util.ResourceUsage._fields:
+                record[field] = getattr(run, field)
+            records.append(record)
+        record = _configuration_record(
+            configuration=configuration,
+            record_type='complete',
+            session=self.__session,
+        )
+        record['dag_analytics'] = _analytics_record(
+            dag_analytics,
+        )
+        records.append(record)
+        self.__write_records(records)
+
+    def __write_records(self, records):
+        self.__file.write(''.join(
+            json.dumps(record, sort_keys=True) + '\n'
+            for record in records
+        ))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+def read_records(path):
+    '''
+    Yields the records of the journal at path, ignoring a
+    torn last record.
+    '''
+    with open(path, 'r') as journal_file:
+        for line in journal_file:
+            if not line.endswith('\n'):
+                logger.warn(
+                    'Ignoring torn record at end of {}'
+                    .format(path),
+                )
+                break
+            yield json.loads(line)
+
+def _completed_records(records):
+    '''
+    Returns (sessions, completions), where sessions maps
+    session IDs to session records, and completions maps
+    configuration keys to (session ID, run records,
+    'complete' record) of their last completion.
+    '''
+    sessions = collections.OrderedDict()
+    # (session, key) => run records
+    pending_runs = collections.defaultdict(list)
+    completions = {}
+    for record in records:
+        record_type = record['type']
+        if record_type == 'session':
+            sessions[record['session']] = record
+        elif record_type == 'run':
+            key = _record_key(record)
+            pending_runs[(record['session'], key)] \
+                .append(record)
+        elif record_type == 'complete':
+            key = _record_key(record)
+            session = record['session']
+            completions[key] = (
+                session,
+                pending_runs.pop((session, key), []),
+                record,
+            )
+        else:
+            raise Exception(
+                'Unknown journal record type: {}'
+                .format(record_type),
+            )
+    return (sessions, completions)
+
+def completed_configuration_keys(path, machine_fingerprint):
+    '''
+    Returns the set of bss.run.configuration_keys completed
+    in the journal at path on the machine with
+    machine_fingerprint.
+    '''
+    (sessions, completions) \
+        = _completed_records(read_records(path))
+    keys = set()
+    foreign_count = 0
+    for (key, (session, _, _)) in completions.iteritems():
+        if sessions[session]['machine_fingerprint'] \
+                == machine_fingerprint:
+            keys.add(key)
+        else:
+            foreign_count += 1
+    if foreign_count:
+        logger.warn(
+            'Not resuming {} configuration(s) measured on '
+            'another machine'.format(foreign_count),
+        )
+    return keys
+
+def load_journal(path, parse_arguments):
+    '''
+    Rebuilds the Runs recorded in the journal at path,
+    returning a JournalContents.
+
+    parse_arguments turns the last session's command line
+    arguments into the returned args, and the returned
+    information is that of the last session.
+
+    Runs of configurations recorded without their DAG's
+    analytics (by older versions of bss) are dropped.
+    '''
+    (sessions, completions) \
+        = _completed_records(read_records(path))
+    if not sessions:
+        raise Exception('Empty journal: {}'.format(path))
+    builders = {
+        builder.shortname: builder
+        for builder in bss.builders.all_builders
+    }
+    dag_sets = {
+        dag_set.shortname: dag_set
+        for dag_set in bss.dagsets.all_dag_sets
+    }
+    setups = {
+        setup.shortname: setup
+        for setup in bss.setups.all_setups
+    }
+
+    runs = []
+    unanalyzed_count = 0
+    for (session, records, complete_record) \
+            in completions.itervalues():
+        analytics = _record_analytics(complete_record)
+        if analytics is None:
+            unanalyzed_count += 1
+            continue
+        for record in records:
+            runs.append(bss.run.Run(
+                builder=builders[record['builder']],
+                dag_analytics=analytics,
+                dag_fingerprint=_record_dag_fingerprint(record),
+                dag_set=dag_sets[record['dag_set']],
+                jobs=_record_jobs(record),
+                manifest_layout=_record_manifest_layout(record),
+                measurement=record['measurement'],
+                node_layout=_record_node_layout(record),
+                setup=setups[record['setup']],
+                setup_name=_record_setup_name(record),
+                variable=record['variable'],
+                **{
+                    field: record[field]
+                    for field
+                    in bss.util.ResourceUsage._fields
+                }
+            ))
+    if unanalyzed_count:
+        logger.warn(
+            'Ignoring {} configuration(s) recorded without '
+            'DAG analytics'.format(unanalyzed_count),
+        )
+    last_session = next(reversed(sessions))
+    information = sessions[last_session]['information']
+    return JournalContents(
+        args=parse_arguments(information['argv'][1:]),
+        information=information,
+        runs=runs,
+    )
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'journal')
+        self.information = {
+            'argv': ['bss.py', '--linear-depths', '3', '5'],
+            'builder_versions': {},
+            'machine': {'uname': ['Test']},
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def configuration(self, variable):
+        return bss.run.Configuration(
+            builder=bss.builders.GNUMakeBuilder,
+            dag_fingerprint=bss.dags.LinearDAG(variable)
+                .fingerprint(),
+            dag_set=bss.dagsets.LinearDAGSet,
+            jobs=1,
+            manifest_layout=bss.manifests.single_file_layout,
+            node_layout=bss.nodelayouts.flat_node_layout,
+            setup=bss.setups.CleanSetup,
+            setup_name='Clean',
+            variable=variable,
+        )
+
+    def make_run(self, variable, measurement):
+        return bss.run.Run(
+            builder=bss.builders.GNUMakeBuilder,
+            dag_analytics=None,
+            dag_fingerprint=None,
+            dag_set=bss.dagsets.LinearDAGSet,
+            jobs=1,
+            manifest_layout=bss.manifests.single_file_layout,
+            measurement=measurement,
+            node_layout=bss.nodelayouts.flat_node_layout,
+            setup=bss.setups.CleanSetup,
+            setup_name=None,
+            variable=variable,
+            **{
+                field: 0
+                for field in bss.util.ResourceUsage._fields
+            }
+        )
+
+    def write_configuration(self, journal, configuration, runs):
+        journal.write_configuration(
+            configuration=configuration,
+            dag_analytics=bss.analytics.analyze(
+                bss.dags.LinearDAG(configuration.variable),
+            ),
+            runs=runs,
+        )
+
+    def parse_arguments(self, argv):
+        self.assertEqual(argv, ['--linear-depths', '3', '5'])
+        return argparse.Namespace(linear_depths=[3, 5])
+
+    def test_round_trip(self):
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=self.configuration(3),
+            runs=[self.make_run(3, 1.5), self.make_run(3, 2.5)],
+        )
+        journal.close()
+
+        contents = load_journal(
+            self.path,
+            parse_arguments=self.parse_arguments,
+        )
+        self.assertEqual(contents.information, self.information)
+        self.assertEqual(
+            sorted(run.measurement for run in contents.runs),
+            [1.5, 2.5],
+        )
+        for run in contents.runs:
+            self.assertEqual(run.variable, 3)
+            self.assertEqual(
+                run.dag_analytics,
+                bss.analytics.analyze(bss.dags.LinearDAG(3)),
+            )
+        machine_fingerprint = bss.util.machine_fingerprint(
+            self.information['machine'],
+        )
+        self.assertEqual(
+            completed_configuration_keys(
+                self.path,
+                machine_fingerprint=machine_fingerprint,
+            ),
+            {(
+                'gnu-make',
+                'linear',
+                'clean',
+                '3',
+                '1',
+                '1',
+                'flat',
+                bss.dags.LinearDAG(3).fingerprint(),
+                'Clean',
+            )},
+        )
+        self.assertEqual(
+            completed_configuration_keys(
+                self.path,
+                machine_fingerprint='other',
+            ),
+            set(),
+        )
+
+    def test_last_completion_wins(self):
+        for measurement in [1, 2]:
+            journal = JournalWriter(self.path, self.information)
+            self.write_configuration(
+                journal,
+                configuration=self.configuration(5),
+                runs=[self.make_run(5, measurement)],
+            )
+            journal.close()
+        contents = load_journal(
+            self.path,
+            parse_arguments=self.parse_arguments,
+        )
+        self.assertEqual(
+            [run.measurement for run in contents.runs],
+            [2],
+        )
+
+    def test_changed_dag_is_not_resumed(self):
+        configuration = self.configuration(3)._replace(
+            dag_fingerprint='changed',
+        )
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=configuration,
+            runs=[self.make_run(3, 1)],
+        )
+        journal.close()
+        keys = completed_configuration_keys(
+            self.path,
+            machine_fingerprint=bss.util.machine_fingerprint(
+                self.information['machine'],
+            ),
+        )
+        self.assertEqual(
+            keys,
+            {bss.run.configuration_key(configuration)},
+        )
+        self.assertNotIn(
+            bss.run.configuration_key(self.configuration(3)),
+            keys,
+        )
+
+    def test_dags_are_not_recreated(self):
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=self.configuration(3),
+            runs=[self.make_run(3, 1)],
+        )
+        journal.close()
+        # Only the last session's arguments are parsed, and
+        # its --linear-depths no longer yield the DAG.
+        information = dict(
+            self.information,
+            argv=['bss.py', '--linear-depths', '7'],
+        )
+        journal = JournalWriter(self.path, information)
+        journal.close()
+        contents = load_journal(
+            self.path,
+            parse_arguments=lambda argv: argparse.Namespace(
+                linear_depths=[7],
+            ),
+        )
+        [run] = contents.runs
+        self.assertEqual(run.variable, 3)
+        self.assertEqual(
+            run.dag_fingerprint,
+            bss.dags.LinearDAG(3).fingerprint(),
+        )
+        self.assertEqual(
+            run.dag_analytics,
+            bss.analytics.analyze(bss.dags.LinearDAG(3)),
+        )
+        self.assertEqual(contents.args.linear_depths, [7])
+
+    def test_unanalyzed_configuration(self):
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=self.configuration(3),
+            runs=[self.make_run(3, 1)],
+        )
+        journal.close()
+        records = list(read_records(self.path))
+        del records[-1]['dag_analytics']
+        with open(self.path, 'w') as journal_file:
+            for record in records:
+                journal_file.write(json.dumps(record) + '\n')
+        self.assertEqual(
+            load_journal(
+                self.path,
+                parse_arguments=self.parse_arguments,
+            ).runs,
+            [],
+        )
+
+    def test_torn_record(self):
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=self.configuration(3),
+            runs=[self.make_run(3, 1)],
+        )
+        journal.close()
+        with open(self.path, 'a') as journal_file:
+            journal_file.write('{"type": "ru')
+
+        self.assertEqual(
+            len(load_journal(
+                self.path,
+                parse_arguments=self.parse_arguments,
+            ).runs),
+            1,
+        )
+
+        journal = JournalWriter(self.path, self.information)
+        self.write_configuration(
+            journal,
+            configuration=self.configuration(5),
+            runs=[self.make_run(5, 2)],
+        )
+        journal.close()
+        self.assertEqual(
+            sorted(
+                run.measurement
+                for run in load_journal(
+                    self.path,
+                    parse_arguments=self.parse_arguments,
+                ).runs
+            ),
+            [1, 2],
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,632 @@
+#!/usr/bin/env python2.7
+
+'''
+Generation of build manifests (Makefiles, build.ninja files,
+and Tupfiles) from DAGs.
+
+Manifests for large DAGs have millions of rules, so they are
+generated straight from a DAG's CSR edge arrays (see
+bss.dags.CompactDAG.edge_arrays), with node names looked up
+in a precomputed string table, and written in large chunks
+rather than a rule at a time.
+
+To measure generation throughput:
+
+    python -m bss.manifests --nodes 1000000 \
+        --edges-per-node 10
+'''
+
+import argparse
+import bss.dags
+import bss.nodelayouts
+import bss.util
+import collections
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Number of rules joined into each write.
+_chunk_rule_count = 4096
+
+def rules(dag, names, nodes=None):
+    '''
+    Yields (target, dependencies) for each of nodes (by
+    default, all of dag's nodes in order) with
+    dependencies, where target is the node's name and
+    dependencies the space-separated names of the nodes it
+    depends upon.
+    '''
+    (offsets, targets) = dag.compact().edge_arrays()
+    if nodes is None:
+        nodes = xrange(1, len(offsets))
+    name = names.__getitem__
+    for node in nodes:
+        start = offsets[node - 1]
+        end = offsets[node]
+        if start != end:
+            yield (
+                names[node],
+                ' '.join(map(name, targets[start:end])),
+            )
+
+def write_chunks(output_file, texts):
+    '''
+    Writes the strings texts to output_file, joining many
+    into each write.
+    '''
+    texts = iter(texts)
+    while True:
+        chunk = ''.join(
+            itertools.islice(texts, _chunk_rule_count),
+        )
+        if not chunk:
+            break
+        output_file.write(chunk)
+
+def write_makefile_rules(output_file, dag, names, nodes=None):
+    write_chunks(output_file, (
+        target + ': ' + dependencies
+            + '\n\t@head -n1 $^ >$@\n'
+        for (target, dependencies)
+        in rules(dag, names, nodes=nodes)
+    ))
+
+def write_build_ninja_rules(
+    output_file,
+    dag,
+    names,
+    nodes=None,
+):
+    write_chunks(output_file, (
+        'build ' + target + ': cp ' + dependencies + '\n'
+        for (target, dependencies)
+        in rules(dag, names, nodes=nodes)
+    ))
+
+def write_tupfile_rules(output_file, dag, names, nodes=None):
+    '''
+    nodes defaults to all of dag's nodes in level order.
+    '''
+    # Tup seems to require rules to be specified in
+    # topologically-sorted order.  That is, non-leaf nodes
+    # need the rule creating the node to preceed rules
+    # depending upon the node.
+    dag = dag.compact()
+    if nodes is None:
+        nodes = itertools.chain.from_iterable(dag.levels())
+    write_chunks(output_file, (
+        ': ' + dependencies + ' |> head -n1 %f >%o |> '
+            + target + '\n'
+        for (target, dependencies)
+        in rules(dag, names, nodes=nodes)
+    ))
+
+# file_name is the name of the manifest a builder reads,
+# which starts with header.  If rules are split across
+# several files, they are named by formatting
+# shard_file_name with each file's index, and included in
+# the manifest with lines formatted from include.
+# write_rules writes the rules of the given nodes.  If
+# ordered, rules must come after the rules of their
+# dependencies, even across files.
+ManifestFormat = collections.namedtuple('ManifestFormat', [
+    'file_name',
+    'header',
+    'include',
+    'ordered',
+    'shard_file_name',
+    'write_rules',
+])
+
+makefile_format = ManifestFormat(
+    file_name='GNUMakefile',
+    header='',
+    include='include {}\n',
+    ordered=False,
+    shard_file_name='rules-{}.mk',
+    write_rules=write_makefile_rules,
+)
+
+build_ninja_format = ManifestFormat(
+    file_name='build.ninja',
+    header=(
+        'ninja_required_version = 1.0\n'
+        'rule cp\n command = head -n1 $in >$out\n'
+    ),
+    include='subninja {}\n',
+    ordered=False,
+    shard_file_name='rules-{}.ninja',
+    write_rules=write_build_ninja_rules,
+)
+
+tupfile_format = ManifestFormat(
+    file_name='Tupfile',
+    header='',
+    include='include {}\n',
+    ordered=True,
+    shard_file_name='rules-{}.tup',
+    write_rules=write_tupfile_rules,
+)
+
+# (name, ManifestFormat) of every manifest format.
+manifest_formats = [
+    ('make', makefile_format),
+    ('ninja', build_ninja_format),
+    ('tup', tupfile_format),
+]
+
+# file_count is the number of files a manifest's rules are
+# split across, and sharding how rules are assigned to
+# files (see shard_nodes).
+ManifestLayout = collections.namedtuple('ManifestLayout', [
+    'file_count',
+    'sharding',
+])
+
+shardings = ['directory', 'hash', 'level']
+
+single_file_layout = ManifestLayout(
+    file_count=1,
+    sharding='level',
+)
+
+def parse_manifest_layout(string):
+    '''
+    Parses a ManifestLayout written as COUNT or
+    COUNT:SHARDING, such as '64:hash'.  Sharding defaults to
+    'level'.
+    '''
+    (file_count, _, sharding) = string.partition(':')
+    file_count = int(file_count)
+    if file_count < 1:
+        raise ValueError('Manifest file count must be positive')
+    sharding = sharding or 'level'
+    if sharding not in shardings:
+        raise ValueError(
+            'Unknown sharding: {}'.format(sharding),
+        )
+    if file_count == 1:
+        # Sharding one file is moot.
+        return single_file_layout
+    return ManifestLayout(
+        file_count=file_count,
+        sharding=sharding,
+    )
+
+def format_manifest_layout(layout):
+    '''
+    Returns layout as parse_manifest_layout accepts it.
+    '''
+    if layout.file_count == 1:
+        return '1'
+    return '{}:{}'.format(layout.file_count, layout.sharding)
+
+def manifest_layout_name(layout):
+    if layout.file_count == 1:
+        return '1 manifest'
+    return '{} manifests by {}'.format(
+        layout.file_count,
+        layout.sharding,
+    )
+
+# Knuth's multiplicative hash.
+_hash_multiplier = 2654435761
+
+def shard_nodes(dag, layout, names):
+    '''
+    Returns layout.file_count lists which together hold
+    every node of dag with dependencies, each in level
+    order.  Nodes are assigned to lists according to
+    layout.sharding:
+
+    level: the first list holds the lowest levels, and so
+    on, with lists of about equal length.
+
+    hash: pseudo-randomly, as when rules are listed by
+    unrelated components.
+
+    directory: nodes in the same directory (see names and
+    bss.nodelayouts) share a list, and neighbouring
+    directories' nodes neighbouring lists, as with a
+    manifest per directory or subtree.  If every node is
+    in one directory, ranges of consecutively numbered
+    nodes stand in for directories.
+    '''
+    dag = dag.compact()
+    file_count = layout.file_count
+    # Level 0 holds the leaves, which have no rules.
+    nodes = list(itertools.chain.from_iterable(
+        dag.levels()[1:],
+    ))
+    if layout.sharding == 'level':
+        return [
+            nodes[
+                len(nodes) * i // file_count
+                :len(nodes) * (i + 1) // file_count
+            ]
+            for i in xrange(file_count)
+        ]
+    if layout.sharding == 'hash':
+        def shard(node):
+            return (node * _hash_multiplier & 0xffffffff) \
+                * file_count >> 32
+    elif layout.sharding == 'directory':
+        directories = sorted({
+            os.path.dirname(names[node])
+            for node in nodes
+        })
+        if len(directories) == 1:
+            node_count = len(dag.all_nodes())
+            def shard(node):
+                return (node - 1) * file_count // node_count
+        else:
+            directory_indexes = {
+                directory: i
+                for (i, directory) in enumerate(directories)
+            }
+            def shard(node):
+                return directory_indexes[
+                    os.path.dirname(names[node])
+                ] * file_count // len(directories)
+    else:
+        raise Exception(
+            'Unknown sharding: {}'.format(layout.sharding),
+        )
+    shards = [[] for _ in xrange(file_count)]
+    for node in nodes:
+        shards[shard(node)].append(node)
+    return shards
+
+def supports_layout(manifest_format, layout):
+    '''
+    Returns whether write_manifest can split manifests in
+    manifest_format according to layout.
+    '''
+    return layout.file_count == 1 \
+        or not manifest_format.ordered \
+        or layout.sharding == 'level'
+
+def write_manifest(
+    directory,
+    manifest_format,
+    dag,
+    names,
+    layout=single_file_layout,
+):
+    '''
+    Writes the manifest of dag in manifest_format into
+    directory, split across files according to layout.
+    '''
+    if not supports_layout(manifest_format, layout):
+        raise Exception(
+            '{} rules must be in dependency order, so can '
+            'only be sharded by level'.format(
+                manifest_format.file_name,
+            ),
+        )
+    # Compacting is not cached, so do it once rather than
+    # once per file.
+    dag = dag.compact()
+    with open(
+        os.path.join(directory, manifest_format.file_name),
+        'w',
+    ) as manifest_file:
+        manifest_file.write(manifest_format.header)
+        if layout.file_count == 1:
+            manifest_format.write_rules(
+                manifest_file,
+                dag=dag,
+                names=names,
+            )
+            return
+        for (index, nodes) \
+                in enumerate(shard_nodes(dag, layout, names)):
+            shard_file_name \
+                = manifest_format.shard_file_name.format(index)
+            manifest_file.write(
+                manifest_format.include.format(
+                    shard_file_name,
+                ),
+            )
+            with open(
+                os.path.join(directory, shard_file_name),
+                'w',
+            ) as shard_file:
+                manifest_format.write_rules(
+                    shard_file,
+                    dag=dag,
+                    names=names,
+                    nodes=nodes,
+                )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures manifest generation speed',
+    )
+    parser.add_argument(
+        '--nodes',
+        default=100000,
+        dest='node_count',
+        help='Number of nodes in the (power-law) graph',
+        metavar='NODES',
+        type=int,
+    )
+    parser.add_argument(
+        '--edges-per-node',
+        default=10.0,
+        dest='edges_per_node',
+        help='Average number of dependencies per node',
+        metavar='EDGES',
+        type=float,
+    )
+    parser.add_argument(
+        '--output-dir',
+        default=None,
+        dest='output_dir',
+        help=(
+            'Directory to write manifests into (default: '
+            'a temporary directory)'
+        ),
+        metavar='DIR',
+    )
+    parser.add_argument(
+        '--manifest-layout',
+        default=single_file_layout,
+        dest='layout',
+        help=(
+            'Number of files to split rules across, '
+            'optionally followed by a colon and how to '
+            'assign rules to files ({})'.format(
+                ', '.join(shardings),
+            )
+        ),
+        metavar='COUNT[:SHARDING]',
+        type=parse_manifest_layout,
+    )
+    parser.add_argument(
+        '--node-layout',
+        default=bss.nodelayouts.flat_node_layout,
+        dest='node_layout',
+        help=(
+            "Directories to place nodes in: 'flat', or "
+            'SCHEME:DEPTHxWIDTH with a scheme of {}'.format(
+                ', '.join(bss.nodelayouts.node_layout_schemes),
+            )
+        ),
+        metavar='LAYOUT',
+        type=bss.nodelayouts.parse_node_layout,
+    )
+    args = parser.parse_args()
+
+    start = bss.util.get_time()
+    dag = bss.dags.PowerLawDAG(
+        edge_count=int(args.node_count * args.edges_per_node),
+        node_count=args.node_count,
+    ).compact()
+    dag.levels()
+    edge_count = dag.edge_count()
+    names = bss.nodelayouts.node_names(dag, args.node_layout)
+    sys.stdout.write(
+        '{} nodes, {} edges, generated in {:.2f} s\n'.format(
+            args.node_count,
+            edge_count,
+            bss.util.get_time() - start,
+        ),
+    )
+
+    with bss.util.temporary_directory() as temp_dir:
+        output_dir = args.output_dir or temp_dir
+        for (format_name, manifest_format) \
+                in manifest_formats:
+            if manifest_format.ordered \
+                    and args.layout.sharding != 'level':
+                continue
+            format_dir = os.path.join(output_dir, format_name)
+            os.mkdir(format_dir)
+            start = bss.util.get_time()
+            write_manifest(
+                format_dir,
+                dag=dag,
+                layout=args.layout,
+                manifest_format=manifest_format,
+                names=names,
+            )
+            seconds = bss.util.get_time() - start
+            sys.stdout.write(
+                '{:<6} {:8.2f} s {:12.0f} edges/s '
+                '{:8.1f} MiB\n'.format(
+                    format_name,
+                    seconds,
+                    edge_count / seconds,
+                    bss.util.directory_size(format_dir)
+                        / 1048576.0,
+                ),
+            )
+
+class TestManifests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def manifest_files(self, manifest_format, dag, layout):
+        '''
+        Returns a dict from the names of the files written
+        to their contents.
+        '''
+        write_manifest(
+            self.temp_dir,
+            dag=dag,
+            layout=layout,
+            manifest_format=manifest_format,
+            names=bss.nodelayouts.node_names(dag),
+        )
+        files = {}
+        for file_name in os.listdir(self.temp_dir):
+            path = os.path.join(self.temp_dir, file_name)
+            with open(path, 'r') as manifest_file:
+                files[file_name] = manifest_file.read()
+            os.remove(path)
+        return files
+
+    def test_formats(self):
+        # 1 depends upon 2 and 3; 3 depends upon 2.
+        dag = bss.dags.CompactDAG(
+            edge_offsets=[0, 2, 2, 3],
+            edge_targets=[2, 3, 2],
+        )
+        for (manifest_format, text) in [
+            (
+                makefile_format,
+                '1: 2 3\n\t@head -n1 $^ >$@\n'
+                '3: 2\n\t@head -n1 $^ >$@\n',
+            ),
+            (
+                build_ninja_format,
+                'ninja_required_version = 1.0\n'
+                'rule cp\n command = head -n1 $in >$out\n'
+                'build 1: cp 2 3\n'
+                'build 3: cp 2\n',
+            ),
+            (
+                tupfile_format,
+                ': 2 |> head -n1 %f >%o |> 3\n'
+                ': 2 3 |> head -n1 %f >%o |> 1\n',
+            ),
+        ]:
+            self.assertEqual(
+                self.manifest_files(
+                    manifest_format,
+                    dag=dag,
+                    layout=single_file_layout,
+                ),
+                {manifest_format.file_name: text},
+            )
+
+    def test_many_chunks(self):
+        dag = bss.dags.LinearDAG(_chunk_rule_count * 2 + 10)
+        makefile = self.manifest_files(
+            makefile_format,
+            dag=dag,
+            layout=single_file_layout,
+        )['GNUMakefile']
+        self.assertEqual(
+            makefile.count('\n'),
+            (len(dag.all_nodes()) - 1) * 2,
+        )
+        self.assertTrue(makefile.startswith('1: 2\n'))
+        self.assertTrue(makefile.endswith(
+            '{}: {}\n\t@head -n1 $^ >$@\n'.format(
+                len(dag.all_nodes()) - 1,
+                len(dag.all_nodes()),
+            ),
+        ))
+
+    def test_shard_nodes(self):
+        dag = bss.dags.UniformFanOutDAG(depth=4, fan_out=2)
+        names = bss.nodelayouts.node_names(dag)
+        # Nodes with dependencies, in level order.
+        nodes = [4, 5, 6, 7, 2, 3, 1]
+        for sharding in shardings:
+            shards = shard_nodes(
+                dag,
+                ManifestLayout(file_count=3, sharding=sharding),
+                names,
+            )
+            self.assertEqual(len(shards), 3)
+            self.assertItemsEqual(sum(shards, []), nodes)
+            for shard in shards:
+                self.assertEqual(
+                    shard,
+                    sorted(shard, key=nodes.index),
+                )
+        self.assertEqual(
+            shard_nodes(
+                dag,
+                ManifestLayout(file_count=3, sharding='level'),
+                names,
+            ),
+            [[4, 5], [6, 7], [2, 3, 1]],
+        )
+        self.assertEqual(
+            shard_nodes(
+                dag,
+                parse_manifest_layout('3:directory'),
+                names,
+            ),
+            [[4, 5, 2, 3, 1], [6, 7], []],
+        )
+        # Each subtree of the DAG gets a directory, and so a
+        # file.
+        node_layout = bss.nodelayouts \
+            .parse_node_layout('dag:1x3')
+        self.assertEqual(
+            shard_nodes(
+                dag,
+                parse_manifest_layout('3:directory'),
+                bss.nodelayouts.node_names(dag, node_layout),
+            ),
+            [[4, 2, 1], [5, 6, 3], [7]],
+        )
+
+    def test_split_manifest(self):
+        dag = bss.dags.LinearDAG(4)
+        files = self.manifest_files(
+            build_ninja_format,
+            dag=dag,
+            layout=parse_manifest_layout('2:level'),
+        )
+        self.assertEqual(files, {
+            'build.ninja': build_ninja_format.header
+                + 'subninja rules-0.ninja\n'
+                + 'subninja rules-1.ninja\n',
+            'rules-0.ninja': 'build 3: cp 4\n',
+            'rules-1.ninja': 'build 2: cp 3\nbuild 1: cp 2\n',
+        })
+        with self.assertRaises(Exception):
+            self.manifest_files(
+                tupfile_format,
+                dag=dag,
+                layout=parse_manifest_layout('2:hash'),
+            )
+
+    def test_split_manifest_compacts_once(self):
+        compactions = []
+        class CountingDAG(bss.dags.LinearDAG):
+            def compact(self):
+                compactions.append(self)
+                return super(CountingDAG, self).compact()
+        files = self.manifest_files(
+            build_ninja_format,
+            dag=CountingDAG(10),
+            layout=parse_manifest_layout('4:hash'),
+        )
+        self.assertEqual(len(files), 5)
+        self.assertEqual(len(compactions), 1)
+
+    def test_parse_manifest_layout(self):
+        self.assertEqual(
+            parse_manifest_layout('8'),
+            ManifestLayout(file_count=8, sharding='level'),
+        )
+        self.assertEqual(
+            parse_manifest_layout('1:hash'),
+            single_file_layout,
+        )
+        for string in ['1', '8:level', '64:hash']:
+            self.assertEqual(
+                format_manifest_layout(
+                    parse_manifest_layout(string),
+                ),
+                string,
+            )
+        for string in ['0', '4:alphabetical', 'x']:
+            with self.assertRaises(ValueError):
+                parse_manifest_layout(string)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python2.7
+
+'''
+Placement of a DAG's nodes in a workspace's directories.
+
+Real source trees spread their files over many nested
+directories.  Putting every node of a large DAG directly in
+the workspace instead gives one directory hundreds of
+thousands of entries, which skews the cost of every stat
+and readdir a builder makes.  A NodeLayout places each node
+in one of width ** depth nested directories, so builders
+can be measured on realistic trees.
+'''
+
+import array
+import bss.dags
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+# scheme is how nodes are assigned to directories (see
+# node_directory_indexes), which are depth levels deep with
+# width subdirectories in every directory above them.
+NodeLayout = collections.namedtuple('NodeLayout', [
+    'depth',
+    'scheme',
+    'width',
+])
+
+# flat: every node directly in the workspace.
+#
+# hash: pseudo-randomly, as when files are spread over
+# directories with no regard to their dependencies.
+#
+# dag: nodes in a depth-first walk from the roots fill
+# directories in order, so a node's dependencies are mostly
+# in its own directory or the following ones, as in a
+# project whose components each live in their own subtree.
+node_layout_schemes = ['dag', 'flat', 'hash']
+
+flat_node_layout = NodeLayout(
+    depth=0,
+    scheme='flat',
+    width=1,
+)
+
+# Bound on width ** depth, so a typo can't fill the disk
+# with empty directories.
+max_directory_count = 2 ** 20
+
+def parse_node_layout(string):
+    '''
+    Parses a NodeLayout written as 'flat' or
+    SCHEME:DEPTHxWIDTH, such as 'hash:2x16'.
+    '''
+    (scheme, _, shape) = string.partition(':')
+    if scheme not in node_layout_schemes:
+        raise ValueError(
+            'Unknown node layout scheme: {}'.format(scheme),
+        )
+    if scheme == 'flat':
+        if shape:
+            raise ValueError('Flat node layouts have no shape')
+        return flat_node_layout
+    (depth, _, width) = shape.partition('x')
+    depth = int(depth)
+    width = int(width)
+    if depth < 1 or width < 2:
+        raise ValueError(
+            'Node directories need a depth of at least 1 '
+            'and a width of at least 2',
+        )
+    if width ** depth > max_directory_count:
+        raise ValueError(
+            'Too many node directories: {}'
+            .format(width ** depth),
+        )
+    return NodeLayout(depth=depth, scheme=scheme, width=width)
+
+def format_node_layout(layout):
+    '''
+    Returns layout as parse_node_layout accepts it.
+    '''
+    if layout.scheme == 'flat':
+        return 'flat'
+    return '{}:{}x{}'.format(
+        layout.scheme,
+        layout.depth,
+        layout.width,
+    )
+
+def node_layout_name(layout):
+    if layout.scheme == 'flat':
+        return 'flat nodes'
+    return 'nodes in {}x{} {} directories'.format(
+        layout.depth,
+        layout.width,
+        layout.scheme,
+    )
+
+def directories(layout):
+    '''
+    Returns the relative paths of layout's innermost
+    directories, in order.
+    '''
+    paths = ['']
+    for _ in xrange(layout.depth):
+        paths = [
+            os.path.join(path, 'd{}'.format(i))
+            for path in paths
+            for i in xrange(layout.width)
+        ]
+    return paths
+
+# Knuth's multiplicative hash.
+_hash_multiplier = 2654435761
+
+def depth_first_order(dag):
+    '''
+    Returns an array of dag's nodes in the order a
+    depth-first walk from its roots first visits them.
+    '''
+    dag = dag.compact()
+    (offsets, targets) = dag.edge_arrays()
+    visited = bytearray(len(offsets))
+    order = array.array('I')
+    for root in dag.root_nodes():
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if visited[node]:
+                continue
+            visited[node] = 1
+            order.append(node)
+            # Visit the first dependency first.
+            stack.extend(reversed(
+                targets[offsets[node - 1]:offsets[node]],
+            ))
+    return order
+
+def node_directory_indexes(dag, layout):
+    '''
+    Returns an array whose element node is the index in
+    directories(layout) of the directory holding dag's
+    node.  Element 0 is unused.
+    '''
+    node_count = len(dag.all_nodes())
+    directory_count = layout.width ** layout.depth
+    indexes = array.array('I', [0]) * (node_count + 1)
+    if layout.scheme == 'flat':
+        pass
+    elif layout.scheme == 'hash':
+        for node in xrange(1, node_count + 1):
+            indexes[node] = (
+                node * _hash_multiplier & 0xffffffff
+            ) * directory_count >> 32
+    elif layout.scheme == 'dag':
+        for (i, node) in enumerate(depth_first_order(dag)):
+            indexes[node] = i * directory_count // node_count
+    else:
+        raise Exception(
+            'Unknown node layout scheme: {}'
+            .format(layout.scheme),
+        )
+    return indexes
+
+def node_names(dag, layout=flat_node_layout):
+    '''
+    Returns a list whose element node is the path of dag's
+    node relative to the workspace, as named in manifests.
+    Element 0 is unused.
+    '''
+    if layout.scheme == 'flat':
+        return map(str, xrange(len(dag.all_nodes()) + 1))
+    prefixes = [
+        path + '/'
+        for path in directories(layout)
+    ]
+    names = [
+        prefixes[index] + str(node)
+        for (node, index) in enumerate(
+            node_directory_indexes(dag, layout),
+        )
+    ]
+    names[0] = '0'
+    return names
+
+def create_directories(temp_dir, layout):
+    for path in directories(layout):
+        if path:
+            os.makedirs(os.path.join(temp_dir, path))
+
+class TestNodeLayouts(unittest.TestCase):
+    def test_parse_node_layout(self):
+        for string in ['flat', 'hash:2x16', 'dag:3x8']:
+            self.assertEqual(
+                format_node_layout(parse_node_layout(string)),
+                string,
+            )
+        self.assertEqual(
+            parse_node_layout('dag:1x4'),
+            NodeLayout(depth=1, scheme='dag', width=4),
+        )
+        for string in [
+            'flat:1x2',
+            'hash',
+            'hash:0x4',
+            'hash:2x1',
+            'hash:2',
+            'tree:2x2',
+            'hash:20x4',
+        ]:
+            with self.assertRaises(ValueError):
+                parse_node_layout(string)
+
+    def test_directories(self):
+        self.assertEqual(directories(flat_node_layout), [''])
+        self.assertEqual(
+            directories(parse_node_layout('hash:2x2')),
+            ['d0/d0', 'd0/d1', 'd1/d0', 'd1/d1'],
+        )
+
+    def test_flat(self):
+        dag = bss.dags.LinearDAG(3)
+        self.assertEqual(node_names(dag)[1:], ['1', '2', '3'])
+
+    def test_hash(self):
+        dag = bss.dags.UniformFanOutDAG(depth=6, fan_out=2)
+        layout = parse_node_layout('hash:2x2')
+        names = node_names(dag, layout)
+        self.assertEqual(names[5], 'd0/d0/5')
+        self.assertEqual(
+            {os.path.dirname(name) for name in names[1:]},
+            set(directories(layout)),
+        )
+
+    def test_dag(self):
+        # 1 depends on 2 and 3, 2 on 4 and 5, and 3 on 6
+        # and 7, so each subtree gets a directory.
+        dag = bss.dags.UniformFanOutDAG(depth=3, fan_out=2)
+        self.assertEqual(
+            list(depth_first_order(dag)),
+            [1, 2, 4, 5, 3, 6, 7],
+        )
+        names = node_names(dag, parse_node_layout('dag:1x2'))
+        self.assertEqual(names[1:], [
+            'd0/1',
+            'd0/2',
+            'd1/3',
+            'd0/4',
+            'd0/5',
+            'd1/6',
+            'd1/7',
+        ])
+
+    def test_create_directories(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            create_directories(
+                temp_dir,
+                parse_node_layout('dag:2x3'),
+            )
+            self.assertItemsEqual(
+                os.listdir(os.path.join(temp_dir, 'd2')),
+                ['d0', 'd1', 'd2'],
+            )
+        finally:
+            shutil.rmtree(temp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
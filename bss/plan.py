@@ -0,0 +1,364 @@
+#!/usr/bin/env python2.7
+
+'''
+Planning of sweeps within a time budget.
+
+A sweep's cost is estimated per configuration, either by
+probing (running a few iterations of each configuration) or
+from prior results.  Iterations are then allocated to
+configurations so the overall uncertainty of the measured
+medians is minimised within the budget.
+'''
+
+import bss.manifests
+import bss.nodelayouts
+import bss.run
+import bss.stats
+import bss.util
+import collections
+import math
+import unittest
+
+# iteration_cost is the wall-clock time in seconds of one
+# iteration, including untimed set-up.  relative_spread is
+# the standard deviation of build times relative to their
+# mean.
+Estimate = collections.namedtuple('Estimate', [
+    'iteration_cost',
+    'relative_spread',
+])
+
+ConfigurationPlan = collections.namedtuple(
+    'ConfigurationPlan',
+    [
+        'configuration',
+        'edge_count',
+        'estimate',
+        'iterations',
+        'node_count',
+    ],
+)
+
+# Assumed relative spread of configurations with too few
+# samples to estimate one, and lower bound on estimated
+# spreads.
+_default_relative_spread = 0.05
+_min_relative_spread = 0.005
+
+def estimate_from_times(iteration_cost, times):
+    times = list(times)
+    if len(times) < 2:
+        relative_spread = _default_relative_spread
+    else:
+        mean = bss.stats.mean(times)
+        variance = sum((t - mean) ** 2 for t in times) \
+            / (len(times) - 1)
+        relative_spread = math.sqrt(variance) / mean \
+            if mean > 0 else _default_relative_spread
+    return Estimate(
+        iteration_cost=iteration_cost,
+        relative_spread=max(
+            relative_spread,
+            _min_relative_spread,
+        ),
+    )
+
+def estimates_from_runs(runs):
+    '''
+    Estimates the cost of configurations from previously
+    measured Runs (for example, from a bss.journal),
+    returning a dict from bss.run.configuration_key to
+    Estimate.
+
+    Runs only record build times, so costs exclude
+    untimed set-up and are underestimates.
+    '''
+    key_times = collections.defaultdict(list)
+    for run in runs:
+        key_times[bss.run.configuration_key(run)] \
+            .append(run.measurement)
+    return {
+        key: estimate_from_times(
+            iteration_cost=bss.stats.mean(times),
+            times=times,
+        )
+        for (key, times) in key_times.iteritems()
+    }
+
+def probe_configurations(
+    args,
+    configurations,
+    registry,
+    iterations=2,
+    skipped_keys=frozenset(),
+):
+    '''
+    Runs a few iterations of every Configuration of
+    configurations (see bss.run.configurations), returning
+    a dict from bss.run.configuration_key to Estimate, and
+    releases each from registry.
+
+    Configurations whose keys are in skipped_keys are not
+    probed.
+    '''
+    estimates = {}
+    for configuration in configurations:
+        dag_key = bss.run.configuration_dag_key(configuration)
+        key = bss.run.configuration_key(configuration)
+        if key in skipped_keys:
+            registry.release(dag_key)
+            continue
+        start = bss.util.get_time()
+        measurements = bss.run.measure_configuration(
+            args=args,
+            builder=configuration.builder,
+            dag=registry.get(dag_key),
+            iterations=iterations,
+            jobs=configuration.jobs,
+            manifest_layout=configuration.manifest_layout,
+            node_layout=configuration.node_layout,
+            setup=configuration.setup,
+        )
+        end = bss.util.get_time()
+        registry.release(dag_key)
+        estimates[key] = estimate_from_times(
+            iteration_cost=(end - start) / iterations,
+            times=[m.time for m in measurements],
+        )
+    return estimates
+
+def allocate_iterations(
+    estimates,
+    budget,
+    warmup_iterations=0,
+    min_iterations=1,
+    max_iterations=None,
+):
+    '''
+    Allocates measured iterations to configurations.
+
+    estimates maps keys to Estimates.  Returns a dict from
+    the same keys to iteration counts.
+
+    The sum of squared relative standard errors,
+    sum(spread ** 2 / iterations), is minimised subject to
+    sum(cost * iterations) <= budget, giving iterations
+    proportional to spread / sqrt(cost).  Every
+    configuration gets at least min_iterations, even if the
+    budget is exceeded.
+    '''
+    if not estimates:
+        return {}
+    budget -= sum(
+        estimate.iteration_cost * warmup_iterations
+        for estimate in estimates.itervalues()
+    )
+    normalizer = sum(
+        estimate.relative_spread
+            * math.sqrt(estimate.iteration_cost)
+        for estimate in estimates.itervalues()
+    )
+    allocation = {}
+    for (key, estimate) in estimates.iteritems():
+        if normalizer > 0 and budget > 0:
+            share = estimate.relative_spread \
+                / math.sqrt(max(estimate.iteration_cost, 1e-9))
+            # Round first so exact fits aren't lost to
+            # floating-point error.
+            iterations = int(round(
+                budget * share / normalizer,
+                6,
+            ))
+        else:
+            iterations = 0
+        iterations = max(iterations, min_iterations)
+        if max_iterations is not None:
+            iterations = min(iterations, max_iterations)
+        allocation[key] = iterations
+    return allocation
+
+def plan_configurations(
+    args,
+    configurations,
+    registry,
+    estimates,
+    budget=None,
+):
+    '''
+    Returns a ConfigurationPlan for every Configuration of
+    configurations (see bss.run.configurations), and
+    releases each from registry.
+
+    If budget is given, iterations of configurations with
+    estimates are allocated within budget seconds;
+    otherwise each configuration gets args.iterations.
+    '''
+    configuration_sizes = []
+    for configuration in configurations:
+        dag_key = bss.run.configuration_dag_key(configuration)
+        dag = registry.get(dag_key)
+        configuration_sizes.append((
+            configuration,
+            bss.run.configuration_key(configuration),
+            len(dag.all_nodes()),
+            dag.edge_count(),
+        ))
+        registry.release(dag_key)
+
+    allocation = {}
+    if budget is not None:
+        allocation = allocate_iterations(
+            estimates={
+                key: estimates[key]
+                for (_, key, _, _) in configuration_sizes
+                if key in estimates
+            },
+            budget=budget * args.workers,
+            max_iterations=args.max_iterations,
+            warmup_iterations=args.warmup_iterations,
+        )
+    return [
+        ConfigurationPlan(
+            configuration=configuration,
+            edge_count=edge_count,
+            estimate=estimates.get(key),
+            iterations=allocation.get(key, args.iterations),
+            node_count=node_count,
+        )
+        for (configuration, key, node_count, edge_count)
+        in configuration_sizes
+    ]
+
+def expected_time(plan, args):
+    '''
+    Returns the expected wall-clock time in seconds of
+    running plan's configuration, or None if unknown.
+    '''
+    if plan.estimate is None:
+        return None
+    return plan.estimate.iteration_cost \
+        * (plan.iterations + args.warmup_iterations)
+
+def write_plan(plans, args, output_file):
+    columns = [
+        'Builder',
+        'DAG',
+        'Variable',
+        'Scenario',
+        'Jobs',
+        'Manifests',
+        'Node layout',
+        'Nodes',
+        'Edges',
+        'Iterations',
+        'Expected (s)',
+    ]
+    rows = []
+    total_time = 0
+    unknown_count = 0
+    for plan in plans:
+        time = expected_time(plan, args)
+        if time is None:
+            unknown_count += 1
+        else:
+            total_time += time
+        rows.append([
+            plan.configuration.builder.shortname,
+            plan.configuration.dag_set.shortname,
+            str(plan.configuration.variable),
+            plan.configuration.setup.shortname,
+            str(plan.configuration.jobs),
+            bss.manifests.format_manifest_layout(
+                plan.configuration.manifest_layout,
+            ),
+            bss.nodelayouts.format_node_layout(
+                plan.configuration.node_layout,
+            ),
+            str(plan.node_count),
+            str(plan.edge_count),
+            str(plan.iterations),
+            '?' if time is None else '{:.1f}'.format(time),
+        ])
+    widths = [
+        max(len(row[i]) for row in [columns] + rows)
+        for i in xrange(len(columns))
+    ]
+    for row in [columns] + rows:
+        output_file.write('  '.join(
+            cell.ljust(width)
+            for (cell, width) in zip(row, widths)
+        ).rstrip() + '\n')
+    output_file.write(
+        '\nExpected total: {:.1f} s over {} worker(s)\n'
+        .format(total_time / args.workers, args.workers),
+    )
+    if unknown_count:
+        output_file.write((
+            '({} configuration(s) have no estimate; '
+            'running with --time-budget probes them)\n'
+        ).format(unknown_count))
+
+class TestAllocateIterations(unittest.TestCase):
+    def test_cheap_noisy_configurations_get_more(self):
+        allocation = allocate_iterations(
+            budget=100,
+            estimates={
+                'cheap': Estimate(
+                    iteration_cost=1,
+                    relative_spread=0.1,
+                ),
+                'expensive': Estimate(
+                    iteration_cost=4,
+                    relative_spread=0.1,
+                ),
+                'steady': Estimate(
+                    iteration_cost=1,
+                    relative_spread=0.01,
+                ),
+            },
+        )
+        self.assertGreater(
+            allocation['cheap'],
+            allocation['expensive'],
+        )
+        self.assertGreater(
+            allocation['cheap'],
+            allocation['steady'],
+        )
+        self.assertLessEqual(
+            allocation['cheap'] * 1
+                + allocation['expensive'] * 4
+                + allocation['steady'] * 1,
+            100,
+        )
+
+    def test_bounds(self):
+        estimates = {
+            'a': Estimate(
+                iteration_cost=10,
+                relative_spread=0.1,
+            ),
+        }
+        self.assertEqual(
+            allocate_iterations(estimates, budget=1),
+            {'a': 1},
+        )
+        self.assertEqual(
+            allocate_iterations(
+                estimates,
+                budget=1000,
+                max_iterations=20,
+            ),
+            {'a': 20},
+        )
+        self.assertEqual(
+            allocate_iterations(
+                estimates,
+                budget=100,
+                warmup_iterations=2,
+            ),
+            {'a': 8},
+        )
+
+if __name__ == '__main__':
+    unittest.main()
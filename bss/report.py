@@ -1,8 +1,10 @@
 import bss.gnuplot
+import bss.manifests
+import bss.nodelayouts
+import bss.stats
 import bss.util
 import collections
 import contextlib
-import os
 import sys
 import tempfile
 import xml.etree.ElementTree as ET
@@ -17,27 +19,103 @@ def e(string):
 
 _y_label = 'Time (seconds)'
 
+# (Run field, label) for each resource measured alongside
+# time.
+_resource_metrics = [
+    ('user_time', 'User CPU time (seconds)'),
+    ('system_time', 'System CPU time (seconds)'),
+    ('max_rss', 'Maximum resident set size (bytes)'),
+    ('minor_page_faults', 'Minor page faults'),
+    ('major_page_faults', 'Major page faults'),
+    (
+        'voluntary_context_switches',
+        'Voluntary context switches',
+    ),
+    (
+        'involuntary_context_switches',
+        'Involuntary context switches',
+    ),
+    ('block_inputs', 'Block inputs'),
+    ('block_outputs', 'Block outputs'),
+]
+
+# Resource metrics which get their own plots.  The rest are
+# only tabulated.
+_plotted_resource_metrics = [
+    'user_time',
+    'system_time',
+    'max_rss',
+    'minor_page_faults',
+]
+
+def series_name(
+    builder,
+    jobs,
+    show_jobs,
+    manifest_layout=bss.manifests.single_file_layout,
+    show_manifest_layouts=False,
+    node_layout=bss.nodelayouts.flat_node_layout,
+    show_node_layouts=False,
+):
+    name = builder.name
+    if show_jobs:
+        name += ' -j{}'.format(jobs)
+    if show_manifest_layouts:
+        name += ' ({})'.format(
+            bss.manifests.manifest_layout_name(manifest_layout),
+        )
+    if show_node_layouts:
+        name += ' ({})'.format(
+            bss.nodelayouts.node_layout_name(node_layout),
+        )
+    return name
+
 def make_run_plot_datas(runs):
     '''
     Turns a list of Runs into nested dicts:
 
-    dag_set => setup => builder => runs
+    dag_set => setup => series name => runs
+
+    Each series is a builder and, if more than one of each
+    was measured, a job count, a manifest layout, and a
+    node layout.
     '''
+    runs = list(runs)
+    show_jobs = len({run.jobs for run in runs}) > 1
+    show_manifest_layouts \
+        = len({run.manifest_layout for run in runs}) > 1
+    show_node_layouts \
+        = len({run.node_layout for run in runs}) > 1
     datas = collections.defaultdict(
         lambda: collections.defaultdict(
             lambda: collections.defaultdict(list),
         ),
     )
     for run in runs:
-        datas[run.dag_set][run.setup][run.builder] \
-            .append(run)
+        series = series_name(
+            builder=run.builder,
+            jobs=run.jobs,
+            manifest_layout=run.manifest_layout,
+            node_layout=run.node_layout,
+            show_jobs=show_jobs,
+            show_manifest_layouts=show_manifest_layouts,
+            show_node_layouts=show_node_layouts,
+        )
+        datas[run.dag_set][run.setup][series].append(run)
     return datas
 
-def multiplot(run_plot_datas, dag_set, plot_file, args):
+def multiplot_series(
+    setup_series_points,
+    plot_file,
+    args,
+    x_label,
+    y_label,
+):
     '''
-    run_plot_datas is a dict of:
+    Plots one plot per setup.  setup_series_points is a
+    dict of:
 
-    setup ==> builder => runs
+    setup => series name => [(x, y), ...]
     '''
 
     # Shift all the plots up to make room for the
@@ -50,7 +128,7 @@ def multiplot(run_plot_datas, dag_set, plot_file, args):
             (
                 'layout',
                 bss.gnuplot.layout_for_plot_count(
-                    len(run_plot_datas),
+                    len(setup_series_points),
                 ),
             ),
             ('scale', (scale_factor, scale_factor)),
@@ -59,7 +137,8 @@ def multiplot(run_plot_datas, dag_set, plot_file, args):
     )
 
     first = True
-    for (setup, builder_runs) in run_plot_datas.iteritems():
+    for (setup, series_points) \
+            in setup_series_points.iteritems():
         if first:
             # Show the first plot's legend at the
             # bottom.
@@ -70,23 +149,459 @@ def multiplot(run_plot_datas, dag_set, plot_file, args):
             first = False
         plot_file.write_plot(
             title=setup.name(args),
-            x_label=dag_set.variable_label,
-            y_label=_y_label,
-            series_points={
-                builder.name: [
+            x_label=x_label,
+            y_label=y_label,
+            series_points=series_points,
+        )
+        plot_file.write_set('key', False)
+
+    plot_file.write_unset('multiplot')
+
+def multiplot(
+    run_plot_datas,
+    dag_set,
+    plot_file,
+    args,
+    metric='measurement',
+    y_label=_y_label,
+):
+    '''
+    run_plot_datas is a dict of:
+
+    setup ==> series name => runs
+
+    metric is the name of the Run field to plot.
+    '''
+    multiplot_series(
+        args=args,
+        plot_file=plot_file,
+        setup_series_points=collections.OrderedDict(
+            (
+                setup,
+                {
+                    series: [
+                        (
+                            run.variable,
+                            getattr(run, metric),
+                        )
+                        for run in runs
+                    ]
+                    for (series, runs)
+                    in series_runs.iteritems()
+                },
+            )
+            for (setup, series_runs)
+            in run_plot_datas.iteritems()
+        ),
+        x_label=dag_set.variable_label,
+        y_label=y_label,
+    )
+
+def ideal_speedup(work, span, jobs):
+    '''
+    Returns the greatest speedup with jobs jobs over one
+    job of a build with work actions, span of which are on
+    its critical path (see bss.dags.DAG.work_and_span).
+    '''
+    if span == 0:
+        return 1
+    return min(jobs, float(work) / span)
+
+def write_structure_section(dag_set, html_file, runs):
+    '''
+    Tabulates and plots the structure of every DAG in runs
+    (see bss.analytics).
+    '''
+    all_analytics = {}
+    for run in runs:
+        all_analytics[run.variable] = run.dag_analytics
+    variable_analytics = sorted(all_analytics.iteritems())
+
+    html_file.write('''<table>
+<caption>Structure</caption>
+<thead>
+<tr>
+    <th>{variable}</th>
+    <th>Nodes</th>
+    <th>Edges</th>
+    <th>Roots</th>
+    <th>Leaves</th>
+    <th>Actions</th>
+    <th>Critical path</th>
+    <th>Speedup bound</th>
+    <th>Widest level</th>
+    <th>Max in-degree</th>
+    <th>Max out-degree</th>
+    <th>Redundant edges</th>
+</tr>
+</thead>
+<tbody>
+'''.format(variable=e(dag_set.variable_label)))
+    for (variable, analytics) in variable_analytics:
+        if analytics.redundant_edge_count is None:
+            redundant = '(too large)'
+        else:
+            redundant = analytics.redundant_edge_count
+        html_file.write('<tr>\n' + ''.join(
+            '    <td>{}</td>\n'.format(e(value))
+            for value in [
+                variable,
+                analytics.node_count,
+                analytics.edge_count,
+                analytics.root_count,
+                analytics.leaf_count,
+                analytics.work,
+                analytics.critical_path_length,
+                '{:.1f}'.format(analytics.speedup_bound),
+                max(analytics.level_widths or [0]),
+                max(analytics.in_degree_histogram or [0]),
+                max(analytics.out_degree_histogram or [0]),
+                redundant,
+            ]
+        ) + '</tr>\n')
+    html_file.write('</tbody>\n</table>\n')
+
+    for (title, x_label, points) in [
+        (
+            'Level widths',
+            'Level (longest path to a leaf)',
+            lambda analytics: list(
+                enumerate(analytics.level_widths),
+            ),
+        ),
+        (
+            'In-degree distribution',
+            'In-degree',
+            lambda analytics: sorted(
+                analytics.in_degree_histogram.iteritems(),
+            ),
+        ),
+        (
+            'Out-degree distribution',
+            'Out-degree',
+            lambda analytics: sorted(
+                analytics.out_degree_histogram.iteritems(),
+            ),
+        ),
+    ]:
+        with html_plot_file(html_file, encoding='utf-8') \
+                as plot_file:
+            plot_file.write_plot(
+                series_points=collections.OrderedDict(
+                    (
+                        '{} {}'.format(
+                            dag_set.variable_label,
+                            variable,
+                        ),
+                        points(analytics),
+                    )
+                    for (variable, analytics)
+                    in variable_analytics
+                ),
+                title=title,
+                x_label=x_label,
+                y_label='Nodes',
+            )
+
+def write_speedup_section(args, dag_set, html_file, runs):
+    '''
+    Plots the speedup and parallel efficiency of each
+    builder for every DAG in runs, relative to the
+    smallest job count measured.  For setups which build
+    every node, the ideal speedup of a full build, limited
+    by the DAG's critical path, is plotted for reference.
+    '''
+    job_counts = sorted({run.jobs for run in runs})
+    if len(job_counts) < 2:
+        return
+    base_jobs = job_counts[0]
+    show_manifest_layouts \
+        = len({run.manifest_layout for run in runs}) > 1
+    show_node_layouts \
+        = len({run.node_layout for run in runs}) > 1
+    # variable => setup => series name => jobs =>
+    # measurements
+    times = collections.defaultdict(
+        lambda: collections.defaultdict(
+            lambda: collections.defaultdict(
+                lambda: collections.defaultdict(list),
+            ),
+        ),
+    )
+    all_analytics = {}
+    for run in runs:
+        series = series_name(
+            builder=run.builder,
+            jobs=run.jobs,
+            manifest_layout=run.manifest_layout,
+            node_layout=run.node_layout,
+            show_jobs=False,
+            show_manifest_layouts=show_manifest_layouts,
+            show_node_layouts=show_node_layouts,
+        )
+        times[run.variable][run.setup][series] \
+            [run.jobs].append(run.measurement)
+        all_analytics[run.variable] = run.dag_analytics
+
+    for variable in sorted(times):
+        analytics = all_analytics[variable]
+        work = analytics.work
+        span = analytics.critical_path_length
+        ideal = [
+            (
+                jobs,
+                ideal_speedup(work, span, jobs)
+                    / ideal_speedup(work, span, base_jobs),
+            )
+            for jobs in job_counts
+        ]
+        speedups = collections.OrderedDict()
+        efficiencies = collections.OrderedDict()
+        # Plot setups which build every node first, so the
+        # legend, drawn with the first plot, shows the ideal
+        # speedup.
+        setups = sorted(
+            times[variable],
+            key=lambda setup: not setup.builds_every_node,
+        )
+        for setup in setups:
+            series_times = times[variable][setup]
+            # Keep each series' line style the same in every
+            # plot, whether or not it has an ideal speedup.
+            speedups[setup] = collections.OrderedDict()
+            efficiencies[setup] = collections.OrderedDict()
+            for (series, job_times) \
+                    in sorted(series_times.iteritems()):
+                if base_jobs not in job_times:
+                    continue
+                base_time = bss.stats.median(
+                    job_times[base_jobs],
+                )
+                points = [
                     (
-                        run.variable,
-                        run.measurement,
+                        jobs,
+                        base_time / bss.stats.median(
+                            job_times[jobs],
+                        ),
                     )
-                    for run in runs
+                    for jobs in sorted(job_times)
+                    if bss.stats.median(job_times[jobs]) > 0
+                ]
+                speedups[setup][series] = points
+                efficiencies[setup][series] = [
+                    (jobs, speedup * base_jobs / jobs)
+                    for (jobs, speedup) in points
                 ]
-                for (builder, runs)
-                in builder_runs.iteritems()
-            },
+            # Other setups build only part of the DAG, so its
+            # work and critical path don't bound them.
+            if setup.builds_every_node:
+                speedups[setup]['Ideal'] = ideal
+                efficiencies[setup]['Ideal'] = [
+                    (jobs, speedup * base_jobs / jobs)
+                    for (jobs, speedup) in ideal
+                ]
+
+        html_file.write(
+            '<h3>Speedup over -j{} ({}: {}; '
+            'work {}, critical path {})</h3>\n'.format(
+                e(base_jobs),
+                e(dag_set.variable_label),
+                e(variable),
+                e(work),
+                e(span),
+            ),
         )
-        plot_file.write_set('key', False)
+        for (setup_series_points, y_label) in [
+            (speedups, 'Speedup'),
+            (efficiencies, 'Parallel efficiency'),
+        ]:
+            with html_plot_file(html_file, encoding='utf-8') \
+                    as plot_file:
+                multiplot_series(
+                    args=args,
+                    plot_file=plot_file,
+                    setup_series_points=setup_series_points,
+                    x_label='Jobs',
+                    y_label=y_label,
+                )
 
-    plot_file.write_unset('multiplot')
+def write_count_section(
+    args,
+    dag_set,
+    html_file,
+    times,
+    title,
+    x_label,
+):
+    '''
+    Plots median times against a count, for every DAG.
+    times is nested dicts:
+
+    variable => setup => series name => count =>
+    measurements
+    '''
+    for variable in sorted(times):
+        html_file.write('<h3>{} ({}: {})</h3>\n'.format(
+            e(title),
+            e(dag_set.variable_label),
+            e(variable),
+        ))
+        with html_plot_file(html_file, encoding='utf-8') \
+                as plot_file:
+            multiplot_series(
+                args=args,
+                plot_file=plot_file,
+                setup_series_points=collections.OrderedDict(
+                    (
+                        setup,
+                        {
+                            series: [
+                                (
+                                    count,
+                                    bss.stats.median(
+                                        count_times[count],
+                                    ),
+                                )
+                                for count in sorted(count_times)
+                            ]
+                            for (series, count_times)
+                            in series_times.iteritems()
+                        },
+                    )
+                    for (setup, series_times)
+                    in times[variable].iteritems()
+                ),
+                x_label=x_label,
+                y_label=_y_label,
+            )
+
+def write_manifest_layout_section(
+    args,
+    dag_set,
+    html_file,
+    runs,
+):
+    '''
+    Plots the median time of each builder against the
+    number of files its manifest was split across, for
+    every DAG in runs.  Single-file manifests start the
+    series of every sharding.
+    '''
+    file_counts = {
+        run.manifest_layout.file_count for run in runs
+    }
+    if len(file_counts) < 2:
+        return
+    show_jobs = len({run.jobs for run in runs}) > 1
+    show_node_layouts \
+        = len({run.node_layout for run in runs}) > 1
+    shardings = sorted({
+        run.manifest_layout.sharding
+        for run in runs
+        if run.manifest_layout.file_count > 1
+    })
+    # variable => setup => series name => file count =>
+    # measurements
+    times = collections.defaultdict(
+        lambda: collections.defaultdict(
+            lambda: collections.defaultdict(
+                lambda: collections.defaultdict(list),
+            ),
+        ),
+    )
+    for run in runs:
+        file_count = run.manifest_layout.file_count
+        if file_count == 1:
+            run_shardings = shardings
+        else:
+            run_shardings = [run.manifest_layout.sharding]
+        for sharding in run_shardings:
+            series = series_name(
+                builder=run.builder,
+                jobs=run.jobs,
+                node_layout=run.node_layout,
+                show_jobs=show_jobs,
+                show_node_layouts=show_node_layouts,
+            )
+            if len(shardings) > 1:
+                series += ' by {}'.format(sharding)
+            times[run.variable][run.setup][series] \
+                [file_count].append(run.measurement)
+    write_count_section(
+        args=args,
+        dag_set=dag_set,
+        html_file=html_file,
+        times=times,
+        title='Time by manifest file count',
+        x_label='Manifest files',
+    )
+
+def write_node_layout_section(
+    args,
+    dag_set,
+    html_file,
+    runs,
+):
+    '''
+    Plots the median time of each builder against the
+    number of directories nodes were spread across, for
+    every DAG in runs.  Flat node layouts start the series
+    of every scheme and depth.
+    '''
+    def directory_count(layout):
+        return layout.width ** layout.depth
+    directory_counts = {
+        directory_count(run.node_layout) for run in runs
+    }
+    if len(directory_counts) < 2:
+        return
+    show_jobs = len({run.jobs for run in runs}) > 1
+    show_manifest_layouts \
+        = len({run.manifest_layout for run in runs}) > 1
+    shapes = sorted({
+        (run.node_layout.scheme, run.node_layout.depth)
+        for run in runs
+        if run.node_layout.scheme != 'flat'
+    })
+    # variable => setup => series name => directory count
+    # => measurements
+    times = collections.defaultdict(
+        lambda: collections.defaultdict(
+            lambda: collections.defaultdict(
+                lambda: collections.defaultdict(list),
+            ),
+        ),
+    )
+    for run in runs:
+        layout = run.node_layout
+        if layout.scheme == 'flat':
+            run_shapes = shapes
+        else:
+            run_shapes = [(layout.scheme, layout.depth)]
+        for (scheme, depth) in run_shapes:
+            series = series_name(
+                builder=run.builder,
+                jobs=run.jobs,
+                manifest_layout=run.manifest_layout,
+                show_jobs=show_jobs,
+                show_manifest_layouts=show_manifest_layouts,
+            )
+            if len(shapes) > 1:
+                series += ' ({}, depth {})'.format(
+                    scheme,
+                    depth,
+                )
+            times[run.variable][run.setup][series] \
+                [directory_count(layout)] \
+                .append(run.measurement)
+    write_count_section(
+        args=args,
+        dag_set=dag_set,
+        html_file=html_file,
+        times=times,
+        title='Time by node directory count',
+        x_label='Node directories',
+    )
 
 @contextlib.contextmanager
 def html_plot_file(html_file, encoding='utf-8'):
@@ -116,15 +631,34 @@ def html_plot_file(html_file, encoding='utf-8'):
         )
         html_file.write('\n')
 
-def write_system_information_html(builders, html_file):
+def system_information(builders):
+    '''
+    Describes the current invocation of bss, for
+    write_system_information_html.  The result is
+    JSON-serializable so it can be journaled (see
+    bss.journal).
+    '''
+    return {
+        'argv': sys.argv,
+        'builder_versions': {
+            builder.shortname: builder.version()
+            for builder in builders
+        },
+        'machine': bss.util.machine_information(),
+    }
+
+def write_system_information_html(
+    builders,
+    html_file,
+    information,
+):
     (
         uname_sysname,
-        _uname_nodename,
         uname_release,
         uname_version,
         _uname_machine,
-    ) = os.uname()
-    processors = bss.util.processors_info()
+    ) = information['machine']['uname']
+    processors = information['machine']['processors']
     html_file.write('''<h2>System information</h2>
 <dl>
     <dt>Invocation (<code>sys.argv</code>)
@@ -134,7 +668,7 @@ def write_system_information_html(builders, html_file):
     <dt>Processors
     <dd>{processors}
 '''.format(
-    argv=e(repr(sys.argv)),
+    argv=e(repr(information['argv'])),
     processors=(
         '\n    <dd>'.join(map(e, processors))
         if processors
@@ -154,7 +688,10 @@ def write_system_information_html(builders, html_file):
     <dd><pre>{version}</pre>
 '''.format(
     builder=e(builder.name),
-    version=e(builder.version()),
+    version=e(information['builder_versions'].get(
+        builder.shortname,
+        '(unknown)',
+    )),
 ))
 
     html_file.write('</dl>\n')
@@ -174,19 +711,35 @@ def write_report_section(
             run_plot_datas=run_datas,
         )
 
-    for (setup, builder_runs) in run_datas.iteritems():
-        # builder => variable => runs
-        builder_variable_runs = collections.defaultdict(
+    for (metric, label) in _resource_metrics:
+        if metric not in _plotted_resource_metrics:
+            continue
+        html_file.write('<h3>{}</h3>\n'.format(e(label)))
+        with html_plot_file(html_file, encoding='utf-8') \
+                as plot_file:
+            multiplot(
+                args=args,
+                dag_set=dag_set,
+                metric=metric,
+                plot_file=plot_file,
+                run_plot_datas=run_datas,
+                y_label=label,
+            )
+
+    for (setup, series_runs) in run_datas.iteritems():
+        # series name => variable => runs
+        series_variable_runs = collections.defaultdict(
             lambda: collections.defaultdict(list))
-        for (builder, runs) in builder_runs.iteritems():
+        for (series, runs) in series_runs.iteritems():
             for run in runs:
-                builder_variable_runs[builder] \
+                series_variable_runs[series] \
                     [run.variable].append(run)
 
         max_measurements = max(
-            len(variable_runs.values())
+            len(runs)
             for variable_runs
-            in builder_variable_runs.itervalues()
+            in series_variable_runs.itervalues()
+            for runs in variable_runs.itervalues()
         )
         html_file.write('''<table>
 <caption>{title}</caption>
@@ -195,26 +748,31 @@ def write_report_section(
     <th>Build System</th>
     <th>{variable}</th>
     <th colspan='{time_colspan}'>{y_label}</th>
+{resource_headers}
 </tr>
 </thead>
 <tbody>
 '''.format(
+    resource_headers='\n'.join(
+        '    <th>Median {}</th>'.format(e(label))
+        for (_, label) in _resource_metrics
+    ),
     time_colspan=e(max_measurements),
     title=e(setup.name(args)),
     variable=e(dag_set.variable_label),
     y_label=_y_label,
 ))
 
-        for (builder, variable_runs) \
-                in builder_variable_runs.iteritems():
+        for (series, variable_runs) \
+                in series_variable_runs.iteritems():
             first = True
             for (variable, runs) in variable_runs.iteritems():
                 html_file.write('<tr>\n')
                 if first:
                     html_file.write('''\
-    <th rowspan={rowspan}>{builder}</th>
+    <th rowspan={rowspan}>{series}</th>
 '''.format(
-    builder=e(builder.name),
+    series=e(series),
     rowspan=e(len(variable_runs))),
 )
                     first = False
@@ -223,11 +781,58 @@ def write_report_section(
                 for run in runs:
                     html_file.write('    <td>{}</td>\n'
                         .format(e(run.measurement)))
+                for _ in xrange(max_measurements - len(runs)):
+                    html_file.write('    <td></td>\n')
+                for (metric, _) in _resource_metrics:
+                    html_file.write('    <td>{}</td>\n'.format(
+                        e(bss.stats.median(
+                            getattr(run, metric)
+                            for run in runs
+                        )),
+                    ))
                 html_file.write('</tr>\n')
         html_file.write('</tbody>\n</table>\n')
 
-def write_report(runs, args):
+    dag_set_runs = [
+        run
+        for series_runs in run_datas.itervalues()
+        for runs in series_runs.itervalues()
+        for run in runs
+    ]
+    write_structure_section(
+        dag_set=dag_set,
+        html_file=html_file,
+        runs=dag_set_runs,
+    )
+    write_speedup_section(
+        args=args,
+        dag_set=dag_set,
+        html_file=html_file,
+        runs=dag_set_runs,
+    )
+    write_manifest_layout_section(
+        args=args,
+        dag_set=dag_set,
+        html_file=html_file,
+        runs=dag_set_runs,
+    )
+    write_node_layout_section(
+        args=args,
+        dag_set=dag_set,
+        html_file=html_file,
+        runs=dag_set_runs,
+    )
+
+def write_report(runs, args, information=None):
+    '''
+    information describes the invocation which measured
+    runs (see system_information), defaulting to the
+    current one.
+    '''
     all_runs = list(runs)
+    builders = {run.builder for run in all_runs}
+    if information is None:
+        information = system_information(builders)
     encoding = 'utf-8'
     with file(args.output_html_path, 'w') as html_file:
         html_file.write('''<!DOCTYPE html>
@@ -267,8 +872,9 @@ caption {{
             )
 
         write_system_information_html(
-            builders={run.builder for run in all_runs},
+            builders=builders,
             html_file=html_file,
+            information=information,
         )
 
         html_file.write('''</div>
@@ -0,0 +1,273 @@
+#!/usr/bin/env python2.7
+
+'''
+Historical store of measured Runs.
+
+Runs from every invocation of bss are accumulated in an
+SQLite database, keyed by builder, builder version, DAG
+fingerprint, setup, and machine, so results can be compared
+across builder upgrades and over time (see bss.compare).
+'''
+
+import bss.builders
+import bss.dags
+import bss.dagsets
+import bss.manifests
+import bss.nodelayouts
+import bss.run
+import bss.setups
+import bss.util
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+import uuid
+
+# Columns identifying what was measured.  Runs with equal
+# key columns are repeated measurements of the same thing.
+key_columns = [
+    'builder',
+    'builder_version',
+    'dag_set',
+    'variable',
+    'dag_fingerprint',
+    'setup',
+    'setup_name',
+    'jobs',
+    'manifest_layout',
+    'node_layout',
+    'machine_fingerprint',
+]
+
+# Columns which may be compared (see bss.compare).
+metric_columns = ['measurement'] \
+    + list(bss.util.ResourceUsage._fields)
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    time REAL NOT NULL,
+    machine TEXT NOT NULL,
+    {key_columns},
+    {metric_columns}
+);
+CREATE INDEX IF NOT EXISTS runs_key ON runs ({key});
+'''.format(
+    key=', '.join([
+        'builder',
+        'setup',
+        'dag_fingerprint',
+        'machine_fingerprint',
+    ]),
+    key_columns=',\n    '.join(
+        '{} TEXT NOT NULL'.format(column)
+        for column in key_columns
+    ),
+    metric_columns=',\n    '.join(
+        '{} REAL NOT NULL'.format(column)
+        for column in metric_columns
+    ),
+)
+
+class ResultsStore(object):
+    '''
+    An SQLite database of Runs at path, created if needed.
+
+    information describes the current invocation (see
+    bss.report.system_information), and is only needed to
+    add Runs.
+    '''
+
+    def __init__(self, path, information=None):
+        self.__connection = sqlite3.connect(path)
+        self.__connection.row_factory = sqlite3.Row
+        self.__connection.executescript(_schema)
+        self.__upgrade()
+        self.__information = information
+        self.__session = uuid.uuid4().hex
+
+    def __upgrade(self):
+        columns = {
+            row['name']
+            for row in self.__connection.execute(
+                'PRAGMA table_info(runs)',
+            )
+        }
+        if 'jobs' not in columns:
+            # Databases from before --jobs always used one
+            # job.
+            with self.__connection:
+                self.__connection.execute(
+                    'ALTER TABLE runs ADD COLUMN jobs TEXT '
+                    "NOT NULL DEFAULT '1'",
+                )
+        if 'manifest_layout' not in columns:
+            # Databases from before --manifest-layouts always
+            # wrote one manifest.
+            with self.__connection:
+                self.__connection.execute(
+                    'ALTER TABLE runs ADD COLUMN '
+                    'manifest_layout TEXT '
+                    "NOT NULL DEFAULT '1'",
+                )
+        if 'node_layout' not in columns:
+            # Databases from before --node-layouts always
+            # put nodes directly in the workspace.
+            with self.__connection:
+                self.__connection.execute(
+                    'ALTER TABLE runs ADD COLUMN '
+                    'node_layout TEXT '
+                    "NOT NULL DEFAULT 'flat'",
+                )
+        if 'setup_name' not in columns:
+            # Databases from before setup names were stored
+            # can't tell which setup parameters were used.
+            with self.__connection:
+                self.__connection.execute(
+                    'ALTER TABLE runs ADD COLUMN '
+                    'setup_name TEXT '
+                    "NOT NULL DEFAULT ''",
+                )
+
+    def close(self):
+        self.__connection.close()
+
+    def add_runs(self, runs):
+        '''
+        Adds runs, which were measured by the current
+        invocation, in a single transaction.
+        '''
+        machine = self.__information['machine']
+        machine_fingerprint \
+            = bss.util.machine_fingerprint(machine)
+        builder_versions \
+            = self.__information['builder_versions']
+        columns = ['session', 'time', 'machine'] \
+            + key_columns + metric_columns
+        now = time.time()
+        rows = []
+        for run in runs:
+            row = {
+                'builder': run.builder.shortname,
+                'builder_version': builder_versions.get(
+                    run.builder.shortname,
+                    '',
+                ),
+                'dag_fingerprint': run.dag_fingerprint,
+                'dag_set': run.dag_set.shortname,
+                'jobs': str(run.jobs),
+                'machine': json.dumps(
+                    machine,
+                    sort_keys=True,
+                ),
+                'machine_fingerprint': machine_fingerprint,
+                'manifest_layout': bss.manifests
+                    .format_manifest_layout(
+                        run.manifest_layout,
+                    ),
+                'node_layout': bss.nodelayouts
+                    .format_node_layout(run.node_layout),
+                'session': self.__session,
+                'setup': run.setup.shortname,
+                'setup_name': run.setup_name,
+                'time': now,
+                'variable': str(run.variable),
+            }
+            for column in metric_columns:
+                row[column] = getattr(run, column)
+            rows.append([row[column] for column in columns])
+        with self.__connection:
+            self.__connection.executemany(
+                'INSERT INTO runs ({}) VALUES ({})'.format(
+                    ', '.join(columns),
+                    ', '.join('?' for _ in columns),
+                ),
+                rows,
+            )
+
+    def rows(self, filters={}):
+        '''
+        Returns every stored run whose columns match the
+        glob patterns in filters, as sqlite3.Rows.
+        '''
+        for column in filters:
+            if column not in key_columns + ['session']:
+                raise Exception(
+                    'Cannot filter by {}'.format(column),
+                )
+        query = 'SELECT * FROM runs'
+        if filters:
+            query += ' WHERE ' + ' AND '.join(
+                '{} GLOB ?'.format(column)
+                for column in sorted(filters)
+            )
+        return self.__connection.execute(
+            query + ' ORDER BY id',
+            [filters[column] for column in sorted(filters)],
+        ).fetchall()
+
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'results.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_runs_accumulate(self):
+        def run(measurement):
+            return bss.run.Run(
+                builder=bss.builders.GNUMakeBuilder,
+                dag_analytics=None,
+                dag_fingerprint=bss.dags.LinearDAG(3)
+                    .fingerprint(),
+                dag_set=bss.dagsets.LinearDAGSet,
+                jobs=1,
+                manifest_layout=bss.manifests
+                    .single_file_layout,
+                measurement=measurement,
+                node_layout=bss.nodelayouts.flat_node_layout,
+                setup=bss.setups.CleanSetup,
+                setup_name='Clean',
+                variable=3,
+                **{
+                    field: 0
+                    for field
+                    in bss.util.ResourceUsage._fields
+                }
+            )
+        for version in ['4.0', '4.1']:
+            store = ResultsStore(self.path, information={
+                'builder_versions': {'gnu-make': version},
+                'machine': {'uname': ['Test']},
+            })
+            store.add_runs([run(1), run(2)])
+            store.close()
+
+        store = ResultsStore(self.path)
+        self.assertEqual(len(store.rows()), 4)
+        rows = store.rows({'builder_version': '4.1'})
+        self.assertEqual(
+            len(store.rows({'builder_version': '4.*'})),
+            4,
+        )
+        self.assertEqual(
+            [row['measurement'] for row in rows],
+            [1, 2],
+        )
+        self.assertEqual(
+            rows[0]['dag_fingerprint'],
+            bss.dags.LinearDAG(3).fingerprint(),
+        )
+        self.assertEqual(rows[0]['variable'], '3')
+        self.assertEqual(rows[0]['setup_name'], 'Clean')
+        with self.assertRaises(Exception):
+            store.rows({'measurement': 1})
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
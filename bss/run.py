@@ -1,29 +1,105 @@
+import bss.analytics
+import bss.manifests
+import bss.nodelayouts
+import bss.stats
 import bss.util
+import bss.workspaces
 import collections
+import cPickle
+import logging
+import multiprocessing
+import os
+import sys
 
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler(sys.stderr))
+
+# measurement is the wall-clock time of the build in
+# seconds.  The other numeric fields are those of
+# bss.util.ResourceUsage.  Runs don't hold their DAG, which
+# may be huge, but its bss.analytics.DAGAnalytics.
 Run = collections.namedtuple('Run', [
+    'block_inputs',
+    'block_outputs',
     'builder',
-    'dag',
+    'dag_analytics',
+    'dag_fingerprint',
     'dag_set',
+    'involuntary_context_switches',
+    'jobs',
+    'major_page_faults',
+    'manifest_layout',
+    'max_rss',
     'measurement',
+    'minor_page_faults',
+    'node_layout',
     'setup',
+    'setup_name',
+    'system_time',
+    'user_time',
     'variable',
+    'voluntary_context_switches',
+])
+
+Measurement = collections.namedtuple('Measurement', [
+    'resource_usage',
+    'time',
 ])
 
+# dag_fingerprint is that of the DAG (see
+# bss.dags.DAG.fingerprint), and setup_name is setup.name
+# with the invocation's arguments, so configurations are
+# only equal if they measure the same DAG with the same
+# setup parameters.
+Configuration = collections.namedtuple('Configuration', [
+    'builder',
+    'dag_fingerprint',
+    'dag_set',
+    'jobs',
+    'manifest_layout',
+    'node_layout',
+    'setup',
+    'setup_name',
+    'variable',
+])
+
+# Python 2's AsyncResult.get ignores KeyboardInterrupt
+# unless given a timeout.
+_result_timeout = 60 * 60 * 24 * 365
+
 def measure_configuration(
     args,
     builder,
     dag,
     setup,
     iterations=1,
+    jobs=1,
+    manifest_layout=bss.manifests.single_file_layout,
+    node_layout=bss.nodelayouts.flat_node_layout,
 ):
     measurements = []
     build_nodes = dag.root_nodes()
+    names = bss.nodelayouts.node_names(dag, node_layout)
+    if args.workspace_template_size > 0:
+        workspaces = bss.workspaces.WorkspaceTemplates(
+            directory=args.workspace_template_dir,
+            max_size=args.workspace_template_size * 2 ** 20,
+        )
+    else:
+        workspaces = bss.workspaces
+    if setup.requires_built_workspace:
+        create_workspace = workspaces.create_built_workspace
+    else:
+        create_workspace = workspaces.create_workspace
     for _ in xrange(iterations):
         with bss.util.temporary_directory() as temp_dir:
-            builder.set_up(
+            create_workspace(
                 args=args,
+                builder=builder,
                 dag=dag,
+                manifest_layout=manifest_layout,
+                names=names,
+                node_layout=node_layout,
                 temp_dir=temp_dir,
             )
             setup.set_up(
@@ -31,52 +107,600 @@ def measure_configuration(
                 build_nodes=build_nodes,
                 builder=builder,
                 dag=dag,
+                names=names,
                 temp_dir=temp_dir,
             )
             start = bss.util.get_time()
-            builder.build(
+            resource_usage = builder.build(
                 args=args,
+                jobs=jobs,
+                names=names,
                 nodes=build_nodes,
                 temp_dir=temp_dir,
             )
             end = bss.util.get_time()
-            measurements.append(end - start)
+            measurements.append(Measurement(
+                resource_usage=resource_usage,
+                time=end - start,
+            ))
     return measurements
 
-def run_configurations(
+class DAGRegistry(object):
+    '''
+    Shares DAGs between the Configurations which use them.
+
+    Each DAG is added with the number of times
+    Configurations will use it, and is forgotten as soon as
+    the last of those uses releases it.  Its analytics are
+    kept.
+    '''
+
+    def __init__(self):
+        # (dag_set, variable) => [dag, remaining_uses]
+        self.__entries = {}
+        # (dag_set, variable) => bss.analytics.DAGAnalytics
+        self.__analytics = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def add(self, key, dag, uses):
+        if uses <= 0:
+            return
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__entries[key] = [dag, uses]
+        else:
+            entry[1] += uses
+
+    def get(self, key):
+        return self.__entries[key][0]
+
+    def analytics(self, key):
+        '''
+        Returns the bss.analytics.DAGAnalytics of key's DAG,
+        which must not have been forgotten the first time.
+        '''
+        analytics = self.__analytics.get(key)
+        if analytics is None:
+            analytics = bss.analytics.analyze(self.get(key))
+            self.__analytics[key] = analytics
+        return analytics
+
+    def release(self, key):
+        entry = self.__entries[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.__entries[key]
+
+def configuration_key(configuration):
+    '''
+    Returns a tuple of strings identifying configuration
+    across invocations of bss.
+    '''
+    return (
+        configuration.builder.shortname,
+        configuration.dag_set.shortname,
+        configuration.setup.shortname,
+        str(configuration.variable),
+        str(configuration.jobs),
+        bss.manifests.format_manifest_layout(
+            configuration.manifest_layout,
+        ),
+        bss.nodelayouts.format_node_layout(
+            configuration.node_layout,
+        ),
+        configuration.dag_fingerprint,
+        configuration.setup_name,
+    )
+
+def configuration_dag_key(configuration):
+    return (configuration.dag_set, configuration.variable)
+
+def parse_job_count(string):
+    '''
+    Parses a --jobs value: a positive integer or 'nproc'.
+    '''
+    if string == 'nproc':
+        return string
+    jobs = int(string)
+    if jobs < 1:
+        raise ValueError('Job count must be positive')
+    return jobs
+
+def processors_per_worker(args):
+    if args.workers == 1:
+        # Builds run in this process, so processors are
+        # neither partitioned nor reserved.
+        return len(bss.util.available_processors())
+    (_, processor_sets) = bss.util.partition_processors(
+        processors=bss.util.available_processors(),
+        partition_count=args.workers,
+        reserved_count=args.reserved_processors,
+    )
+    return len(processor_sets[0])
+
+def job_counts(args):
+    '''
+    Returns the sorted distinct job counts to test, with
+    'nproc' meaning the number of processors available to
+    each worker.
+    '''
+    return sorted({
+        processors_per_worker(args) if jobs == 'nproc'
+            else jobs
+        for jobs in args.jobs
+    })
+
+def builder_layouts(builders, manifest_layouts, node_layouts):
+    '''
+    Returns a dict from each of builders to the
+    (manifest layout, node layout) pairs it supports,
+    logging those it doesn't.
+    '''
+    layouts = {}
+    for builder in builders:
+        layouts[builder] = []
+        unsupported_names = set()
+        for manifest_layout in manifest_layouts:
+            if not builder.supports_manifest_layout(
+                manifest_layout,
+            ):
+                unsupported_names.add(
+                    bss.manifests.manifest_layout_name(
+                        manifest_layout,
+                    ),
+                )
+                continue
+            for node_layout in node_layouts:
+                if not builder.supports_node_layout(
+                    node_layout,
+                ):
+                    unsupported_names.add(
+                        bss.nodelayouts.node_layout_name(
+                            node_layout,
+                        ),
+                    )
+                    continue
+                layouts[builder].append(
+                    (manifest_layout, node_layout),
+                )
+        if unsupported_names:
+            logger.warn(
+                'Skipping {} with {}, which it does not '
+                'support'.format(
+                    builder.name,
+                    ', '.join(sorted(unsupported_names)),
+                ),
+            )
+    return layouts
+
+def configurations(
     args,
     builders,
     dag_sets,
     setups,
+    registry,
+    skipped_keys=frozenset(),
+    uses=1,
+):
+    '''
+    Yields every Configuration to test, adding its DAG to
+    registry before the first Configuration using it.
+
+    Each DAG is created only once and is shared by all
+    builders and setups.  It is forgotten once each of its
+    Configurations has been released uses times (say, once
+    each by bss.plan.probe_configurations,
+    bss.plan.plan_configurations, and run_configurations).
+    Configurations whose configuration_key is in
+    skipped_keys are not yielded, nor are those with
+    layouts their builder doesn't support (see
+    builder_layouts).
+    '''
+    all_job_counts = job_counts(args)
+    all_builder_layouts = builder_layouts(
+        builders=builders,
+        manifest_layouts=sorted(set(args.manifest_layouts)),
+        node_layouts=sorted(set(args.node_layouts)),
+    )
+    for dag_set in dag_sets:
+        for (variable, dag) in dag_set.dags(args):
+            dag_configurations = [
+                Configuration(
+                    builder=builder,
+                    dag_fingerprint=dag.fingerprint(),
+                    dag_set=dag_set,
+                    jobs=jobs,
+                    manifest_layout=manifest_layout,
+                    node_layout=node_layout,
+                    setup=setup,
+                    setup_name=setup.name(args),
+                    variable=variable,
+                )
+                for builder in builders
+                for jobs in all_job_counts
+                for (manifest_layout, node_layout)
+                    in all_builder_layouts[builder]
+                for setup in setups
+            ]
+            dag_configurations = [
+                configuration
+                for configuration in dag_configurations
+                if configuration_key(configuration)
+                    not in skipped_keys
+            ]
+            registry.add(
+                key=(dag_set, variable),
+                dag=dag,
+                uses=len(dag_configurations) * uses,
+            )
+            # Let registry decide the DAG's lifetime.
+            del dag
+            for configuration in dag_configurations:
+                yield configuration
+
+def measure_configuration_adaptively(
+    args,
+    builder,
+    dag,
+    setup,
+    jobs=1,
+    manifest_layout=bss.manifests.single_file_layout,
+    node_layout=bss.nodelayouts.flat_node_layout,
 ):
+    '''
+    Measures a configuration until the median time is
+    known precisely enough, returning only the measurements
+    after warmup.
+
+    Sampling stops once the relative confidence interval of
+    the median of the post-warmup measurements is at most
+    args.target_relative_ci, after args.max_iterations
+    measurements, or after args.max_configuration_time
+    seconds, which caps sampling even before
+    args.min_iterations steady measurements are taken.
+    Warmup is detected automatically (see
+    bss.stats.warmup_length).
+    '''
+    measurements = []
+    warmup_count = 0
+    start = bss.util.get_time()
+    while len(measurements) < args.max_iterations:
+        measurements.extend(measure_configuration(
+            args=args,
+            builder=builder,
+            dag=dag,
+            iterations=1,
+            jobs=jobs,
+            manifest_layout=manifest_layout,
+            node_layout=node_layout,
+            setup=setup,
+        ))
+        times = [
+            measurement.time
+            for measurement in measurements
+        ]
+        warmup_count = bss.stats.warmup_length(times)
+        steady_times = times[warmup_count:]
+        if bss.util.get_time() - start \
+                >= args.max_configuration_time:
+            if len(steady_times) < args.min_iterations:
+                logger.warn(
+                    '--max-configuration-time stopped '
+                    'sampling after {} of {} steady '
+                    'measurement(s)'.format(
+                        len(steady_times),
+                        args.min_iterations,
+                    ),
+                )
+            break
+        if len(steady_times) < args.min_iterations:
+            continue
+        relative_ci = bss.stats \
+            .relative_median_confidence_interval(
+                steady_times,
+                confidence=args.confidence,
+            )
+        if relative_ci <= args.target_relative_ci:
+            break
+    return measurements[warmup_count:]
+
+def measure_good_configuration(
+    args,
+    configuration,
+    dag,
+    iterations=None,
+):
+    '''
+    Measures a Configuration, returning only the
+    measurements after warmup.
+
+    iterations overrides args.iterations (see bss.plan).
+    '''
+    if iterations is None:
+        iterations = args.iterations
+    if args.target_relative_ci is not None:
+        return measure_configuration_adaptively(
+            args=args,
+            builder=configuration.builder,
+            dag=dag,
+            jobs=configuration.jobs,
+            manifest_layout=configuration.manifest_layout,
+            node_layout=configuration.node_layout,
+            setup=configuration.setup,
+        )
+    measurements = measure_configuration(
+        args=args,
+        builder=configuration.builder,
+        dag=dag,
+        iterations=iterations + args.warmup_iterations,
+        jobs=configuration.jobs,
+        manifest_layout=configuration.manifest_layout,
+        node_layout=configuration.node_layout,
+        setup=configuration.setup,
+    )
+    return measurements[args.warmup_iterations:]
+
+def _initialize_worker(processor_sets):
+    bss.util.set_processor_affinity(processor_sets.get())
+
+# The path and DAG a worker process last loaded (see
+# _load_worker_dag).
+_worker_dag = [None, None]
+
+def _load_worker_dag(dag_path):
+    '''
+    Returns the DAG pickled at dag_path, loading it only if
+    it isn't the DAG this worker loaded last.
+    '''
+    if _worker_dag[0] != dag_path:
+        # Let the previous DAG go before loading the next.
+        _worker_dag[:] = [None, None]
+        with open(dag_path, 'rb') as dag_file:
+            _worker_dag[:] = [dag_path, cPickle.load(dag_file)]
+    return _worker_dag[1]
+
+def _measure_in_worker(
+    args,
+    configuration,
+    dag_path,
+    iterations,
+):
+    return measure_good_configuration(
+        args=args,
+        configuration=configuration,
+        dag=_load_worker_dag(dag_path),
+        iterations=iterations,
+    )
+
+def _measure_in_parallel(
+    args,
+    configurations,
+    registry,
+    iterations,
+):
+    '''
+    Measures configurations in a pool of args.workers
+    processes, each pinned to its own processors.
+
+    Yields (configuration, measurements) pairs in the
+    order of configurations.
+    '''
+    (reserved_processors, processor_sets) \
+        = bss.util.partition_processors(
+            processors=bss.util.available_processors(),
+            partition_count=args.workers,
+            reserved_count=args.reserved_processors,
+        )
+    original_processors = bss.util.available_processors()
+    if reserved_processors:
+        bss.util.set_processor_affinity(
+            reserved_processors,
+        )
+    try:
+        processor_set_queue = multiprocessing.Queue()
+        for processor_set in processor_sets:
+            processor_set_queue.put(processor_set)
+        pool = multiprocessing.Pool(
+            initializer=_initialize_worker,
+            initargs=(processor_set_queue,),
+            processes=args.workers,
+        )
+        with bss.util.temporary_directory() as temp_dir:
+            try:
+                for result in _measure_in_pool(
+                    args=args,
+                    configurations=configurations,
+                    iterations=iterations,
+                    pool=pool,
+                    registry=registry,
+                    temp_dir=temp_dir,
+                ):
+                    yield result
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        if reserved_processors:
+            bss.util.set_processor_affinity(
+                original_processors,
+            )
+
+def _measure_in_pool(
+    args,
+    configurations,
+    iterations,
+    pool,
+    registry,
+    temp_dir,
+):
+    '''
+    Measures configurations with pool, sending each DAG to
+    the workers once as a pickle in temp_dir rather than
+    once per Configuration.
+
+    Yields (configuration, measurements) pairs in the
+    order of configurations.
+    '''
+    # dag key => [pickle path, configurations in flight]
+    dag_files = {}
+    def collect(configuration, result):
+        dag_key = configuration_dag_key(configuration)
+        dag_file = dag_files[dag_key]
+        dag_file[1] -= 1
+        if dag_file[1] == 0:
+            os.remove(dag_file[0])
+            del dag_files[dag_key]
+        return (configuration, result.get(_result_timeout))
+    # Keep a bounded number of configurations in flight so
+    # we don't hold every DAG in memory at once.
+    max_pending = 2 * args.workers
+    pending = collections.deque()
+    for (i, configuration) in enumerate(configurations):
+        dag_key = configuration_dag_key(configuration)
+        dag_file = dag_files.get(dag_key)
+        if dag_file is None:
+            dag_path = os.path.join(
+                temp_dir,
+                'dag{}.pickle'.format(i),
+            )
+            with open(dag_path, 'wb') as output:
+                cPickle.dump(
+                    registry.get(dag_key),
+                    output,
+                    cPickle.HIGHEST_PROTOCOL,
+                )
+            dag_file = [dag_path, 0]
+            dag_files[dag_key] = dag_file
+        dag_file[1] += 1
+        # Only measurements are sent back.  Sending Runs
+        # would pickle a copy of the DAG for each
+        # measurement.
+        pending.append((
+            configuration,
+            pool.apply_async(
+                _measure_in_worker,
+                (
+                    args,
+                    configuration,
+                    dag_file[0],
+                    iterations.get(configuration),
+                ),
+            ),
+        ))
+        if len(pending) >= max_pending:
+            yield collect(*pending.popleft())
+    while pending:
+        yield collect(*pending.popleft())
+
+def run_configurations(
+    args,
+    configurations,
+    registry,
+    iterations=None,
+    journal=None,
+):
+    '''
+    Measures every Configuration of configurations (see
+    configurations), yielding Runs, and releases each from
+    registry.
+
+    iterations maps Configurations to the number of
+    measured iterations to run, overriding args.iterations.
+
+    If journal (a bss.journal.JournalWriter) is given, each
+    configuration's Runs are written to it before they are
+    yielded.
+    '''
+    if iterations is None:
+        iterations = {}
     if args.iterations < 0:
         raise Exception('--iterations must be non-negative')
     if args.warmup_iterations < 0:
         raise Exception(
             '--warmup-iterations must be non-native',
         )
-    for builder in builders:
-        for dag_set in dag_sets:
-            for setup in setups:
-                dags = dag_set.dags(args)
-                for (variable, dag) in dags:
-                    measurements = measure_configuration(
-                        args=args,
-                        builder=builder,
-                        dag=dag,
-                        setup=setup,
-                        iterations=args.iterations
-                            + args.warmup_iterations,
-                    )
-                    good_measurements = measurements[
-                        args.warmup_iterations:
-                    ]
-                    for measurement in good_measurements:
-                        yield Run(
-                            builder=builder,
-                            dag=dag,
-                            dag_set=dag_set,
-                            measurement=measurement,
-                            setup=setup,
-                            variable=variable,
-                        )
+    if args.workers < 1:
+        raise Exception('--workers must be positive')
+    if max(job_counts(args)) > processors_per_worker(args):
+        logger.warn(
+            '--jobs exceeds the {} processor(s) available '
+            'to each worker'.format(
+                processors_per_worker(args),
+            ),
+        )
+    if args.target_relative_ci is not None:
+        if args.target_relative_ci <= 0:
+            raise Exception(
+                '--target-relative-ci must be positive',
+            )
+        if args.min_iterations < 1:
+            raise Exception(
+                '--min-iterations must be positive',
+            )
+        if args.max_iterations < args.min_iterations:
+            raise Exception(
+                '--max-iterations must be at least '
+                '--min-iterations',
+            )
+        if not 0 < args.confidence < 1:
+            raise Exception(
+                '--confidence must be between 0 and 1',
+            )
+    if args.workers == 1:
+        results = (
+            (
+                configuration,
+                measure_good_configuration(
+                    args=args,
+                    configuration=configuration,
+                    dag=registry.get(configuration_dag_key(
+                        configuration,
+                    )),
+                    iterations=iterations.get(configuration),
+                ),
+            )
+            for configuration in configurations
+        )
+    else:
+        results = _measure_in_parallel(
+            args=args,
+            configurations=configurations,
+            iterations=iterations,
+            registry=registry,
+        )
+    for (configuration, measurements) in results:
+        dag_key = configuration_dag_key(configuration)
+        # Analyze the DAG before it may be forgotten.
+        dag_analytics = registry.analytics(dag_key)
+        registry.release(dag_key)
+        runs = [
+            Run(
+                builder=configuration.builder,
+                dag_analytics=dag_analytics,
+                dag_fingerprint=configuration.dag_fingerprint,
+                dag_set=configuration.dag_set,
+                jobs=configuration.jobs,
+                manifest_layout=configuration.manifest_layout,
+                measurement=measurement.time,
+                node_layout=configuration.node_layout,
+                setup=configuration.setup,
+                setup_name=configuration.setup_name,
+                variable=configuration.variable,
+                **measurement.resource_usage._asdict()
+            )
+            for measurement in measurements
+        ]
+        if journal is not None:
+            journal.write_configuration(
+                configuration=configuration,
+                dag_analytics=dag_analytics,
+                runs=runs,
+            )
+        for run in runs:
+            yield run
@@ -1,11 +1,12 @@
+import bss.util
 import os
 
 __dirty_iteration = 0
 
-def node_path(node, temp_dir):
-    return os.path.join(temp_dir, str(node))
+def node_path(node, temp_dir, names):
+    return os.path.join(temp_dir, names[node])
 
-def dirty_node(node, temp_dir):
+def dirty_node(node, temp_dir, names):
     global __dirty_iteration
     __dirty_iteration += 1
     # N.B. The file size must be the same regardless of
@@ -16,15 +17,50 @@ def dirty_node(node, temp_dir):
     )
     assert len(contents) == 42
 
-    with file(node_path(node, temp_dir), 'wb') as f:
+    path = node_path(node, temp_dir, names=names)
+    with file(path, 'wb') as f:
         f.write(contents)
+    if bss.util.can_set_stamps():
+        # Make node newer than everything already built
+        # without waiting for the clock to tick.
+        bss.util.set_stamp(path)
+
+def create_leaf_nodes(dag, temp_dir, names):
+    '''
+    The directories of names must already exist (see
+    bss.nodelayouts.create_directories).
+    '''
+    for node in dag.leaf_nodes():
+        dirty_node(
+            node,
+            names=names,
+            temp_dir=temp_dir,
+        )
 
 class Setup(object):
+    '''
+    A Setup prepares a workspace for a measured build.
+
+    When set_up is called, temp_dir already holds the
+    builder's manifests and every leaf node (see
+    bss.workspaces), each at the path names gives it
+    (see bss.nodelayouts.node_names).  If
+    requires_built_workspace is True, build_nodes have also
+    already been built, and the builder's stamps are up to
+    date.  If builds_every_node is True, the measured build
+    runs the action of every node not a leaf, as a full
+    build does.
+    '''
+
+    builds_every_node = False
+    requires_built_workspace = False
+
     @staticmethod
     def prepare_parser(arg_parser):
         pass
 
 class CleanSetup(Setup):
+    builds_every_node = True
     shortname = 'clean'
 
     @staticmethod
@@ -32,11 +68,19 @@ class CleanSetup(Setup):
         return 'Clean'
 
     @staticmethod
-    def set_up(temp_dir, dag, builder, build_nodes, args):
-        for node in dag.leaf_nodes():
-            dirty_node(node, temp_dir=temp_dir)
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        builder,
+        build_nodes,
+        args,
+    ):
+        # The workspace is already clean.
+        pass
 
 class FixedIncrementalSetup(Setup):
+    requires_built_workspace = True
     shortname = 'fixed-incremental'
 
     @staticmethod
@@ -57,27 +101,25 @@ class FixedIncrementalSetup(Setup):
         )
 
     @staticmethod
-    def set_up(temp_dir, dag, builder, build_nodes, args):
-        CleanSetup.set_up(
-            temp_dir=temp_dir,
-            dag=dag,
-            builder=builder,
-            build_nodes=build_nodes,
-            args=args,
-        )
-        builder.build(
-            temp_dir=temp_dir,
-            nodes=build_nodes,
-            args=args,
-        )
-        builder.wait_for_stamp_update()
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        builder,
+        build_nodes,
+        args,
+    ):
         for node in FixedIncrementalSetup \
                 .__dirty_nodes(
                     args=args,
                     build_nodes=build_nodes,
                     dag=dag,
                 ):
-            os.remove(node_path(node, temp_dir=temp_dir))
+            os.remove(node_path(
+                node,
+                names=names,
+                temp_dir=temp_dir,
+            ))
 
     @staticmethod
     def __dirty_nodes(args, build_nodes, dag):
@@ -122,6 +164,8 @@ class FixedIncrementalSetup(Setup):
         return dirty_nodes
 
 class FullIncrementalSetup(Setup):
+    builds_every_node = True
+    requires_built_workspace = True
     shortname = 'full-incremental'
 
     @staticmethod
@@ -129,24 +173,19 @@ class FullIncrementalSetup(Setup):
         return 'Full Incremental'
 
     @staticmethod
-    def set_up(temp_dir, dag, builder, build_nodes, args):
-        CleanSetup.set_up(
-            temp_dir=temp_dir,
-            dag=dag,
-            builder=builder,
-            build_nodes=build_nodes,
-            args=args,
-        )
-        builder.build(
-            temp_dir=temp_dir,
-            nodes=build_nodes,
-            args=args,
-        )
-        builder.wait_for_stamp_update()
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        builder,
+        build_nodes,
+        args,
+    ):
         for node in dag.leaf_nodes():
-            dirty_node(node, temp_dir=temp_dir)
+            dirty_node(node, names=names, temp_dir=temp_dir)
 
 class NoOpIncrementalSetup(Setup):
+    requires_built_workspace = True
     shortname = 'empty-incremental'
 
     @staticmethod
@@ -154,20 +193,16 @@ class NoOpIncrementalSetup(Setup):
         return 'Empty Incremental'
 
     @staticmethod
-    def set_up(temp_dir, dag, builder, build_nodes, args):
-        CleanSetup.set_up(
-            temp_dir=temp_dir,
-            dag=dag,
-            builder=builder,
-            build_nodes=build_nodes,
-            args=args,
-        )
-        builder.build(
-            temp_dir=temp_dir,
-            nodes=build_nodes,
-            args=args,
-        )
-        builder.wait_for_stamp_update()
+    def set_up(
+        temp_dir,
+        dag,
+        names,
+        builder,
+        build_nodes,
+        args,
+    ):
+        # The workspace is already up to date.
+        pass
 
 all_setups = [
     CleanSetup,
@@ -0,0 +1,285 @@
+#!/usr/bin/env python2.7
+
+'''
+Statistics over measurements.
+'''
+
+import bisect
+import collections
+import math
+import random
+import unittest
+
+def mean(values):
+    values = list(values)
+    if not values:
+        raise ValueError('mean of no values')
+    return float(sum(values)) / len(values)
+
+def median(values):
+    values = sorted(values)
+    if not values:
+        raise ValueError('median of no values')
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    else:
+        return (values[middle - 1] + values[middle]) / 2.0
+
+def percentile(sorted_values, fraction):
+    '''
+    Returns the linearly-interpolated percentile of
+    already-sorted values.
+    '''
+    if not sorted_values:
+        raise ValueError('percentile of no values')
+    position = fraction * (len(sorted_values) - 1)
+    lower = int(math.floor(position))
+    upper = int(math.ceil(position))
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) \
+        + sorted_values[upper] * weight
+
+def median_confidence_interval(
+    values,
+    confidence=0.95,
+    resamples=1000,
+    seed=0,
+):
+    '''
+    Returns a bootstrap (low, high) confidence interval of
+    the median of values.
+
+    The bootstrap is seeded, so equal inputs give equal
+    intervals.
+    '''
+    values = list(values)
+    if not values:
+        raise ValueError('confidence interval of no values')
+    rng = random.Random(seed)
+    count = len(values)
+    medians = sorted(
+        median(
+            values[rng.randrange(count)]
+            for _ in xrange(count)
+        )
+        for _ in xrange(resamples)
+    )
+    tail = (1 - confidence) / 2
+    return (
+        percentile(medians, tail),
+        percentile(medians, 1 - tail),
+    )
+
+def relative_median_confidence_interval(
+    values,
+    confidence=0.95,
+):
+    '''
+    Returns the width of the median's confidence interval
+    relative to the median.
+    '''
+    (low, high) = median_confidence_interval(
+        values,
+        confidence=confidence,
+    )
+    middle = median(values)
+    if middle == 0:
+        return 0 if high == low else float('inf')
+    return (high - low) / abs(middle)
+
+def warmup_length(values):
+    '''
+    Returns the number of leading values which are part of
+    an initial transient, using the Marginal Standard Error
+    Rule (MSER).
+
+    MSER truncates the d leading values which minimise the
+    squared standard error of the mean of the remaining
+    values.  At most half the values are truncated.
+    '''
+    values = list(values)
+    count = len(values)
+    best_length = 0
+    best_error = None
+    # Walk d from the largest candidate down, keeping
+    # running sums of the remaining tail.
+    tail_sum = 0.0
+    tail_squares = 0.0
+    for d in xrange(count - 1, -1, -1):
+        tail_sum += values[d]
+        tail_squares += values[d] ** 2
+        if d > count // 2:
+            continue
+        tail_count = count - d
+        tail_mean = tail_sum / tail_count
+        squared_deviations = max(
+            0.0,
+            tail_squares - tail_count * tail_mean ** 2,
+        )
+        error = squared_deviations / tail_count ** 2
+        # Prefer truncating less on ties.
+        if best_error is None or error <= best_error:
+            best_error = error
+            best_length = d
+    return best_length
+
+def ranks(values):
+    '''
+    Returns the 1-based rank of each of values, giving tied
+    values the mean of their ranks.
+    '''
+    order = sorted(xrange(len(values)), key=values.__getitem__)
+    result = [0.0] * len(values)
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) \
+                and values[order[end]] == values[order[start]]:
+            end += 1
+        rank = (start + end + 1) / 2.0
+        for i in xrange(start, end):
+            result[order[i]] = rank
+        start = end
+    return result
+
+def mann_whitney_u(xs, ys):
+    '''
+    Returns (u, p), where u is the Mann-Whitney U statistic
+    of xs and p is the two-sided p-value of the hypothesis
+    that xs and ys come from the same distribution.
+
+    p uses the normal approximation with tie and continuity
+    corrections, which is reasonable once each sample has
+    about eight values.
+    '''
+    xs = list(xs)
+    ys = list(ys)
+    if not xs or not ys:
+        raise ValueError('Mann-Whitney U of no values')
+    (n, m) = (len(xs), len(ys))
+    all_ranks = ranks(xs + ys)
+    u = sum(all_ranks[:n]) - n * (n + 1) / 2.0
+    total = n + m
+    tie_sum = 0.0
+    for count in collections.Counter(xs + ys).itervalues():
+        tie_sum += count ** 3 - count
+    variance = n * m / 12.0 * (
+        total + 1 - tie_sum / (total * (total - 1))
+        if total > 1 else 0
+    )
+    if variance <= 0:
+        return (u, 1.0)
+    difference = abs(u - n * m / 2.0)
+    z = max(0.0, difference - 0.5) / math.sqrt(variance)
+    return (u, math.erfc(z / math.sqrt(2)))
+
+def cliffs_delta(xs, ys):
+    '''
+    Returns Cliff's delta of xs over ys: the probability
+    that a value of xs is greater than a value of ys, minus
+    the probability that it is less.  The result is between
+    -1 and 1.
+    '''
+    xs = list(xs)
+    ys = sorted(ys)
+    if not xs or not ys:
+        raise ValueError("Cliff's delta of no values")
+    greater = 0
+    less = 0
+    for x in xs:
+        less += len(ys) - bisect.bisect_right(ys, x)
+        greater += bisect.bisect_left(ys, x)
+    return float(greater - less) / (len(xs) * len(ys))
+
+class TestMedian(unittest.TestCase):
+    def test_odd(self):
+        self.assertEqual(median([3, 1, 2]), 2)
+
+    def test_even(self):
+        self.assertEqual(median([4, 1, 3, 2]), 2.5)
+
+class TestMedianConfidenceInterval(unittest.TestCase):
+    def test_constant_values(self):
+        self.assertEqual(
+            median_confidence_interval([5] * 10),
+            (5, 5),
+        )
+        self.assertEqual(
+            relative_median_confidence_interval([5] * 10),
+            0,
+        )
+
+    def test_interval_contains_median(self):
+        values = [10 + (i % 7) * 0.1 for i in xrange(50)]
+        (low, high) = median_confidence_interval(values)
+        self.assertLessEqual(low, median(values))
+        self.assertGreaterEqual(high, median(values))
+
+    def test_narrows_with_more_values(self):
+        rng = random.Random(42)
+        def sample(count):
+            return [rng.gauss(10, 1) for _ in xrange(count)]
+        self.assertLess(
+            relative_median_confidence_interval(sample(200)),
+            relative_median_confidence_interval(sample(10)),
+        )
+
+class TestWarmupLength(unittest.TestCase):
+    def test_steady_values(self):
+        self.assertEqual(warmup_length([1, 1, 1, 1, 1]), 0)
+
+    def test_initial_transient(self):
+        values = [9, 5, 2] + [1, 1.1, 0.9, 1, 1.05, 0.95] * 3
+        self.assertEqual(warmup_length(values), 3)
+
+    def test_few_values(self):
+        self.assertEqual(warmup_length([]), 0)
+        self.assertEqual(warmup_length([1]), 0)
+
+class TestMannWhitneyU(unittest.TestCase):
+    def test_ranks_with_ties(self):
+        self.assertEqual(
+            ranks([10, 20, 10, 30]),
+            [1.5, 3, 1.5, 4],
+        )
+
+    def test_separated_samples(self):
+        (u, p) = mann_whitney_u(range(10), range(20, 30))
+        self.assertEqual(u, 0)
+        self.assertLess(p, 0.001)
+
+    def test_identical_samples(self):
+        (u, p) = mann_whitney_u([1, 2, 3] * 4, [1, 2, 3] * 4)
+        self.assertEqual(u, 72)
+        self.assertAlmostEqual(p, 1)
+        self.assertEqual(mann_whitney_u([5] * 3, [5] * 3)[1], 1)
+
+    def test_known_p_value(self):
+        # Two-sided normal approximation with continuity
+        # correction, as computed by R's wilcox.test(
+        # exact=FALSE).
+        xs = [1.83, 0.50, 1.62, 2.48, 1.68, 1.88, 1.55, 3.06,
+            1.30]
+        ys = [0.878, 0.647, 0.598, 2.05, 1.06, 1.29, 1.06,
+            3.14, 1.29]
+        (u, p) = mann_whitney_u(xs, ys)
+        self.assertEqual(u, 58)
+        self.assertAlmostEqual(p, 0.1329, places=3)
+
+class TestCliffsDelta(unittest.TestCase):
+    def test_extremes(self):
+        self.assertEqual(cliffs_delta([5, 6], [1, 2]), 1)
+        self.assertEqual(cliffs_delta([1, 2], [5, 6]), -1)
+        self.assertEqual(cliffs_delta([1, 2], [1, 2]), 0)
+
+    def test_partial_overlap(self):
+        # 1 is less than 2 and 4; 3 is greater than 2 and
+        # less than 4; 5 is greater than 2 and 4.
+        self.assertAlmostEqual(
+            cliffs_delta([1, 3, 5], [2, 4]),
+            (3 - 3) / 6.0,
+        )
+
+if __name__ == '__main__':
+    unittest.main()
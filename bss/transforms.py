@@ -0,0 +1,284 @@
+#!/usr/bin/env python2.7
+
+'''
+Transformations deriving new DAGs from existing ones.
+
+Real-world graphs (such as data/llvm.dot.gz) come in one
+size.  These transformations grow them by tiling, shrink
+them by sampling, and simplify them by transitive
+reduction, so builders can be measured on realistic shapes
+at many scales.  Every transformation returns a CompactDAG.
+'''
+
+import array
+import bss.analytics
+import bss.dags
+import math
+import random
+import unittest
+
+def _compact_dag(node_count, nodes_from):
+    '''
+    Returns a CompactDAG whose node's dependencies are
+    nodes_from(node).
+    '''
+    edge_offsets = array.array('I', [0])
+    edge_targets = array.array('I')
+    for node in xrange(1, node_count + 1):
+        edge_targets.extend(nodes_from(node))
+        edge_offsets.append(len(edge_targets))
+    return bss.dags.CompactDAG(
+        edge_offsets=edge_offsets,
+        edge_targets=edge_targets,
+    )
+
+def induced_subgraph(dag, nodes):
+    '''
+    Returns the subgraph of dag on nodes, keeping the edges
+    between them.  Nodes are renumbered from 1, keeping
+    their order.
+    '''
+    node_count = len(dag.all_nodes())
+    # Old node => new node, or 0 if not kept.
+    new_nodes = array.array('I', [0]) * (node_count + 1)
+    old_nodes = array.array('I', sorted(nodes))
+    for (new_node, old_node) in enumerate(old_nodes, 1):
+        new_nodes[old_node] = new_node
+    return _compact_dag(
+        len(old_nodes),
+        lambda node: [
+            new_nodes[to_node]
+            for to_node in dag.nodes_from(old_nodes[node - 1])
+            if new_nodes[to_node]
+        ],
+    )
+
+def tile(dag, count, cross_link_fraction=0.05, seed=0):
+    '''
+    Returns count copies of dag, with copy c's nodes
+    numbered after copy (c - 1)'s.
+
+    For each edge (u, v) of copy c > 0, with probability
+    cross_link_fraction, u also depends upon copy (c - 1)'s
+    v, as when one project builds against another's
+    libraries.  Edges only lead to the same or an earlier
+    copy, so the result is acyclic.
+    '''
+    compact = dag.compact()
+    node_count = len(compact.all_nodes())
+    (offsets, targets) = compact.edge_arrays()
+    rng = random.Random(seed)
+    def nodes_from(node):
+        (copy, original) = divmod(node - 1, node_count)
+        base = copy * node_count
+        to_nodes = targets[
+            offsets[original]:offsets[original + 1]
+        ]
+        cross_links = []
+        if copy:
+            cross_links = [
+                to_node + base - node_count
+                for to_node in to_nodes
+                if rng.random() < cross_link_fraction
+            ]
+        return cross_links + [
+            to_node + base
+            for to_node in to_nodes
+        ]
+    return _compact_dag(node_count * count, nodes_from)
+
+def sample_reachable(dag, node_count, seed=0):
+    '''
+    Returns a subgraph of dag with at most node_count
+    nodes (or all of dag's, if fewer).
+
+    dag's roots are visited in random order, and each is
+    taken along with every node it depends upon, directly
+    or indirectly, if they all fit.  If they don't, its
+    dependencies are visited in its place, again in random
+    order.  The subgraph thus holds every dependency of its
+    nodes, and its roots are the largest closures that fit.
+    Leaves are only taken as dependencies, so no node is
+    left without edges.
+    '''
+    compact = dag.compact()
+    all_node_count = len(compact.all_nodes())
+    if node_count >= all_node_count:
+        return compact
+    rng = random.Random(seed)
+    out_degrees = compact.out_degrees()
+    selected = bytearray(all_node_count + 1)
+    selected_count = 0
+    def shuffled(nodes):
+        nodes = list(nodes)
+        rng.shuffle(nodes)
+        # The stack is popped from the end.
+        return reversed(nodes)
+    # Nodes to visit.  A node may be pushed more than once,
+    # by several of its dependents.
+    stack = list(shuffled(compact.root_nodes()))
+    while stack and selected_count < node_count:
+        start = stack.pop()
+        if selected[start] or not out_degrees[start - 1]:
+            continue
+        budget = node_count - selected_count
+        closure = [start]
+        reached = {start}
+        # Breadth-first, giving up once the closure won't
+        # fit.
+        for node in closure:
+            for to_node in compact.nodes_from(node):
+                if not selected[to_node] \
+                        and to_node not in reached:
+                    reached.add(to_node)
+                    closure.append(to_node)
+            if len(closure) > budget:
+                break
+        if len(closure) > budget:
+            stack.extend(shuffled(compact.nodes_from(start)))
+            continue
+        for node in closure:
+            selected[node] = 1
+        selected_count += len(closure)
+    return induced_subgraph(
+        compact,
+        (
+            node
+            for node in xrange(1, all_node_count + 1)
+            if selected[node]
+        ),
+    )
+
+def transitive_reduction(dag):
+    '''
+    Returns dag without the edges (u, v) where v is also
+    reachable from u through another of u's dependencies.
+    Every node keeps the same set of (indirect)
+    dependencies.
+    '''
+    compact = dag.compact()
+    reduced_nodes_from = {}
+    for (node, _, reachable) \
+            in bss.analytics.reachability(compact):
+        reduced_nodes_from[node] = array.array('I', (
+            to_node
+            for to_node in compact.nodes_from(node)
+            if not reachable >> to_node & 1
+        ))
+    return _compact_dag(
+        len(compact.all_nodes()),
+        reduced_nodes_from.pop,
+    )
+
+def scale(dag, factor, cross_link_fraction=0.05, seed=0):
+    '''
+    Returns a DAG shaped like dag with about (at most)
+    factor times as many nodes: dag is tiled ceil(factor)
+    times (see tile), then sampled down to size (see
+    sample_reachable).
+    '''
+    if factor <= 0:
+        raise Exception(
+            'Scale factor must be positive: {}'
+            .format(factor),
+        )
+    node_count = int(round(len(dag.all_nodes()) * factor))
+    copy_count = int(math.ceil(factor))
+    if copy_count > 1:
+        dag = tile(
+            dag,
+            count=copy_count,
+            cross_link_fraction=cross_link_fraction,
+            seed=seed,
+        )
+    if node_count < len(dag.all_nodes()):
+        dag = sample_reachable(
+            dag,
+            node_count=node_count,
+            seed=seed,
+        )
+    return dag.compact()
+
+class TestTransforms(unittest.TestCase):
+    def test_tile(self):
+        dag = bss.dags.UniformFanOutDAG(depth=2, fan_out=2)
+        tiled = tile(dag, count=3, cross_link_fraction=0)
+        self.assertItemsEqual(tiled.edges(), [
+            (1, 2), (1, 3),
+            (4, 5), (4, 6),
+            (7, 8), (7, 9),
+        ])
+        tiled = tile(dag, count=3, cross_link_fraction=1)
+        self.assertItemsEqual(tiled.edges(), [
+            (1, 2), (1, 3),
+            (4, 5), (4, 6), (4, 2), (4, 3),
+            (7, 8), (7, 9), (7, 5), (7, 6),
+        ])
+        bss.dags.validate_dag(tiled)
+
+    def test_sample_reachable(self):
+        # Closures hold 121 nodes (the root), 40, 13, 4,
+        # or 1 (a leaf, never sampled alone).
+        dag = bss.dags.UniformFanOutDAG(depth=5, fan_out=3)
+        for (node_count, sample_node_count) in [
+            (1, 0),
+            (10, 8),
+            (50, 48),
+            (121, 121),
+            (1000, 121),
+        ]:
+            sample = sample_reachable(
+                dag,
+                node_count=node_count,
+                seed=node_count,
+            )
+            self.assertEqual(
+                len(sample.all_nodes()),
+                sample_node_count,
+            )
+            bss.dags.validate_dag(sample)
+            # Every node keeps all of its dependencies.
+            self.assertLessEqual(
+                set(sample.out_degrees()),
+                {0, 3},
+            )
+            # No node is isolated.
+            self.assertNotIn(
+                (0, 0),
+                zip(sample.out_degrees(), sample.in_degrees()),
+            )
+
+    def test_transitive_reduction(self):
+        # 1 -> 2 -> 3 -> 4, plus shortcuts 1 -> 3, 1 -> 4,
+        # and 2 -> 4, all implied by the chain.
+        dag = _compact_dag(4, {
+            1: [2, 3, 4],
+            2: [3, 4],
+            3: [4],
+            4: [],
+        }.get)
+        self.assertEqual(
+            transitive_reduction(dag),
+            bss.dags.LinearDAG(4),
+        )
+        grid = bss.dags.GridDAG(rows=3, columns=3)
+        self.assertEqual(transitive_reduction(grid), grid)
+
+    def test_scale(self):
+        dag = bss.dags.UniformFanOutDAG(depth=4, fan_out=2)
+        # Sampling stops short of sizes no closure fills.
+        for (factor, node_count) in [
+            (0.5, 7),
+            (1, 15),
+            (2, 30),
+            (2.5, 37),
+        ]:
+            scaled = scale(dag, factor=factor)
+            self.assertEqual(
+                len(scaled.all_nodes()),
+                node_count,
+            )
+            bss.dags.validate_dag(scaled)
+
+if __name__ == '__main__':
+    unittest.main()
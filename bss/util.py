@@ -1,5 +1,12 @@
+import collections
 import contextlib
+import errno
+import hashlib
+import json
 import logging
+import math
+import multiprocessing
+import os
 import platform
 import re
 import shutil
@@ -14,7 +21,7 @@ logger.addHandler(logging.StreamHandler(sys.stderr))
 
 get_time = timeit.default_timer
 
-def temp_file_system_stamp_resolution():
+def worst_case_stamp_resolution():
     resolutions = []
     if sys.platform == 'darwin':
         # HGFS+ mtime resolution.
@@ -29,12 +36,215 @@ def temp_file_system_stamp_resolution():
         resolutions.append(2)
         # NTFS mtime resolution.
         resolutions.append(100 * (10 ** -9))
-    # System clock resolution.
-    resolutions.append(0.02)
     return max(resolutions)
 
+# System clock resolution.
+_clock_resolution = 0.02
+
+# Candidate mtime resolutions, finest first.  Python 2's
+# os.utime cannot set times more precisely than 1 us.
+_stamp_resolutions = [10 ** -6, 10 ** -3, 0.01, 0.1, 1, 2]
+
+def probe_stamp_resolution(directory):
+    '''
+    Returns the mtime resolution of the file system holding
+    directory, found by setting and reading back stamps.
+    '''
+    (fd, path) = tempfile.mkstemp(dir=directory)
+    os.close(fd)
+    try:
+        resolution = _stamp_resolutions[0]
+        for stamp in [
+            1234567891.123457,
+            1234567893.987653,
+            1234567895.500001,
+        ]:
+            os.utime(path, (stamp, stamp))
+            error = abs(os.stat(path).st_mtime - stamp)
+            for candidate in _stamp_resolutions:
+                # Allow for floating point error.
+                if error < candidate * 0.999:
+                    resolution = max(resolution, candidate)
+                    break
+            else:
+                return None
+        return resolution
+    finally:
+        os.remove(path)
+
+_temp_file_system_stamp_resolution = None
+
+def temp_file_system_stamp_resolution():
+    '''
+    Returns the mtime resolution of the file system holding
+    temporary directories, probing it the first time.
+    '''
+    global _temp_file_system_stamp_resolution
+    if _temp_file_system_stamp_resolution is None:
+        resolution = None
+        try:
+            resolution = probe_stamp_resolution(
+                tempfile.gettempdir(),
+            )
+        except (IOError, OSError):
+            pass
+        if resolution is None:
+            logger.warn(
+                'Could not probe file system stamp '
+                'resolution; assuming the worst',
+            )
+            resolution = worst_case_stamp_resolution()
+        _temp_file_system_stamp_resolution = resolution
+    return _temp_file_system_stamp_resolution
+
+# How long to watch files' mtimes when probing how far they
+# trail the clock, in seconds.  Kernels stamp files with a
+# clock that advances once per tick, at least 100 times a
+# second.
+_clock_lag_probe_time = 0.05
+
+def probe_stamp_clock_lag(directory):
+    '''
+    Returns how far the mtimes of files written in
+    directory may trail time.time(), found by writing a
+    file repeatedly and reading back its mtime.
+    '''
+    (fd, path) = tempfile.mkstemp(dir=directory)
+    os.close(fd)
+    try:
+        lag = 0
+        start = time.time()
+        while time.time() - start < _clock_lag_probe_time:
+            now = time.time()
+            with open(path, 'wb') as f:
+                f.write('stamp')
+            lag = max(lag, now - os.stat(path).st_mtime)
+        return lag
+    finally:
+        os.remove(path)
+
+_temp_file_system_stamp_lag = None
+
+def temp_file_system_stamp_lag():
+    '''
+    Returns how far the mtimes of files written in
+    temporary directories may trail time.time(), probing
+    it the first time.
+    '''
+    global _temp_file_system_stamp_lag
+    if _temp_file_system_stamp_lag is None:
+        try:
+            lag = probe_stamp_clock_lag(tempfile.gettempdir())
+        except (IOError, OSError):
+            logger.warn(
+                'Could not probe file system clock lag; '
+                'assuming one clock tick',
+            )
+            lag = _clock_resolution
+        _temp_file_system_stamp_lag = lag
+    return _temp_file_system_stamp_lag
+
+# Explicit stamps are set in the past, since the mtimes of
+# files written after them may trail the clock (see
+# set_stamp), so files written just before them must first
+# age by the clock lag and one stamp resolution.  Only use
+# them if the resolution makes that wait short.
+_max_explicit_stamp_resolution = 10 ** -3
+
+def can_set_stamps():
+    '''
+    Returns True if set_stamp can guarantee newer stamps
+    with at most a short wait.
+    '''
+    return temp_file_system_stamp_resolution() \
+        <= _max_explicit_stamp_resolution
+
+_last_stamp = 0
+
+def set_stamp(path):
+    '''
+    Sets path's mtime to a stamp strictly newer than the
+    mtime of any file written before the last
+    wait_for_temp_file_system_stamp_update, and no newer
+    than the mtime of any file written after this call.
+
+    Only valid if can_set_stamps().
+    '''
+    global _last_stamp
+    resolution = temp_file_system_stamp_resolution()
+    # Files written next are stamped by a clock that may
+    # trail time.time(), so stamp path that far in the past.
+    stamp = math.floor(
+        (time.time() - temp_file_system_stamp_lag())
+        / resolution,
+    ) * resolution
+    stamp = max(stamp, _last_stamp)
+    _last_stamp = stamp
+    os.utime(path, (stamp, stamp))
+
 def wait_for_temp_file_system_stamp_update():
-    time.sleep(temp_file_system_stamp_resolution())
+    if can_set_stamps():
+        # Files are dirtied with set_stamp, so only wait
+        # until files written so far are older than its
+        # stamps.
+        time.sleep(
+            temp_file_system_stamp_lag()
+            + 2 * temp_file_system_stamp_resolution(),
+        )
+        return
+    time.sleep(max(
+        temp_file_system_stamp_resolution(),
+        _clock_resolution,
+    ))
+
+ResourceUsage = collections.namedtuple('ResourceUsage', [
+    'block_inputs',
+    'block_outputs',
+    'involuntary_context_switches',
+    'major_page_faults',
+    'max_rss',
+    'minor_page_faults',
+    'system_time',
+    'user_time',
+    'voluntary_context_switches',
+])
+
+def check_call_with_resource_usage(command, cwd=None):
+    '''
+    Like subprocess.check_call, but returns the
+    ResourceUsage of the command and every descendant
+    process it waited for.  max_rss is in bytes.
+    '''
+    process = subprocess.Popen(command, cwd=cwd)
+    while True:
+        try:
+            (_, status, rusage) = os.wait4(process.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode,
+            command,
+        )
+    # Linux reports ru_maxrss in KiB; OS X in bytes.
+    max_rss_scale = 1 if sys.platform == 'darwin' else 1024
+    return ResourceUsage(
+        block_inputs=rusage.ru_inblock,
+        block_outputs=rusage.ru_oublock,
+        involuntary_context_switches=rusage.ru_nivcsw,
+        major_page_faults=rusage.ru_majflt,
+        max_rss=rusage.ru_maxrss * max_rss_scale,
+        minor_page_faults=rusage.ru_minflt,
+        system_time=rusage.ru_stime,
+        user_time=rusage.ru_utime,
+        voluntary_context_switches=rusage.ru_nvcsw,
+    )
 
 @contextlib.contextmanager
 def temporary_directory():
@@ -42,6 +252,105 @@ def temporary_directory():
     yield temp_dir
     shutil.rmtree(temp_dir)
 
+def clone_tree(
+    source_dir,
+    destination_dir,
+    preserve_times=False,
+):
+    '''
+    Copies the contents of source_dir into the existing
+    destination_dir, sharing storage (reflinks) where the
+    file system supports it.
+
+    If preserve_times, copies keep the exact modification
+    times of the originals, or an Exception is raised.
+    '''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([
+                'cp',
+                '-R',
+                '--reflink=auto',
+            ] + (
+                ['--preserve=timestamps']
+                if preserve_times
+                else []
+            ) + [
+                os.path.join(source_dir, '.'),
+                destination_dir,
+            ], stderr=devnull)
+        return
+    except (OSError, subprocess.CalledProcessError):
+        # Not GNU cp.
+        pass
+    if preserve_times:
+        # Python 2 can only set stamps from floats, which
+        # lose precision, so leave copying them to cp.
+        try:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call([
+                    'cp',
+                    '-R',
+                    '-p',
+                    os.path.join(source_dir, '.'),
+                    destination_dir,
+                ], stderr=devnull)
+            return
+        except (OSError, subprocess.CalledProcessError):
+            raise Exception(
+                'Could not copy {} with exact modification '
+                'times'.format(source_dir),
+            )
+    # Fall back to a plain copy.
+    for (dir_path, dir_names, file_names) \
+            in os.walk(source_dir):
+        relative_dir = os.path.relpath(dir_path, source_dir)
+        output_dir = os.path.normpath(
+            os.path.join(destination_dir, relative_dir),
+        )
+        for dir_name in dir_names:
+            path = os.path.join(output_dir, dir_name)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        for file_name in file_names:
+            shutil.copyfile(
+                os.path.join(dir_path, file_name),
+                os.path.join(output_dir, file_name),
+            )
+
+def link_tree(source_dir, destination_dir):
+    '''
+    Hard-links the files in source_dir into the existing
+    destination_dir, copying where linking fails.  The
+    linked files must not be modified.
+    '''
+    for (dir_path, dir_names, file_names) \
+            in os.walk(source_dir):
+        relative_dir = os.path.relpath(dir_path, source_dir)
+        output_dir = os.path.normpath(
+            os.path.join(destination_dir, relative_dir),
+        )
+        for dir_name in dir_names:
+            path = os.path.join(output_dir, dir_name)
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        for file_name in file_names:
+            source_path = os.path.join(dir_path, file_name)
+            output_path = os.path.join(output_dir, file_name)
+            try:
+                os.link(source_path, output_path)
+            except OSError:
+                shutil.copy2(source_path, output_path)
+
+def directory_size(path):
+    size = 0
+    for (dir_path, _, file_names) in os.walk(path):
+        for file_name in file_names:
+            size += os.lstat(
+                os.path.join(dir_path, file_name),
+            ).st_size
+    return size
+
 def processors_info():
     # Code borrowed from @dbw:
     # http://stackoverflow.com/a/13078519
@@ -71,3 +380,113 @@ def processors_info():
             'unknown platform',
         )
         return []
+
+def machine_information():
+    '''
+    Returns a JSON-serializable description of this machine.
+    '''
+    (sysname, nodename, release, version, machine) \
+        = os.uname()
+    return {
+        'node': nodename,
+        'processors': processors_info(),
+        'uname': [sysname, release, version, machine],
+    }
+
+def machine_fingerprint(information):
+    '''
+    Returns a string identifying the machine described by
+    information (see machine_information).
+    '''
+    return hashlib.sha1(json.dumps(
+        information,
+        sort_keys=True,
+    )).hexdigest()
+
+def available_processors():
+    '''
+    Returns the processor numbers this process may be
+    scheduled on.
+    '''
+    if platform.system() == 'Linux':
+        with file('/proc/self/status', 'r') as status:
+            for line in status:
+                (name, _, value) = line.partition(':')
+                if name == 'Cpus_allowed_list':
+                    return parse_processor_list(value)
+    return range(multiprocessing.cpu_count())
+
+def parse_processor_list(string):
+    '''
+    Parses a Linux CPU list (e.g. '0-3,8,10-11') into a
+    list of processor numbers.
+    '''
+    processors = []
+    for part in string.strip().split(','):
+        if not part:
+            continue
+        (first, _, last) = part.partition('-')
+        processors.extend(xrange(
+            int(first),
+            int(last or first) + 1,
+        ))
+    return processors
+
+def partition_processors(
+    processors,
+    partition_count,
+    reserved_count=0,
+):
+    '''
+    Splits processors into reserved processors and
+    partition_count disjoint, equally-sized partitions.
+
+    Returns (reserved_processors, partitions).
+    '''
+    processors = sorted(processors)
+    if partition_count < 1:
+        raise Exception('Need at least one partition')
+    if reserved_count < 0:
+        raise Exception(
+            'Reserved processor count must be non-negative',
+        )
+    reserved_processors = processors[:reserved_count]
+    processors = processors[reserved_count:]
+    partition_size = len(processors) // partition_count
+    if partition_size < 1:
+        raise Exception((
+            'Cannot split {} processors into {} partitions '
+            'with {} reserved'
+        ).format(
+            len(processors) + len(reserved_processors),
+            partition_count,
+            reserved_count,
+        ))
+    partitions = [
+        processors[i * partition_size
+            :(i + 1) * partition_size]
+        for i in xrange(partition_count)
+    ]
+    return (reserved_processors, partitions)
+
+def set_processor_affinity(processors, pid=None):
+    '''
+    Restricts a process (by default, the current process)
+    and its future children to the given processors.
+    '''
+    if pid is None:
+        pid = os.getpid()
+    if platform.system() != 'Linux':
+        logger.warn(
+            'Could not set processor affinity; '
+            'unknown platform',
+        )
+        return
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([
+            'taskset',
+            '--pid',
+            '--cpu-list',
+            ','.join(map(str, processors)),
+            str(pid),
+        ], stdout=devnull)
@@ -0,0 +1,346 @@
+'''
+Creation of the workspaces builds are measured in.
+
+A fresh workspace holds a builder's manifests and every
+leaf node of a DAG.  Generating these is untimed but
+expensive for large DAGs, so generated workspaces are kept
+as templates in a content-addressed store and cloned for
+each measurement.
+'''
+
+import bss.manifests
+import bss.nodelayouts
+import bss.setups
+import bss.util
+import contextlib
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler(sys.stderr))
+
+def default_template_dir():
+    # Keep templates on the same file system as temporary
+    # workspaces so they can be reflinked or hard-linked.
+    return os.path.join(
+        tempfile.gettempdir(),
+        'bss-workspace-templates',
+    )
+
+def create_workspace(
+    temp_dir,
+    builder,
+    dag,
+    names,
+    args,
+    manifest_layout=bss.manifests.single_file_layout,
+    node_layout=bss.nodelayouts.flat_node_layout,
+):
+    '''
+    Writes a fresh workspace without using templates.
+    names are dag's node names under node_layout (see
+    bss.nodelayouts.node_names).
+    '''
+    builder.set_up(
+        args=args,
+        dag=dag,
+        manifest_layout=manifest_layout,
+        names=names,
+        temp_dir=temp_dir,
+    )
+    bss.nodelayouts.create_directories(temp_dir, node_layout)
+    bss.setups.create_leaf_nodes(
+        dag=dag,
+        names=names,
+        temp_dir=temp_dir,
+    )
+
+def create_built_workspace(
+    temp_dir,
+    builder,
+    dag,
+    names,
+    args,
+    manifest_layout=bss.manifests.single_file_layout,
+    node_layout=bss.nodelayouts.flat_node_layout,
+):
+    '''
+    Writes a fresh workspace and builds its root nodes
+    without using templates.
+    '''
+    create_workspace(
+        args=args,
+        builder=builder,
+        dag=dag,
+        manifest_layout=manifest_layout,
+        names=names,
+        node_layout=node_layout,
+        temp_dir=temp_dir,
+    )
+    builder.build(
+        args=args,
+        names=names,
+        nodes=dag.root_nodes(),
+        temp_dir=temp_dir,
+    )
+    builder.wait_for_stamp_update()
+
+class WorkspaceTemplates(object):
+    '''
+    Store of workspace templates, keyed by builder, DAG
+    fingerprint, manifest layout, and node layout.
+
+    Each template holds two directories: 'manifests', the
+    output of builder.set_up, which builders never modify
+    and so are hard-linked into workspaces; and 'nodes', the
+    leaf nodes, which setups may modify and so are cloned
+    (reflinked where possible).
+
+    Templates of built workspaces hold a single directory,
+    'tree', which is the complete workspace after building
+    (including the builder's own state, such as .ninja_log
+    or .tup).  These are cloned with modification times
+    preserved, so every measurement starts from the same
+    built state without rebuilding.
+
+    Once the store exceeds max_size bytes, the least
+    recently used templates are removed.  Processes sharing
+    the store hold a shared flock on it while creating or
+    cloning templates, and evict only under an exclusive
+    one, so a template is never removed while in use.
+    '''
+
+    def __init__(self, directory, max_size):
+        self.__directory = directory
+        self.__max_size = max_size
+
+    def __template_dir(
+        self,
+        builder,
+        dag,
+        kind,
+        manifest_layout,
+        node_layout,
+    ):
+        return os.path.join(
+            self.__directory,
+            hashlib.sha1('\0'.join([
+                kind,
+                builder.shortname,
+                dag.fingerprint(),
+                bss.manifests.format_manifest_layout(
+                    manifest_layout,
+                ),
+                bss.nodelayouts.format_node_layout(
+                    node_layout,
+                ),
+            ])).hexdigest(),
+        )
+
+    def create_workspace(
+        self,
+        temp_dir,
+        builder,
+        dag,
+        names,
+        args,
+        manifest_layout=bss.manifests.single_file_layout,
+        node_layout=bss.nodelayouts.flat_node_layout,
+    ):
+        '''
+        Fills temp_dir with a fresh workspace, generating its
+        template first if needed.
+        '''
+        template_dir = self.__template_dir(
+            builder=builder,
+            dag=dag,
+            kind='clean',
+            manifest_layout=manifest_layout,
+            node_layout=node_layout,
+        )
+        def fill_template(staging_dir):
+            manifests_dir = os.path.join(
+                staging_dir,
+                'manifests',
+            )
+            os.mkdir(manifests_dir)
+            builder.set_up(
+                args=args,
+                dag=dag,
+                manifest_layout=manifest_layout,
+                names=names,
+                temp_dir=manifests_dir,
+            )
+            nodes_dir = os.path.join(staging_dir, 'nodes')
+            os.mkdir(nodes_dir)
+            bss.nodelayouts.create_directories(
+                nodes_dir,
+                node_layout,
+            )
+            bss.setups.create_leaf_nodes(
+                dag=dag,
+                names=names,
+                temp_dir=nodes_dir,
+            )
+        with self.__lock(fcntl.LOCK_SH):
+            self.__use_template(template_dir, fill_template)
+            bss.util.link_tree(
+                os.path.join(template_dir, 'manifests'),
+                temp_dir,
+            )
+            bss.util.clone_tree(
+                os.path.join(template_dir, 'nodes'),
+                temp_dir,
+            )
+        self.__evict(keep=template_dir)
+
+    def create_built_workspace(
+        self,
+        temp_dir,
+        builder,
+        dag,
+        names,
+        args,
+        manifest_layout=bss.manifests.single_file_layout,
+        node_layout=bss.nodelayouts.flat_node_layout,
+    ):
+        '''
+        Fills temp_dir with a workspace whose root nodes have
+        been built, building a template first if needed.
+        '''
+        template_dir = self.__template_dir(
+            builder=builder,
+            dag=dag,
+            kind='built',
+            manifest_layout=manifest_layout,
+            node_layout=node_layout,
+        )
+        def fill_template(staging_dir):
+            tree_dir = os.path.join(staging_dir, 'tree')
+            os.mkdir(tree_dir)
+            self.create_workspace(
+                args=args,
+                builder=builder,
+                dag=dag,
+                manifest_layout=manifest_layout,
+                names=names,
+                node_layout=node_layout,
+                temp_dir=tree_dir,
+            )
+            builder.build(
+                args=args,
+                names=names,
+                nodes=dag.root_nodes(),
+                temp_dir=tree_dir,
+            )
+            builder.wait_for_stamp_update()
+        with self.__lock(fcntl.LOCK_SH):
+            self.__use_template(template_dir, fill_template)
+            bss.util.clone_tree(
+                os.path.join(template_dir, 'tree'),
+                temp_dir,
+                preserve_times=True,
+            )
+        self.__evict(keep=template_dir)
+
+    @contextlib.contextmanager
+    def __lock(self, operation):
+        '''
+        Holds an flock of the store with operation, yielding
+        False instead if operation includes fcntl.LOCK_NB
+        and another process holds a conflicting lock.
+        '''
+        try:
+            os.makedirs(self.__directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Eviction skips names starting with '.'.
+        with open(
+            os.path.join(self.__directory, '.lock'),
+            'a',
+        ) as lock_file:
+            try:
+                fcntl.flock(lock_file, operation)
+            except IOError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                yield False
+                return
+            yield True
+
+    def __use_template(self, template_dir, fill_template):
+        if not os.path.isdir(template_dir):
+            self.__create_template(
+                template_dir=template_dir,
+                fill_template=fill_template,
+            )
+        # Mark the template as recently used.
+        os.utime(template_dir, None)
+
+    def __create_template(self, template_dir, fill_template):
+        staging_dir = tempfile.mkdtemp(
+            dir=self.__directory,
+            prefix='.tmp',
+        )
+        try:
+            fill_template(staging_dir)
+            with open(
+                os.path.join(staging_dir, 'size'),
+                'w',
+            ) as size_file:
+                size_file.write('{}\n'.format(
+                    bss.util.directory_size(staging_dir),
+                ))
+            try:
+                os.rename(staging_dir, template_dir)
+            except OSError:
+                # Another process created the template
+                # first.
+                if not os.path.isdir(template_dir):
+                    raise
+        finally:
+            if os.path.isdir(staging_dir):
+                shutil.rmtree(staging_dir)
+
+    def __evict(self, keep):
+        with self.__lock(fcntl.LOCK_EX | fcntl.LOCK_NB) \
+                as locked:
+            if locked:
+                self.__evict_unused(keep)
+            # Otherwise templates are in use, and a later
+            # eviction will catch up.
+
+    def __evict_unused(self, keep):
+        templates = []
+        for name in os.listdir(self.__directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.__directory, name)
+            try:
+                last_used = os.stat(path).st_mtime
+                with open(
+                    os.path.join(path, 'size'),
+                    'r',
+                ) as size_file:
+                    size = int(size_file.read())
+            except (IOError, OSError):
+                # Not a template.
+                continue
+            templates.append((last_used, size, path))
+        total_size = sum(size for (_, size, _) in templates)
+        for (_, size, path) in sorted(templates):
+            if total_size <= self.__max_size:
+                break
+            if path == keep:
+                continue
+            logger.info('Evicting workspace template {}'
+                .format(path))
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size